@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from task.task_manager import TaskManager
+from notes.note import NoteManager
+from contacts.contact import ContactManager
+from finance.finance_manager import FinanceManager
+from benchmarks.datasets import SIZES, add_rows
+from storage.migrate import migrate
+from search.global_search import GlobalSearch
+from storage.query import page, encode_cursor
+
+MODULES = {
+    'tasks': (TaskManager, 'tasks', 'save_tasks', 'export_to_csv', 'import_from_csv'),
+    'notes': (NoteManager, 'notes', 'save_notes', 'export_csv', 'import_csv'),
+    'contacts': (ContactManager, 'contacts', 'save_contacts', 'export_to_csv', 'import_from_csv'),
+    'finance': (FinanceManager, 'records', 'save_records', 'export_to_csv', 'import_from_csv'),
+}
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(op, func, repeat, items=1, memory=True):
+    # func вызывается repeat раз; latency - время одного вызова,
+    # throughput - обработанных записей в секунду. Пиковая память
+    # снимается отдельным, дополнительным вызовом под tracemalloc, чтобы
+    # трассировка не искажала время.
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - started)
+        peak = None
+        if memory:
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    mean = statistics.fmean(latencies)
+    return {
+        'op': op,
+        'repeat': repeat,
+        'items': items,
+        'mean_ms': mean * 1000,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'throughput': items / mean if mean > 0 else None,
+        'peak_kb': peak / 1024 if peak is not None else None,
+    }
+
+
+def prepare(kind, size, directory, seed):
+    manager_class, attribute, save, _, _ = MODULES[kind]
+    filename = os.path.join(directory, f'{kind}.json')
+    manager = manager_class(filename)
+    manager._add_many(list(add_rows(kind, size, seed)))
+    getattr(manager, save)()
+    manager.storage.wait()
+    return filename
+
+
+def run_module(kind, size, directory, seed, repeat, memory):
+    manager_class, attribute, save, export, import_ = MODULES[kind]
+    filename = prepare(kind, size, directory, seed)
+    rng = random.Random(seed)
+    results = []
+
+    def record(op, func, count=repeat, items=1):
+        result = measure(op, func, count, items, memory)
+        result.update(module=kind, size=size)
+        results.append(result)
+        print(f"{kind:<9} {size:>8} {op:<16} p50 {result['p50_ms']:>10.3f} мс  "
+              f"p99 {result['p99_ms']:>10.3f} мс  {result['throughput'] or 0:>12.0f} зап/с", file=sys.stderr)
+
+    load_repeat = 3 if size <= 100000 else 1
+    record('load', lambda: manager_class(filename), load_repeat, size)
+    binary_filename = os.path.join(directory, f'{kind}.bin')
+    migrate(kind, filename, binary_filename)
+    record('load_binary', lambda: manager_class(binary_filename), load_repeat, size)
+    manager = manager_class(filename)
+    store = getattr(manager, attribute)
+    record('save', getattr(manager, save), load_repeat, size)
+
+    ids = list(range(1, size + 1))
+    rng.shuffle(ids)
+    edit_ids = iter(ids)
+    delete_ids = iter(reversed(ids))
+
+    if kind == 'tasks':
+        record('add', lambda: manager.add_task("Новая задача", "описание", "Средний"))
+        record('edit', lambda: manager.edit_task(next(edit_ids), new_title="Изменено"))
+        record('delete', lambda: manager.delete_task(next(delete_ids)))
+        record('index_build', lambda: setattr(manager, '_schedule', None) or manager.schedule, 1, len(store))
+        record('upcoming', lambda: manager.upcoming_tasks(10, now=1717200000))
+        record('top_priority', lambda: manager.top_priority_tasks(10))
+        record('toggle_done', lambda: manager.toggle_done(next(edit_ids)))
+    elif kind == 'notes':
+        record('add', lambda: manager.add_note("Новая заметка", "текст заметки"))
+        record('edit', lambda: manager.edit_note(next(edit_ids), new_title="Изменено"))
+        record('delete', lambda: manager.delete(next(delete_ids)))
+
+        def build_index():
+            manager._search_index = None
+            manager.search_index.journal.wait()
+        record('index_build', build_index, 1, len(store))
+        record('search', lambda: manager.search_notes(f"слово{rng.randrange(1000)}"))
+    elif kind == 'contacts':
+        record('add', lambda: manager.add_contact("Новый Контакт", "+7 900 0000000"))
+        record('edit', lambda: manager.edit_contact(next(edit_ids), name="Изменено"))
+        record('delete', lambda: manager.delete_contact(next(delete_ids)))
+        record('index_build', lambda: setattr(manager, '_search_index', None) or manager.search_index, 1, len(store))
+        record('search_contact', lambda: manager.search_contact(f"слово{rng.randrange(1000)}", limit=20))
+        record('search_phone', lambda: manager.search_contact(f"912 {rng.randrange(10000):04d}", limit=20))
+        record('find_duplicates', lambda: setattr(manager, '_duplicates', None) or manager.find_duplicates(),
+               1, len(store))
+    else:
+        record('add', lambda: manager.add_record(-100.0, "Кафе", "15-06-2024", "обед"))
+        record('list_records', lambda: manager.list_records(50, category="кафе"))
+        record('list_records_by_date', lambda: manager.list_records(50, order='date', reverse=True),
+               max(1, repeat // 10), len(store))
+        record('index_build', lambda: setattr(manager, '_timeline', None) or manager.timeline, 1, len(store))
+
+        def report():
+            start = datetime.datetime(2024, rng.randint(1, 6), 1)
+            manager.generate_report(start, start + datetime.timedelta(days=rng.randint(1, 180)))
+        record('generate_report', report)
+        record('category_report', lambda: manager.category_report(), max(1, repeat // 10), len(store))
+        record('evaluate', lambda: manager.evaluate("round(sum(amount * (amount < 0)) / count(amount), 2)",
+                                                    category="Кафе"), max(1, repeat // 10), len(store))
+
+    middle = encode_cursor([None, len(store) // 2])
+    record('list_page', lambda: page(store, 50, middle))
+
+    global_search = GlobalSearch({kind: manager})
+    record('global_search_build', lambda: global_search.search(''), 1, len(store))
+    record('global_search', lambda: global_search.search(f"слово{rng.randrange(1000)}"))
+    global_search.close()
+
+    csv_filename = os.path.join(directory, f'{kind}.csv')
+    record('export_csv', lambda: getattr(manager, export)(csv_filename), 1, len(store))
+    imported = os.path.join(directory, f'{kind}-import.json')
+
+    def import_csv():
+        for name in os.listdir(directory):
+            if name.startswith(f'{kind}-import'):
+                path = os.path.join(directory, name)
+                # рядом с хранилищем лежит каталог истории изменений
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+        target = manager_class(imported)
+        getattr(target, import_)(csv_filename)
+        target.storage.wait()
+    record('import_csv', import_csv, 1, len(store))
+    manager.storage.wait()
+    return results
+
+
+def compare(results, baseline, threshold):
+    # возвращает список регрессий: операций, ставших медленнее больше чем на threshold
+    previous = {(r['module'], r['size'], r['op']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['module'], result['size'], result['op']))
+        if old is None or not old['p50_ms']:
+            continue
+        ratio = result['p50_ms'] / old['p50_ms']
+        marker = ''
+        if ratio > 1 + threshold:
+            marker = '  <-- регрессия'
+            regressions.append(result)
+        print(f"{result['module']:<9} {result['size']:>8} {result['op']:<16} "
+              f"{old['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} мс  x{ratio:.2f}{marker}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочные тесты менеджеров на синтетических данных")
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['1k'])
+    parser.add_argument('--modules', nargs='+', choices=sorted(MODULES), default=sorted(MODULES))
+    parser.add_argument('--repeat', type=int, default=200, help="повторов для одиночных операций")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help="не измерять пиковую память")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="файл с результатами предыдущего запуска")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое замедление, доля")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size_name in args.sizes:
+        for kind in args.modules:
+            directory = tempfile.mkdtemp(prefix=f'bench-{kind}-')
+            try:
+                results.extend(run_module(kind, SIZES[size_name], directory, args.seed, args.repeat,
+                                          not args.no_memory))
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Результаты сохранены в {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import random
+
+PRIORITIES = ["Высокий", "Средний", "Низкий"]
+CATEGORIES = ["Продукты", "Транспорт", "Зарплата", "Кафе", "Связь", "Жилье"]
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+
+def _text(rng, words):
+    return ' '.join(f"слово{rng.randrange(1000)}" for _ in range(words))
+
+
+def _timestamp(rng):
+    return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+
+
+def rows(kind, count, seed=1):
+    # Воспроизводимые синтетические записи: при одном и том же seed
+    # получаются одни и те же данные. Строки создаются заново для каждой
+    # записи, как при чтении из JSON.
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        if kind == 'tasks':
+            yield dict(task_id=i, task_title=_text(rng, 3), description=_text(rng, 8),
+                       priority=''.join(rng.choice(PRIORITIES)), done=False, due_date=_timestamp(rng))
+        elif kind == 'notes':
+            yield dict(note_id=i, title=_text(rng, 3), content=_text(rng, 20), date=_timestamp(rng))
+        elif kind == 'contacts':
+            yield dict(contact_id=i, name=_text(rng, 2), phone=f"+7 912 {rng.randrange(10 ** 7):07d}",
+                       email=f"user{i}@example.com")
+        else:
+            yield dict(record_id=i, amount=round(rng.uniform(-5000, 5000), 2),
+                       category=''.join(rng.choice(CATEGORIES)),
+                       date=f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-2024", description=_text(rng, 4))
+
+
+def add_rows(kind, count, seed=1):
+    # те же записи в виде аргументов для пакетного добавления (_add_many)
+    for row in rows(kind, count, seed):
+        if kind == 'tasks':
+            yield row['task_title'], row['description'], row['priority'], row['done'], row['due_date']
+        elif kind == 'notes':
+            yield row['title'], row['content']
+        elif kind == 'contacts':
+            yield row['name'], row['phone'], row['email']
+        else:
+            yield row['amount'], row['category'], row['date'], row['description']
@@ -0,0 +1,56 @@
+import argparse
+import gc
+import tracemalloc
+
+from task.task_manager import Tasks
+from notes.note import Notes
+from contacts.contact import Contact
+from finance.finance_manager import FinanceRecord
+from benchmarks.datasets import rows
+
+
+class _Record:
+    # прежнее представление: обычный объект со словарем атрибутов
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def _build_new(kind, row):
+    if kind == 'tasks':
+        return Tasks(row['task_id'], row['task_title'], row['description'], row['priority'], row['done'], row['due_date'])
+    if kind == 'notes':
+        return Notes(row['title'], row['content'], row['note_id'], row['date'])
+    if kind == 'contacts':
+        return Contact(**row)
+    return FinanceRecord(**row)
+
+
+def measure(kind, count, compact):
+    # учитывается все, что остается в памяти после загрузки: объекты,
+    # их атрибуты и строки, но не промежуточные словари из JSON
+    gc.collect()
+    tracemalloc.start()
+    if compact:
+        records = [_build_new(kind, row) for row in rows(kind, count)]
+    else:
+        records = [_Record(**row) for row in rows(kind, count)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на одну запись: прежние объекты против компактных")
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+    print(f"{'модуль':<10} {'было, Б':>10} {'стало, Б':>10} {'экономия':>9}")
+    for kind in ('tasks', 'notes', 'contacts', 'finance'):
+        old = measure(kind, args.count, compact=False)
+        new = measure(kind, args.count, compact=True)
+        print(f"{kind:<10} {old:>10.0f} {new:>10.0f} {1 - new / old:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
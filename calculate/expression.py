@@ -0,0 +1,261 @@
+import ast
+import math
+import operator
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_POWER = 1000
+# предел размера целого результата степени, бит (около 30 000 десятичных цифр)
+MAX_POWER_BITS = 100000
+
+
+class Vector(list):
+    # Столбец значений без NumPy: арифметика и сравнения поэлементные, со
+    # скаляром - как с таким же значением в каждой строке.
+    def _map(self, other, func):
+        if isinstance(other, list):
+            if len(other) != len(self):
+                raise ValueError("столбцы разной длины")
+            return Vector(map(func, self, other))
+        return Vector(func(value, other) for value in self)
+
+    def _rmap(self, other, func):
+        return Vector(func(other, value) for value in self)
+
+    __add__ = lambda self, other: self._map(other, operator.add)
+    __sub__ = lambda self, other: self._map(other, operator.sub)
+    __mul__ = lambda self, other: self._map(other, operator.mul)
+    __truediv__ = lambda self, other: self._map(other, operator.truediv)
+    __floordiv__ = lambda self, other: self._map(other, operator.floordiv)
+    __mod__ = lambda self, other: self._map(other, operator.mod)
+    __pow__ = lambda self, other: self._map(other, operator.pow)
+    __radd__ = lambda self, other: self._rmap(other, operator.add)
+    __rsub__ = lambda self, other: self._rmap(other, operator.sub)
+    __rmul__ = lambda self, other: self._rmap(other, operator.mul)
+    __rtruediv__ = lambda self, other: self._rmap(other, operator.truediv)
+    __rfloordiv__ = lambda self, other: self._rmap(other, operator.floordiv)
+    __rmod__ = lambda self, other: self._rmap(other, operator.mod)
+    __rpow__ = lambda self, other: self._rmap(other, operator.pow)
+    __lt__ = lambda self, other: self._map(other, operator.lt)
+    __le__ = lambda self, other: self._map(other, operator.le)
+    __gt__ = lambda self, other: self._map(other, operator.gt)
+    __ge__ = lambda self, other: self._map(other, operator.ge)
+    __eq__ = lambda self, other: self._map(other, operator.eq)
+    __ne__ = lambda self, other: self._map(other, operator.ne)
+    __hash__ = None
+
+    def __neg__(self):
+        return Vector(-value for value in self)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Vector(abs(value) for value in self)
+
+
+def _is_column(value):
+    return isinstance(value, list) or (np is not None and isinstance(value, np.ndarray))
+
+
+def _elementwise(scalar_func, numpy_func):
+    def func(value, *args):
+        if np is not None and isinstance(value, np.ndarray):
+            return numpy_func(value, *args)
+        if isinstance(value, list):
+            return Vector(scalar_func(item, *args) for item in value)
+        return scalar_func(value, *args)
+    return func
+
+
+def _sum(value):
+    if np is not None and isinstance(value, np.ndarray):
+        return value.sum()
+    return sum(value) if isinstance(value, list) else value
+
+
+def _avg(value):
+    if np is not None and isinstance(value, np.ndarray):
+        if not value.size:
+            raise ValueError("нет значений для вычисления")
+        return value.mean()
+    if isinstance(value, list):
+        if not value:
+            raise ValueError("нет значений для вычисления")
+        return sum(value) / len(value)
+    return value
+
+
+def _count(value):
+    if np is not None and isinstance(value, np.ndarray):
+        return int(value.size)
+    return len(value) if isinstance(value, list) else 1
+
+
+def _extremum(python_func, numpy_func):
+    def func(*values):
+        if len(values) > 1:
+            if any(_is_column(value) for value in values) and np is not None:
+                return numpy_func.reduce(np.broadcast_arrays(*values))
+            if any(_is_column(value) for value in values):
+                length = max(len(value) for value in values if _is_column(value))
+                rows = [value if _is_column(value) else [value] * length for value in values]
+                return Vector(map(lambda *row: python_func(row), *rows))
+            return python_func(values)
+        value, = values
+        if _is_column(value):
+            if not len(value):
+                raise ValueError("нет значений для вычисления")
+            return numpy_func.reduce(value) if np is not None and isinstance(value, np.ndarray) else python_func(value)
+        return value
+    return func
+
+
+def _power(base, exponent):
+    # защита от выражений вроде 9**9**9, которые считались бы часами
+    exponents = exponent if _is_column(exponent) else [exponent]
+    if any(abs(value) > MAX_POWER for value in exponents):
+        raise ValueError(f"показатель степени больше {MAX_POWER}")
+    # ((10**1000)**1000)**10: показатели небольшие, но результат огромный;
+    # его размер оценивается до возведения в степень
+    # (в массивах NumPy числа фиксированной ширины, им это не грозит)
+    if isinstance(base, int) or isinstance(base, list):
+        bases = base if isinstance(base, list) else [base] * len(exponents)
+        if len(exponents) == 1:
+            exponents = list(exponents) * len(bases)
+        for value, power in zip(bases, exponents):
+            if isinstance(value, int) and power > 0 \
+                    and abs(value).bit_length() * power > MAX_POWER_BITS:
+                raise ValueError(f"результат степени больше {MAX_POWER_BITS} бит")
+    return base ** exponent
+
+
+FUNCTIONS = {
+    'sum': _sum,
+    'avg': _avg,
+    'count': _count,
+    'min': _extremum(min, np.minimum if np is not None else None),
+    'max': _extremum(max, np.maximum if np is not None else None),
+    'abs': _elementwise(abs, np.abs if np is not None else None),
+    'round': _elementwise(round, np.round if np is not None else None),
+    'sqrt': _elementwise(math.sqrt, np.sqrt if np is not None else None),
+}
+
+_BINARY = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_UNARY = (ast.UAdd, ast.USub)
+_COMPARE = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+
+class _Checker(ast.NodeTransformer):
+    # Пропускает только числа, переменные, арифметику, одиночные сравнения и
+    # вызовы функций из FUNCTIONS; ** заменяется вызовом _power.
+    def __init__(self):
+        self.names = set()
+
+    def generic_visit(self, node):
+        raise ValueError(f"недопустимая конструкция: {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float):
+            raise ValueError(f"недопустимое значение: {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        if node.id in FUNCTIONS or node.id.startswith('_'):
+            raise ValueError(f"недопустимое имя переменной: {node.id}")
+        self.names.add(node.id)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, _BINARY):
+            raise ValueError(f"недопустимая операция: {type(node.op).__name__}")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if isinstance(node.op, ast.Pow):
+            return ast.copy_location(ast.Call(ast.Name('_power', ast.Load()), [node.left, node.right], []), node)
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, _UNARY):
+            raise ValueError(f"недопустимая операция: {type(node.op).__name__}")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        if len(node.ops) != 1 or not isinstance(node.ops[0], _COMPARE):
+            raise ValueError("допустимо только одно сравнение: <, <=, >, >=, ==, !=")
+        node.left = self.visit(node.left)
+        node.comparators = [self.visit(node.comparators[0])]
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise ValueError(f"неизвестная функция: {ast.unparse(node.func)}")
+        if node.keywords:
+            raise ValueError("именованные аргументы не поддерживаются")
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+class Expression:
+    # Выражение, разобранное и скомпилированное в байткод один раз.
+    # Переменными могут быть числа или столбцы (списки, массивы NumPy):
+    # тогда выражение вычисляется сразу для всех строк, а sum/avg/min/max/
+    # count сворачивают столбец в число.
+    def __init__(self, text):
+        self.text = text
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"синтаксическая ошибка в выражении: {e.msg}") from e
+        checker = _Checker()
+        tree = ast.fix_missing_locations(checker.visit(tree))
+        self.names = frozenset(checker.names)
+        self.code = compile(tree, '<выражение>', 'eval')
+
+    def __repr__(self):
+        return f"Expression({self.text!r})"
+
+    def evaluate(self, variables=None):
+        variables = dict(variables or {})
+        missing = self.names - variables.keys()
+        if missing:
+            raise ValueError(f"неизвестная переменная: {', '.join(sorted(missing))}")
+        namespace = {'__builtins__': {}, '_power': _power, **FUNCTIONS}
+        for name in self.names:
+            value = variables[name]
+            if isinstance(value, list) and not isinstance(value, Vector):
+                value = Vector(value)
+            namespace[name] = value
+        try:
+            if np is not None:
+                with np.errstate(divide='raise', invalid='raise', over='raise'):
+                    result = eval(self.code, namespace)
+            else:
+                result = eval(self.code, namespace)
+        except ZeroDivisionError as e:
+            raise ValueError("деление на ноль") from e
+        except (ArithmeticError, TypeError) as e:
+            raise ValueError(f"ошибка вычисления: {e}") from e
+        if np is not None and isinstance(result, (np.ndarray, np.generic)):
+            return result.tolist()
+        if isinstance(result, Vector):
+            return list(result)
+        return result
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text):
+    return Expression(text)
+
+
+def evaluate(text, variables=None):
+    return compile_expression(text).evaluate(variables)
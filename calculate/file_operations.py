@@ -1,3 +1,22 @@
+import re
+
+from calculate.expression import FUNCTIONS, evaluate
+
+ASSIGNMENT = re.compile(r'^\s*([^\W\d]\w*)\s*=(?!=)(.*)$')
+
+
+def calculate_expression(text, variables):
+    # "имя = выражение" сохраняет результат в переменную для следующих выражений
+    match = ASSIGNMENT.match(text)
+    if match:
+        name, text = match.groups()
+        if name in FUNCTIONS or name.startswith('_'):
+            raise ValueError(f"недопустимое имя переменной: {name}")
+        variables[name] = evaluate(text, variables)
+        return name, variables[name]
+    return None, evaluate(text, variables)
+
+
 def calculator():
     print("Добро пожаловать в калькулятор!")
     print("Выберите операцию:")
@@ -5,14 +24,27 @@ def calculator():
     print("2. Вычитание")
     print("3. Умножение")
     print("4. Деление")
-    
+    print("5. Вычислить выражение")
+    variables = {}
+
     while True:
-        choice = input("Введите номер операции (1/2/3/4) или '0' для выхода: ")
+        choice = input("Введите номер операции (1/2/3/4/5) или '0' для выхода: ")
 
         if choice == '0':
             print("Выход из программы.")
             break
         
+        if choice == '5':
+            print("Пример: x = 2 ** 10, затем round(sqrt(x) / 3, 2). Функции: sum, avg, min, max, count, round, abs, sqrt.")
+            text = input("Введите выражение: ")
+            try:
+                name, result = calculate_expression(text, variables)
+            except ValueError as e:
+                print(f"Ошибка: {e}")
+            else:
+                print(f"{name} = {result}" if name else f"{text.strip()} = {result}")
+            continue
+
         if choice in ['1', '2', '3', '4']:
             try:
                 num1 = float(input("Введите первое число: "))
@@ -33,4 +65,4 @@ def calculator():
             except ValueError as e:
                 print(f"Ошибка ввода: {e}")
         else:
-            print("Некорректный ввод. Пожалуйста, выберите номер операции от 1 до 4.")
\ No newline at end of file
+            print("Некорректный ввод. Пожалуйста, выберите номер операции от 1 до 5.")
\ No newline at end of file
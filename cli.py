@@ -0,0 +1,517 @@
+import argparse
+import contextlib
+import json
+import sys
+from datetime import datetime
+
+from task.task_manager import TaskManager, TASK_ORDERS
+from notes.note import NoteManager, NOTE_ORDERS
+from contacts.contact import ContactManager, CONTACT_ORDERS
+from finance.finance_manager import FinanceManager, FINANCE_ORDERS
+from storage import metrics
+from storage.csvio import ProgressPrinter
+from search.global_search import GlobalSearch
+
+MANAGERS = {
+    'tasks': TaskManager,
+    'notes': NoteManager,
+    'contacts': ContactManager,
+    'finance': FinanceManager,
+}
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%d-%m-%Y") if value else None
+
+
+def tasks_add(manager, args):
+    return manager.add_task(args['title'], args.get('description') or '', args.get('priority') or 'Средний',
+                            bool(args.get('done')), args.get('due'))
+
+
+def _paged(args):
+    # постранично, если задан размер страницы, курсор или сортировка
+    return any(args.get(name) for name in ('limit', 'cursor', 'order'))
+
+
+def _page(result):
+    items, cursor = result
+    return {'items': [item.to_dict() for item in items], 'cursor': cursor}
+
+
+def tasks_list(manager, args):
+    if _paged(args):
+        return _page(manager.list_tasks(args.get('limit') or 20, args.get('cursor'), args.get('order')))
+    return [task.to_dict() for task in manager.tasks]
+
+
+def tasks_show(manager, args):
+    task = manager.tasks.get(args['id'])
+    return task.to_dict() if task else None
+
+
+def tasks_edit(manager, args):
+    if args['id'] not in manager.tasks:
+        return False
+    manager.edit_task(args['id'], args.get('title'), args.get('description'), args.get('priority'), args.get('due'))
+    return True
+
+
+def tasks_delete(manager, args):
+    if args['id'] not in manager.tasks:
+        return False
+    manager.delete_task(args['id'])
+    return True
+
+
+def tasks_done(manager, args):
+    return manager.set_done(args['id'], not args.get('undone'))
+
+
+def tasks_upcoming(manager, args):
+    return [task.to_dict() for task in manager.upcoming_tasks(args.get('limit') or 10)]
+
+
+def tasks_overdue(manager, args):
+    return [task.to_dict() for task in manager.overdue_tasks(args.get('limit'))]
+
+
+def tasks_top(manager, args):
+    return [task.to_dict() for task in manager.top_priority_tasks(args.get('limit') or 10)]
+
+
+def notes_add(manager, args):
+    return manager.add_note(args['title'], args.get('content') or '')
+
+
+def notes_list(manager, args):
+    if _paged(args):
+        return _page(manager.list_notes(args.get('limit') or 20, args.get('cursor'), args.get('order'),
+                                        args.get('reverse', False)))
+    return [note.to_dict() for note in manager.notes]
+
+
+def notes_show(manager, args):
+    note = manager.notes.get(args['id'])
+    return note.to_dict() if note else None
+
+
+def notes_edit(manager, args):
+    if args['id'] not in manager.notes:
+        return False
+    manager.edit_note(args['id'], args.get('title'), args.get('content'))
+    return True
+
+
+def notes_delete(manager, args):
+    if args['id'] not in manager.notes:
+        return False
+    manager.delete(args['id'])
+    return True
+
+
+def notes_search(manager, args):
+    return [dict(note.to_dict(), score=round(score, 4))
+            for note, score in manager.search_notes(args['query'], args.get('limit') or 10)]
+
+
+def contacts_add(manager, args):
+    return manager.add_contact(args['name'], args.get('phone'), args.get('email'))
+
+
+def contacts_list(manager, args):
+    if _paged(args):
+        return _page(manager.list_contacts(args.get('limit') or 20, args.get('cursor'), args.get('order')))
+    return [contact.to_dict() for contact in manager.contacts]
+
+
+def contacts_search(manager, args):
+    return [contact.to_dict() for contact in manager.search_contact(args['query'], args.get('limit'))]
+
+
+def contacts_edit(manager, args):
+    return manager.edit_contact(args['id'], args.get('name'), args.get('phone'), args.get('email'))
+
+
+def contacts_delete(manager, args):
+    if args['id'] not in manager.contacts:
+        return False
+    manager.delete_contact(args['id'])
+    return True
+
+
+def finance_add(manager, args):
+    return manager.add_record(float(args['amount']), args['category'], args['date'], args.get('description') or '')
+
+
+def finance_list(manager, args):
+    if _paged(args):
+        return _page(manager.list_records(args.get('limit') or 20, args.get('cursor'), args.get('category'),
+                                          args.get('date'), args.get('order'), args.get('reverse', False)))
+    return [record.to_dict() for record in manager.find_records(args.get('category'), args.get('date'))]
+
+
+def finance_categories(manager, args):
+    if args.get('category'):
+        return [{'month': month, 'count': count, 'total': total, 'min': low, 'max': high}
+                for month, count, total, low, high in manager.category_monthly_report(args['category'])]
+    return [{'category': name, 'count': count, 'total': total, 'min': low, 'max': high}
+            for name, count, total, low, high in manager.category_report(_parse_date(args.get('from')),
+                                                                         _parse_date(args.get('to')))]
+
+
+def finance_report(manager, args):
+    income, expense = manager.report_totals(_parse_date(args.get('from')), _parse_date(args.get('to')))
+    return {'income': income, 'expense': expense, 'balance': round(income + expense, 2)}
+
+
+def finance_balance(manager, args):
+    return manager.calculate_balance()
+
+
+def finance_monthly(manager, args):
+    return [{'month': month, 'income': income, 'expense': expense}
+            for month, income, expense in manager.monthly_report(_parse_date(args.get('from')),
+                                                                 _parse_date(args.get('to')))]
+
+
+def finance_calc(manager, args):
+    return manager.evaluate(args['expression'], _parse_date(args.get('from')), _parse_date(args.get('to')),
+                            args.get('category'))
+
+
+def contacts_duplicates(manager, args):
+    return [[contact.to_dict() for contact in group] for group in manager.find_duplicates(not args.get('exact'))]
+
+
+def contacts_merge(manager, args):
+    return manager.merge_contacts(args['id'], args['ids'])
+
+
+def contacts_dedupe(manager, args):
+    return {'removed': manager.dedupe(not args.get('exact'))}
+
+
+def _progress(args, label):
+    return ProgressPrinter(f"{label} {args['file']}") if args.get('progress') else None
+
+
+def _importer(method):
+    def run(manager, args):
+        progress = _progress(args, "Импорт")
+        try:
+            options = {'upsert': True} if args.get('upsert') else {}
+            count, rate = getattr(manager, method)(args['file'], workers=args.get('workers'), progress=progress,
+                                                   encoding=args.get('encoding'), **options)
+        finally:
+            if progress is not None:
+                progress.done()
+        return {'rows': count, 'rows_per_second': round(rate)}
+    return run
+
+
+def _exporter(method):
+    def run(manager, args):
+        progress = _progress(args, "Экспорт")
+        try:
+            getattr(manager, method)(args['file'], progress=progress, encoding=args.get('encoding'))
+        finally:
+            if progress is not None:
+                progress.done()
+        return args['file']
+    return run
+
+
+OPERATIONS = {
+    ('tasks', 'add'): tasks_add,
+    ('tasks', 'list'): tasks_list,
+    ('tasks', 'show'): tasks_show,
+    ('tasks', 'edit'): tasks_edit,
+    ('tasks', 'delete'): tasks_delete,
+    ('tasks', 'done'): tasks_done,
+    ('tasks', 'upcoming'): tasks_upcoming,
+    ('tasks', 'overdue'): tasks_overdue,
+    ('tasks', 'top'): tasks_top,
+    ('tasks', 'import'): _importer('import_from_csv'),
+    ('tasks', 'export'): _exporter('export_to_csv'),
+    ('notes', 'add'): notes_add,
+    ('notes', 'list'): notes_list,
+    ('notes', 'show'): notes_show,
+    ('notes', 'edit'): notes_edit,
+    ('notes', 'delete'): notes_delete,
+    ('notes', 'search'): notes_search,
+    ('notes', 'import'): _importer('import_csv'),
+    ('notes', 'export'): _exporter('export_csv'),
+    ('contacts', 'add'): contacts_add,
+    ('contacts', 'list'): contacts_list,
+    ('contacts', 'search'): contacts_search,
+    ('contacts', 'edit'): contacts_edit,
+    ('contacts', 'delete'): contacts_delete,
+    ('contacts', 'duplicates'): contacts_duplicates,
+    ('contacts', 'merge'): contacts_merge,
+    ('contacts', 'dedupe'): contacts_dedupe,
+    ('contacts', 'import'): _importer('import_from_csv'),
+    ('contacts', 'export'): _exporter('export_to_csv'),
+    ('finance', 'add'): finance_add,
+    ('finance', 'list'): finance_list,
+    ('finance', 'report'): finance_report,
+    ('finance', 'balance'): finance_balance,
+    ('finance', 'monthly'): finance_monthly,
+    ('finance', 'calc'): finance_calc,
+    ('finance', 'categories'): finance_categories,
+    ('finance', 'import'): _importer('import_from_csv'),
+    ('finance', 'export'): _exporter('export_to_csv'),
+}
+
+
+# сколько операций пакета копится в памяти перед записью на диск
+CHUNK_SIZE = 100
+
+
+class Session:
+    # Менеджеры создаются по одному на модуль и на весь запуск, а их
+    # хранилища переводятся в отложенный режим: операции пакета пишутся на
+    # диск пачками по CHUNK_SIZE и при закрытии сессии. ID новых записей
+    # резервируются на диске сразу (см. BaseStore.reserve), поэтому другие
+    # процессы, работающие с теми же файлами, их не получат.
+    def __init__(self):
+        self.managers = {}
+        self.global_search = None
+        self.stack = contextlib.ExitStack()
+        self.deferred = contextlib.ExitStack()
+        self.pending = 0
+
+    def search(self, args):
+        if self.global_search is None:
+            self.global_search = GlobalSearch({module: self.manager(module) for module in MANAGERS})
+            self.stack.callback(self.global_search.close)
+        modules = args.get('modules') or None
+        return [{'module': module, 'id': record_id, 'score': round(score, 3),
+                 'record': self.global_search.record(module, record_id).to_dict()}
+                for module, record_id, score in self.global_search.search(args['query'], args.get('limit') or 20,
+                                                                          modules)]
+
+    def manager(self, module):
+        manager = self.managers.get(module)
+        if manager is None:
+            manager = MANAGERS[module](lazy=True)
+            self.managers[module] = manager
+            self._defer(module, manager)
+        return manager
+
+    def _defer(self, module, manager):
+        self.deferred.enter_context(manager.storage.deferred())
+        if module == 'notes':
+            self.deferred.enter_context(manager.search_index.journal.deferred())
+
+    def commit(self):
+        # записать накопленные операции и продолжить в отложенном режиме
+        self.deferred.close()
+        self.pending = 0
+        for module, manager in self.managers.items():
+            self._defer(module, manager)
+
+    def run(self, module, op, args):
+        if module == 'search':
+            return self.search(args)
+        operation = OPERATIONS.get((module, op))
+        if operation is None:
+            raise ValueError(f"Неизвестная операция: {module} {op}")
+        # сообщения менеджеров уходят в stderr, в stdout - только результаты
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                return operation(self.manager(module), args)
+        finally:
+            self.pending += 1
+            if self.pending >= CHUNK_SIZE:
+                self.commit()
+
+    def close(self):
+        try:
+            self.deferred.close()
+        finally:
+            self.stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_batch(lines, out):
+    ok = failed = 0
+    with Session() as session:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                command = json.loads(line)
+                args = {key: value for key, value in command.items() if key not in ('module', 'op')}
+                result = session.run(command['module'], command['op'], args)
+            except (KeyError, TypeError, ValueError, OSError) as e:
+                failed += 1
+                out.write(json.dumps({'line': number, 'ok': False, 'error': str(e)}, ensure_ascii=False) + '\n')
+            else:
+                ok += 1
+                out.write(json.dumps({'line': number, 'ok': True, 'result': result}, ensure_ascii=False) + '\n')
+    return ok, failed
+
+
+def _add_csv_parsers(subparsers):
+    # файлы *.gz и *.zst сжимаются и распаковываются на лету; без --encoding
+    # используется кодировка системы по умолчанию
+    importer = subparsers.add_parser('import')
+    importer.add_argument('file')
+    importer.add_argument('--workers', type=int, help="число процессов для разбора строк")
+    importer.add_argument('--progress', action='store_true', help="показывать ход импорта в stderr")
+    importer.add_argument('--encoding', help="кодировка файла, например utf-8 или cp1251")
+    exporter = subparsers.add_parser('export')
+    exporter.add_argument('file')
+    exporter.add_argument('--progress', action='store_true', help="показывать ход экспорта в stderr")
+    exporter.add_argument('--encoding', help="кодировка файла, например utf-8 или cp1251")
+
+
+def _add_page_arguments(parser, orders, reverse=False):
+    # без этих параметров list, как и раньше, выводит все записи списком
+    parser.add_argument('--limit', type=int, help="размер страницы")
+    parser.add_argument('--cursor', help="курсор из предыдущей страницы")
+    parser.add_argument('--order', choices=list(orders))
+    if reverse:
+        parser.add_argument('--reverse', action='store_true', help="в обратном порядке")
+    return parser
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Персональный помощник: неинтерактивный режим")
+    parser.add_argument('--metrics', nargs='?', const='-', metavar='FILE',
+                        help="собрать метрики операций и вывести их в stderr или сохранить в FILE")
+    parser.add_argument('--profile', action='append', default=[], metavar='MASK',
+                        help="профилировать операции по маске имени, например notes.search или tasks.*")
+    parser.add_argument('--trace-memory', action='append', default=[], metavar='MASK',
+                        help="измерять пик памяти операций по маске имени")
+    modules = parser.add_subparsers(dest='module', required=True)
+
+    batch = modules.add_parser('batch', help="выполнить операции из JSON-lines в stdin")
+    batch.set_defaults(op='batch')
+
+    search = modules.add_parser('search', help="поиск по задачам, заметкам, контактам и финансам сразу")
+    search.set_defaults(op='search')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=20)
+    search.add_argument('--module', dest='modules', action='append', choices=list(MANAGERS),
+                        help="искать только в этом разделе (можно указать несколько раз)")
+
+    tasks = modules.add_parser('tasks').add_subparsers(dest='op', required=True)
+    add = tasks.add_parser('add')
+    add.add_argument('--title', required=True)
+    add.add_argument('--description', default='')
+    add.add_argument('--priority', choices=["Высокий", "Средний", "Низкий"], default="Средний")
+    add.add_argument('--done', action='store_true')
+    add.add_argument('--due', help="срок: ДД-ММ-ГГГГ [ЧЧ:ММ]")
+    _add_page_arguments(tasks.add_parser('list'), TASK_ORDERS)
+    tasks.add_parser('show').add_argument('id', type=int)
+    edit = tasks.add_parser('edit')
+    edit.add_argument('id', type=int)
+    edit.add_argument('--title')
+    edit.add_argument('--description')
+    edit.add_argument('--priority', choices=["Высокий", "Средний", "Низкий"])
+    edit.add_argument('--due', help="срок: ДД-ММ-ГГГГ [ЧЧ:ММ]")
+    tasks.add_parser('delete').add_argument('id', type=int)
+    done = tasks.add_parser('done')
+    done.add_argument('id', type=int)
+    done.add_argument('--undone', action='store_true', help="снять отметку о выполнении")
+    for name in ('upcoming', 'overdue', 'top'):
+        tasks.add_parser(name).add_argument('--limit', type=int)
+    _add_csv_parsers(tasks)
+
+    notes = modules.add_parser('notes').add_subparsers(dest='op', required=True)
+    add = notes.add_parser('add')
+    add.add_argument('--title', required=True)
+    add.add_argument('--content', default='')
+    _add_page_arguments(notes.add_parser('list'), NOTE_ORDERS, reverse=True)
+    notes.add_parser('show').add_argument('id', type=int)
+    edit = notes.add_parser('edit')
+    edit.add_argument('id', type=int)
+    edit.add_argument('--title')
+    edit.add_argument('--content')
+    notes.add_parser('delete').add_argument('id', type=int)
+    search = notes.add_parser('search')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=10)
+    _add_csv_parsers(notes)
+
+    contacts = modules.add_parser('contacts').add_subparsers(dest='op', required=True)
+    add = contacts.add_parser('add')
+    add.add_argument('--name', required=True)
+    add.add_argument('--phone')
+    add.add_argument('--email')
+    _add_page_arguments(contacts.add_parser('list'), CONTACT_ORDERS)
+    search = contacts.add_parser('search')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=50)
+    edit = contacts.add_parser('edit')
+    edit.add_argument('id', type=int)
+    edit.add_argument('--name')
+    edit.add_argument('--phone')
+    edit.add_argument('--email')
+    contacts.add_parser('delete').add_argument('id', type=int)
+    _add_csv_parsers(contacts)
+    contacts.choices['import'].add_argument('--upsert', action='store_true',
+                                            help="дополнять совпадающие контакты вместо добавления новых")
+    for name in ('duplicates', 'dedupe'):
+        contacts.add_parser(name).add_argument('--exact', action='store_true',
+                                               help="не считать дубликатами имена, совпадающие только по звучанию")
+    merge = contacts.add_parser('merge')
+    merge.add_argument('id', type=int, help="контакт, в который переносятся данные")
+    merge.add_argument('ids', type=int, nargs='+', help="поглощаемые контакты")
+
+    finance = modules.add_parser('finance').add_subparsers(dest='op', required=True)
+    add = finance.add_parser('add')
+    add.add_argument('--amount', type=float, required=True)
+    add.add_argument('--category', required=True)
+    add.add_argument('--date', required=True, help="ДД-ММ-ГГГГ")
+    add.add_argument('--description', default='')
+    listing = _add_page_arguments(finance.add_parser('list'), FINANCE_ORDERS, reverse=True)
+    listing.add_argument('--category')
+    listing.add_argument('--date')
+    for name in ('report', 'monthly'):
+        report = finance.add_parser(name)
+        report.add_argument('--from', dest='from', help="ДД-ММ-ГГГГ")
+        report.add_argument('--to', dest='to', help="ДД-ММ-ГГГГ")
+    finance.add_parser('balance')
+    categories = finance.add_parser('categories', help="итоги по категориям или по месяцам одной категории")
+    categories.add_argument('--category')
+    categories.add_argument('--from', dest='from', help="ДД-ММ-ГГГГ")
+    categories.add_argument('--to', dest='to', help="ДД-ММ-ГГГГ")
+    calc = finance.add_parser('calc', help="формула по записям, например sum(amount * (amount < 0))")
+    calc.add_argument('expression')
+    calc.add_argument('--category')
+    calc.add_argument('--from', dest='from', help="ДД-ММ-ГГГГ")
+    calc.add_argument('--to', dest='to', help="ДД-ММ-ГГГГ")
+    _add_csv_parsers(finance)
+    return parser
+
+
+def main(argv=None):
+    args = vars(build_parser().parse_args(argv))
+    module, op = args.pop('module'), args.pop('op')
+    target, profile, trace_memory = args.pop('metrics'), args.pop('profile'), args.pop('trace_memory')
+    if target or profile or trace_memory:
+        metrics.enable(profile, trace_memory, target or '-')
+    if module == 'batch':
+        ok, failed = run_batch(sys.stdin, sys.stdout)
+        print(f"Выполнено операций: {ok}, с ошибками: {failed}.", file=sys.stderr)
+        return 1 if failed else 0
+    with Session() as session:
+        try:
+            result = session.run(module, op, args)
+        except (ValueError, OSError) as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 1
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
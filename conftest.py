@@ -0,0 +1 @@
+# корень репозитория в sys.path, чтобы тесты импортировали пакеты как программа
@@ -1,8 +1,17 @@
-import json
-import csv
 import os
+from storage.backends import open_store
+from storage.csvio import import_rows, write_rows
+from storage.locking import ConflictError, check_conflicts
+from storage.records import RecordStore, RecordManager
+from storage.query import page, pages, browse
+from storage.history import revert, records_at
+from storage import metrics
+from contacts.search_index import ContactSearchIndex
+from contacts.dedup import DuplicateIndex, merge_fields
 
 class Contact:
+    __slots__ = ('contact_id', 'name', 'phone', 'email')
+
     def __init__(self, contact_id, name, phone=None, email=None):
         self.contact_id = contact_id
         self.name = name
@@ -12,65 +21,254 @@ class Contact:
     def __repr__(self):
         return f"Contact(id={self.contact_id}, name={self.name}, phone={self.phone}, email={self.email})"
 
-class ContactManager:
-    def __init__(self, filename='contacts\\contacts.json'):
+    def to_dict(self):
+        return {
+            'contact_id': self.contact_id,
+            'name': self.name,
+            'phone': self.phone,
+            'email': self.email
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+CONTACT_SCHEMA = {
+    'table': 'contacts',
+    'columns': {'name': 'TEXT', 'phone': 'TEXT', 'email': 'TEXT'}
+}
+
+CONTACT_ORDERS = {
+    'name': lambda contact: (contact.name or '').casefold(),
+}
+
+class ContactManager(RecordManager):
+    RECORDS = 'contacts'
+
+    def __init__(self, filename=os.path.join('contacts', 'contacts.json'), lazy=False):
         self.filename = filename
+        self.storage = open_store(filename, 'contact_id', self._snapshot, CONTACT_SCHEMA, self._apply_changes)
+        self.contacts = self.load_contacts()
+        self._search_index = None
+        self._duplicates = None
+        if not lazy:
+            self.contacts.load()
+
+    @property
+    def search_index(self):
+        # индекс строится при первом поиске, а до этого не обновляется
+        if self._search_index is None:
+            self._search_index = ContactSearchIndex(self.contacts)
+        return self._search_index
+
+    @property
+    def duplicates(self):
+        if self._duplicates is None:
+            self._duplicates = DuplicateIndex(self.contacts)
+        return self._duplicates
+
+    def _indexes(self):
+        return [index for index in (self._search_index, self._duplicates) if index is not None]
+
+    def _reset(self):
         self.contacts = self.load_contacts()
+        self._search_index = self._duplicates = None
+
+    def _changed(self, op, contact_id):
+        indexes = self._indexes()
+        if not indexes:
+            return
+        contact = self.contacts.get(contact_id)
+        for index in indexes:
+            if contact is None:
+                index.remove(contact_id)
+            else:
+                index.update(contact)
 
     def load_contacts(self):
-        if os.path.exists(self.filename):
-            with open(self.filename, 'r') as f:
-                return [Contact(**data) for data in json.load(f)]
-        return []
+        return RecordStore('contact_id', Contact.from_dict, self._read_storage, self.storage)
+
+    @metrics.instrumented('contacts.load')
+    def _read_storage(self):
+        return self.storage.load(lazy=True), self.storage.next_id
 
+    @metrics.instrumented('contacts.save')
     def save_contacts(self):
-        with open(self.filename, 'w') as f:
-            json.dump([{
-                'contact_id': contact.contact_id,
-                'name': contact.name,
-                'phone': contact.phone,
-                'email': contact.email
-            } for contact in self.contacts], f)
+        self.storage.save()
 
+    @metrics.instrumented('contacts.add')
     def add_contact(self, name, phone=None, email=None):
-        contact_id = len(self.contacts) + 1
-        new_contact = Contact(contact_id, name, phone, email)
-        self.contacts.append(new_contact)
-        self.save_contacts()
+        with self.storage.writing():
+            contact_id = self.contacts.allocate_id()
+            new_contact = Contact(contact_id, name, phone, email)
+            self.contacts.add(new_contact)
+            for index in self._indexes():
+                index.add(new_contact)
+            self.storage.append('add', contact_id, new_contact.to_dict())
+        return contact_id
 
-    def search_contact(self, query):
-        results = [contact for contact in self.contacts if query.lower() in contact.name.lower() or (contact.phone and query in contact.phone)]
-        return results
+    @metrics.instrumented('contacts.list')
+    def list_contacts(self, limit=20, cursor=None, order=None):
+        # (контакты, курсор следующей страницы или None); order='name' - по имени
+        return page(self.contacts, limit, cursor, order=CONTACT_ORDERS[order] if order else None)
 
+    def view_contacts(self, page_size=20, order=None):
+        browse(pages(self.contacts, page_size, order=CONTACT_ORDERS[order] if order else None), print)
+
+    @metrics.instrumented('contacts.search')
+    def search_contact(self, query, limit=None):
+        return [self.contacts.get(contact_id) for contact_id in self.search_index.search(query, limit)]
+
+    @metrics.instrumented('contacts.edit')
     def edit_contact(self, contact_id, name=None, phone=None, email=None):
-        for contact in self.contacts:
-            if contact.contact_id == contact_id:
-                if name is not None:
-                    contact.name = name
-                if phone is not None:
-                    contact.phone = phone
-                if email is not None:
-                    contact.email = email
-                self.save_contacts()
-                return True
-        return False
+        contact = self.contacts.get(contact_id)
+        if contact is None:
+            return False
+        seen = contact.to_dict()
+        with self.storage.writing():
+            contact = self.contacts.get(contact_id)
+            if contact is None:
+                return False
+            before = contact.to_dict()
+            wanted = {'name': name, 'phone': phone, 'email': email}
+            check_conflicts(seen, before, {k: v for k, v in wanted.items() if v is not None})
+            if name is not None:
+                contact.name = name
+            if phone is not None:
+                contact.phone = phone
+            if email is not None:
+                contact.email = email
+            changes = {k: v for k, v in contact.to_dict().items() if before[k] != v}
+            if changes:
+                for index in self._indexes():
+                    index.update(contact)
+                self.storage.append('edit', contact_id, changes, {k: before[k] for k in changes})
+        return True
 
+    @metrics.instrumented('contacts.delete')
     def delete_contact(self, contact_id):
-        self.contacts = [contact for contact in self.contacts if contact.contact_id != contact_id]
-        self.save_contacts()
-
-    def export_to_csv(self, csv_filename='contacts\\contacts.csv'):
-        with open(csv_filename, "w", newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['ID', 'Name', 'Phone', 'Email'])
-            for contact in self.contacts:
-                writer.writerow([contact.contact_id, contact.name, contact.phone, contact.email])
-
-    def import_from_csv(self, csv_filename='contacts\\contacts.csv'):
-        with open(csv_filename, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                self.add_contact(row['Name'], row['Phone'], row['Email'])
+        with self.storage.writing():
+            removed = self.contacts.remove(contact_id)
+            if removed is not None:
+                for index in self._indexes():
+                    index.remove(contact_id)
+                self.storage.append('delete', contact_id, before=removed.to_dict())
+
+    def undo(self):
+        # отменяет последнее изменение контактов; число отмененных операций
+        return revert(self)
+
+    def redo(self):
+        return revert(self, redo=True)
+
+    def as_of(self, moment):
+        # контакты на момент moment (ДД-ММ-ГГГГ [ЧЧ:ММ] или секунды)
+        return records_at(self.storage, 'contact_id', Contact.from_dict, moment)
+
+    @metrics.instrumented('contacts.export_csv')
+    def export_to_csv(self, csv_filename=os.path.join('contacts', 'contacts.csv'), progress=None, encoding=None):
+        return write_rows(csv_filename, ['ID', 'Name', 'Phone', 'Email'],
+                          ([contact.contact_id, contact.name, contact.phone, contact.email]
+                           for contact in self.contacts), progress=progress, encoding=encoding)
+
+    @metrics.instrumented('contacts.import_csv')
+    def import_from_csv(self, csv_filename=os.path.join('contacts', 'contacts.csv'), workers=None, progress=None,
+                        encoding=None, upsert=False):
+        # upsert: строка, совпавшая с существующим контактом по телефону,
+        # почте или имени (см. contacts.dedup), дополняет его, а не
+        # добавляется заново
+        return import_rows(csv_filename, self._contact_from_row, self._upsert_many if upsert else self._add_many,
+                           workers=workers, progress=progress, encoding=encoding)
+
+    @staticmethod
+    def _contact_from_row(row):
+        if not row['Name']:
+            raise ValueError("пустое имя контакта")
+        return row['Name'], row['Phone'] or None, row['Email'] or None
+
+    def _add_many(self, rows):
+        with self.storage.writing():
+            first_id = self.contacts.allocate_id(len(rows))
+            new_contacts = [Contact(first_id + i, *row) for i, row in enumerate(rows)]
+            self._add_records(new_contacts)
+        for index in self._indexes():
+            for contact in new_contacts:
+                index.add(contact)
+
+    def _upsert_many(self, rows):
+        with self.storage.writing():
+            duplicates = self.duplicates
+            entries, before = [], []
+            for name, phone, email in rows:
+                row = Contact(None, name, phone, email)
+                contact_id = duplicates.match(row)
+                if contact_id is None:
+                    contact = Contact(self.contacts.allocate_id(), name, phone, email)
+                    self.contacts.add(contact)
+                    entries.append(('add', contact.contact_id, contact.to_dict()))
+                    before.append(None)
+                else:
+                    contact = self.contacts.get(contact_id)
+                    changes = merge_fields(contact, row)
+                    if not changes:
+                        continue
+                    before.append({field: getattr(contact, field) for field in changes})
+                    for field, value in changes.items():
+                        setattr(contact, field, value)
+                    entries.append(('edit', contact_id, changes))
+                for index in self._indexes():
+                    index.update(contact)
+            try:
+                if entries:
+                    self.storage.append_many(entries, before)
+            except OSError:
+                self._reset()
+                raise
+
+    @metrics.instrumented('contacts.find_duplicates')
+    def find_duplicates(self, fuzzy=True):
+        return [[self.contacts.get(contact_id) for contact_id in group]
+                for group in self.duplicates.groups(fuzzy)]
+
+    @metrics.instrumented('contacts.merge')
+    def merge_contacts(self, target_id, other_ids):
+        # Поля других контактов переносятся в target (пустые поля
+        # заполняются, более полное имя заменяет краткое), сами они
+        # удаляются. Все изменения пишутся в журнал одной пачкой.
+        with self.storage.writing():
+            target = self.contacts.get(target_id)
+            if target is None:
+                return False
+            others = [self.contacts.get(contact_id) for contact_id in other_ids if contact_id != target_id]
+            others = [contact for contact in others if contact is not None]
+            before = target.to_dict()
+            for other in others:
+                for field, value in merge_fields(target, other).items():
+                    setattr(target, field, value)
+            changes = {k: v for k, v in target.to_dict().items() if before[k] != v}
+            entries = [('edit', target_id, changes)] if changes else []
+            entries.extend(('delete', other.contact_id, None) for other in others)
+            previous = [{k: before[k] for k in changes}] if changes else []
+            previous.extend(other.to_dict() for other in others)
+            if entries:
+                self.storage.append_many(entries, previous)
+            for other in others:
+                self.contacts.remove(other.contact_id)
+                for index in self._indexes():
+                    index.remove(other.contact_id)
+            for index in self._indexes():
+                index.update(target)
+        return True
+
+    def dedupe(self, fuzzy=True):
+        # объединяет каждую группу дубликатов в самый старый контакт;
+        # возвращает число удаленных записей
+        removed = 0
+        with self.storage.writing():
+            for group in self.duplicates.groups(fuzzy):
+                self.merge_contacts(group[0], group[1:])
+                removed += len(group) - 1
+        return removed
 
     def main(self):
         while True:
@@ -81,7 +279,11 @@ class ContactManager:
             print("4. Удалить контакт")
             print("5. Экспортировать контакты в CSV")
             print("6. Импортировать контакты из CSV")
-            print("7. Выход")
+            print("7. Найти и объединить дубликаты")
+            print("8. Список контактов")
+            print("9. Отменить последнее изменение")
+            print("10. Повторить отмененное изменение")
+            print("11. Выход")
 
             choice = input("Введите номер опции: ")
 
@@ -94,7 +296,7 @@ class ContactManager:
             
             elif choice == '2':
                 query = input("Введите имя или номер телефона для поиска: ")
-                results = self.search_contact(query)
+                results = self.search_contact(query, limit=50)
                 if results:
                     for c in results:
                         print(c)
@@ -106,10 +308,13 @@ class ContactManager:
                 name = input("Введите новое имя (или оставьте пустым): ")
                 phone = input("Введите новый номер телефона (или оставьте пустым): ")
                 email = input("Введите новый адрес электронной почты (или оставьте пустым): ")
-                if self.edit_contact(contact_id, name or None, phone or None, email or None):
-                    print("Контакт обновлен.")
-                else:
-                    print("Контакт не найден.")
+                try:
+                    if self.edit_contact(contact_id, name or None, phone or None, email or None):
+                        print("Контакт обновлен.")
+                    else:
+                        print("Контакт не найден.")
+                except ConflictError as e:
+                    print(e)
             
             elif choice == '4':
                 contact_id = int(input("Введите ID контакта для удаления: "))
@@ -121,14 +326,47 @@ class ContactManager:
                 print("Контакты экспортированы в contacts.csv.")
             
             elif choice == '6':
-                self.import_from_csv()
-                print("Контакты импортированы из contacts.csv.")
+                upsert = input("Обновлять совпадающие контакты вместо добавления новых? (да/нет): ").strip().lower() == 'да'
+                try:
+                    count, rate = self.import_from_csv(upsert=upsert)
+                except ValueError as e:
+                    print(f"Импорт отменен. {e}")
+                else:
+                    print(f"Контакты импортированы из contacts.csv: {count} шт. ({rate:.0f} строк/с).")
             
             elif choice == '7':
+                groups = self.find_duplicates()
+                if not groups:
+                    print("Дубликаты не найдены.")
+                    continue
+                for group in groups:
+                    print("Группа:")
+                    for c in group:
+                        print(f"  {c}")
+                if input(f"Объединить {len(groups)} групп(ы) в самые старые контакты? (да/нет): ").strip().lower() == 'да':
+                    print(f"Удалено дубликатов: {self.dedupe()}.")
+
+            elif choice == '8':
+                self.view_contacts(order='name')
+
+            elif choice == '9':
+                try:
+                    count = self.undo()
+                except ValueError as e:
+                    print(e)
+                else:
+                    print(f"Отменено операций: {count}." if count else "Нечего отменять.")
+
+            elif choice == '10':
+                count = self.redo()
+                print(f"Повторено операций: {count}." if count else "Нечего повторять.")
+
+            elif choice == '11':
+                self.flush()
                 break
             
             else:
-                print("Некорректный ввод. Пожалуйста, выберите номер от 1 до 7.")
+                print("Некорректный ввод. Пожалуйста, выберите номер от 1 до 11.")
 
 if __name__ == '__main__':
     manager = ContactManager()
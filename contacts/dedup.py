@@ -0,0 +1,178 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from contacts.search_index import normalize_name, normalize_phone
+from storage import metrics
+
+_VOWELS = set('аеиоуыэюяйьъaeiouyh')
+# звонкие согласные заменяются парными глухими: "Гвоздев" ~ "Квостеф"
+_DEVOICE = str.maketrans('бвгджзщbvgdzcqw', 'пфктшсшpfktskkv')
+
+
+def phone_key(phone):
+    # последние 10 цифр: "+7 912 ...", "8 912 ..." и "912 ..." совпадают
+    digits = normalize_phone(phone)
+    if len(digits) < 5:
+        return None
+    return digits[-10:]
+
+
+def email_key(email):
+    email = (email or '').strip().lower()
+    return email if '@' in email else None
+
+
+def name_tokens(name):
+    return tuple(sorted(re.findall(r'\w+', normalize_name(name))))
+
+
+@lru_cache(maxsize=100000)
+def phonetic(token):
+    token = token.translate(_DEVOICE)
+    code = [token[0]]
+    for letter in token[1:]:
+        if letter not in _VOWELS and letter != code[-1]:
+            code.append(letter)
+    return ''.join(code)
+
+
+def blocking_keys(contact):
+    # ключи, по которым записи попадают в один блок-кандидат; сравниваются
+    # друг с другом только записи из общего блока
+    keys = []
+    phone = phone_key(contact.phone)
+    if phone:
+        keys.append(('phone', phone))
+    email = email_key(contact.email)
+    if email:
+        keys.append(('email', email))
+    tokens = name_tokens(contact.name)
+    if tokens:
+        keys.append(('name', tokens))
+        keys.append(('sound', tuple(sorted(phonetic(token) for token in tokens))))
+    return keys
+
+
+def _names_compatible(a, b):
+    # одно имя - часть другого ("Иван" и "Иван Петров") или звучат одинаково
+    tokens_a, tokens_b = set(name_tokens(a.name)), set(name_tokens(b.name))
+    if not tokens_a or not tokens_b or tokens_a <= tokens_b or tokens_b <= tokens_a:
+        return True
+    return {phonetic(token) for token in tokens_a} == {phonetic(token) for token in tokens_b}
+
+
+def is_duplicate(a, b, fuzzy=True):
+    # Совпадение почты - дубликат. Совпадение телефона - дубликат, если имена
+    # совместимы. Одинаковое имя (с точностью до порядка слов, а при fuzzy и
+    # до звучания) - дубликат, только если телефоны и почта не противоречат.
+    email_a, email_b = email_key(a.email), email_key(b.email)
+    if email_a and email_a == email_b:
+        return True
+    phone_a, phone_b = phone_key(a.phone), phone_key(b.phone)
+    if phone_a and phone_a == phone_b:
+        return _names_compatible(a, b)
+    if (email_a and email_b) or (phone_a and phone_b):
+        return False
+    tokens_a, tokens_b = name_tokens(a.name), name_tokens(b.name)
+    if not tokens_a or not tokens_b:
+        return False
+    if tokens_a == tokens_b:
+        return True
+    return fuzzy and sorted(map(phonetic, tokens_a)) == sorted(map(phonetic, tokens_b))
+
+
+def merge_fields(target, other):
+    # поля, которые нужно изменить у target, чтобы поглотить other:
+    # пустые поля заполняются, более полное имя заменяет краткое
+    changes = {}
+    if other.phone and not target.phone:
+        changes['phone'] = other.phone
+    if other.email and not target.email:
+        changes['email'] = other.email
+    target_tokens, other_tokens = set(name_tokens(target.name)), set(name_tokens(other.name))
+    if other.name and (not target_tokens or target_tokens < other_tokens):
+        changes['name'] = other.name
+    return changes
+
+
+class DuplicateIndex:
+    # Хеш-индекс контактов по ключам blocking_keys. Кандидаты в дубликаты -
+    # только записи с общим ключом, поэтому поиск всех дубликатов идет почти
+    # за линейное время, а не сравнением каждой пары.
+    @metrics.instrumented('contacts.dedup.build')
+    def __init__(self, contacts=()):
+        self.blocks = defaultdict(set)
+        self.keys = {}
+        self.contacts = {}
+        for contact in contacts:
+            self.add(contact)
+
+    def add(self, contact):
+        keys = blocking_keys(contact)
+        self.keys[contact.contact_id] = keys
+        self.contacts[contact.contact_id] = contact
+        for key in keys:
+            self.blocks[key].add(contact.contact_id)
+
+    def remove(self, contact_id):
+        self.contacts.pop(contact_id, None)
+        for key in self.keys.pop(contact_id, ()):
+            ids = self.blocks.get(key)
+            if ids is not None:
+                ids.discard(contact_id)
+                if not ids:
+                    del self.blocks[key]
+
+    def update(self, contact):
+        self.remove(contact.contact_id)
+        self.add(contact)
+
+    def candidates(self, contact):
+        ids = set()
+        for key in blocking_keys(contact):
+            ids.update(self.blocks.get(key, ()))
+        ids.discard(contact.contact_id)
+        return ids
+
+    def match(self, contact, fuzzy=False):
+        # самый старый контакт, дубликатом которого является contact
+        for contact_id in sorted(self.candidates(contact)):
+            if is_duplicate(self.contacts[contact_id], contact, fuzzy):
+                return contact_id
+        return None
+
+    @metrics.instrumented('contacts.dedup.groups')
+    def groups(self, fuzzy=True):
+        # группы дубликатов [[id, ...], ...]; в группе первым идет самый
+        # старый контакт. Внутри блока запись сравнивается только с
+        # представителями уже найденных в нем групп.
+        parent = {}
+
+        def find(contact_id):
+            root = contact_id
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while contact_id != root:
+                parent[contact_id], contact_id = root, parent[contact_id]
+            return root
+
+        for ids in self.blocks.values():
+            if len(ids) < 2:
+                continue
+            representatives = []
+            for contact_id in sorted(ids):
+                contact = self.contacts[contact_id]
+                for representative in representatives:
+                    if is_duplicate(self.contacts[representative], contact, fuzzy):
+                        a, b = find(representative), find(contact_id)
+                        if a != b:
+                            parent[max(a, b)] = min(a, b)
+                        break
+                else:
+                    representatives.append(contact_id)
+
+        groups = defaultdict(list)
+        for contact_id in parent:
+            groups[find(contact_id)].append(contact_id)
+        return sorted(sorted(set(group) | {root}) for root, group in groups.items())
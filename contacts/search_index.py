@@ -0,0 +1,127 @@
+import heapq
+import re
+from collections import Counter, defaultdict
+
+from storage import metrics
+
+FUZZY_THRESHOLD = 0.4
+
+
+def normalize_name(name):
+    return ' '.join((name or '').lower().replace('ё', 'е').split())
+
+
+def normalize_phone(phone):
+    return re.sub(r'\D', '', phone or '')
+
+
+def trigrams(text):
+    # отступ в начале позволяет искать по началу слова короткими запросами
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _GramIndex:
+    def __init__(self):
+        self.values = {}
+        self.postings = defaultdict(set)
+
+    def add(self, record_id, value):
+        if not value:
+            return
+        self.values[record_id] = value
+        for gram in trigrams(value):
+            self.postings[gram].add(record_id)
+
+    def remove(self, record_id):
+        value = self.values.pop(record_id, None)
+        if value is None:
+            return
+        for gram in trigrams(value):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def substring(self, query):
+        if len(query) < 3:
+            # слишком короткий запрос - у него нет собственных триграмм
+            return [record_id for record_id, value in self.values.items() if query in value]
+        inner = [query[i:i + 3] for i in range(len(query) - 2)]
+        postings = sorted((self.postings.get(gram, set()) for gram in inner), key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+            if not candidates:
+                break
+        return [record_id for record_id in candidates if query in self.values[record_id]]
+
+    def similar(self, query):
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+        result = {}
+        for record_id, count in shared.items():
+            value_grams = len(self.values[record_id]) + 1
+            similarity = count / (len(query_grams) + value_grams - count)
+            if similarity >= FUZZY_THRESHOLD:
+                result[record_id] = similarity
+        return result
+
+
+class ContactSearchIndex:
+    # Триграммный индекс по нормализованным именам и индекс по телефонам,
+    # в которых оставлены только цифры ("+7 (912)" -> "7912"). Обновляется
+    # при каждом добавлении, изменении и удалении контакта.
+    @metrics.instrumented('contacts.index.build')
+    def __init__(self, contacts=()):
+        self.names = _GramIndex()
+        self.phones = _GramIndex()
+        for contact in contacts:
+            self.add(contact)
+
+    def add(self, contact):
+        self.names.add(contact.contact_id, normalize_name(contact.name))
+        self.phones.add(contact.contact_id, normalize_phone(contact.phone))
+
+    def remove(self, contact_id):
+        self.names.remove(contact_id)
+        self.phones.remove(contact_id)
+
+    def update(self, contact):
+        self.remove(contact.contact_id)
+        self.add(contact)
+
+    def search(self, query, limit=None):
+        scores = {}
+        name_query = normalize_name(query)
+        if name_query:
+            for contact_id in self.names.substring(name_query):
+                name = self.names.values[contact_id]
+                if name == name_query:
+                    score = 4.0
+                elif name.startswith(name_query):
+                    score = 3.0
+                elif f' {name_query}' in f' {name}':
+                    score = 2.5
+                else:
+                    score = 2.0
+                scores[contact_id] = score
+            if len(name_query) >= 3 and (limit is None or len(scores) < limit):
+                for contact_id, similarity in self.names.similar(name_query).items():
+                    scores.setdefault(contact_id, similarity)
+
+        phone_query = normalize_phone(query)
+        if phone_query and not re.search(r'[^\d\s()+\-.]', query):
+            for contact_id in self.phones.substring(phone_query):
+                score = 3.0 if self.phones.values[contact_id].startswith(phone_query) else 2.0
+                scores[contact_id] = max(scores.get(contact_id, 0.0), score)
+
+        def rank(contact_id):
+            return -scores[contact_id], len(self.names.values.get(contact_id, '')), contact_id
+
+        if limit is None:
+            return sorted(scores, key=rank)
+        return heapq.nsmallest(limit, scores, key=rank)
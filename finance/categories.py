@@ -0,0 +1,83 @@
+import bisect
+
+from finance.columns import to_minor, normalize
+from storage import metrics
+
+
+def _update(aggregates, key, amount):
+    # агрегат - [количество, сумма, минимум, максимум] в копейках
+    aggregate = aggregates.get(key)
+    if aggregate is None:
+        aggregates[key] = [1, amount, amount, amount]
+        return
+    aggregate[0] += 1
+    aggregate[1] += amount
+    if amount < aggregate[2]:
+        aggregate[2] = amount
+    if amount > aggregate[3]:
+        aggregate[3] = amount
+
+
+def _merge(target, aggregate):
+    if target is None:
+        return list(aggregate)
+    target[0] += aggregate[0]
+    target[1] += aggregate[1]
+    target[2] = min(target[2], aggregate[2])
+    target[3] = max(target[3], aggregate[3])
+    return target
+
+
+class CategoryIndex:
+    # Индекс записей по категории без учета регистра и пробелов по краям:
+    # возрастающие ID записей и агрегаты по категории целиком и по
+    # месяцам. Добавление записи обновляет все это за O(1); удаление и
+    # изменение записей индекс не поддерживает - его надо строить заново.
+    @metrics.instrumented('finance.categories.build')
+    def __init__(self, records=()):
+        self.names = {}
+        self.ids = {}
+        self.totals = {}
+        self.monthly = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        key = normalize(record.category)
+        ids = self.ids.get(key)
+        if ids is None:
+            self.names[key] = record.category
+            ids = self.ids[key] = []
+            self.monthly[key] = {}
+        if ids and record.record_id < ids[-1]:
+            # запись с прежним ID, например после отмены удаления
+            bisect.insort(ids, record.record_id)
+        else:
+            ids.append(record.record_id)
+        amount = to_minor(record.amount)
+        _, month, year = record.date.split('-')
+        _update(self.totals, key, amount)
+        _update(self.monthly[key], (int(year), int(month)), amount)
+
+    def record_ids(self, category):
+        return self.ids.get(normalize(category), ())
+
+    def breakdown(self, start=None, end=None):
+        # [(категория, агрегат), ...] за месяцы [start, end] - пары (год, месяц)
+        result = []
+        for key, name in self.names.items():
+            if start is None and end is None:
+                aggregate = self.totals[key]
+            else:
+                aggregate = None
+                for month, value in self.monthly[key].items():
+                    if (start is None or month >= start) and (end is None or month <= end):
+                        aggregate = _merge(aggregate, value)
+                if aggregate is None:
+                    continue
+            result.append((name, aggregate))
+        return result
+
+    def months(self, category):
+        # [((год, месяц), агрегат), ...] по возрастанию месяцев
+        return sorted(self.monthly.get(normalize(category), {}).items())
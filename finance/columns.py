@@ -0,0 +1,165 @@
+import datetime
+from array import array
+
+from storage import metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def parse_day(date):
+    # "ДД-ММ-ГГГГ" -> число дней с 01-01-1970; быстрее, чем strptime
+    day, month, year = date.split('-')
+    return datetime.date(int(year), int(month), int(day)).toordinal() - EPOCH_ORDINAL
+
+
+def to_day(value):
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def to_minor(amount):
+    return round(amount * 100)
+
+
+def normalize(category):
+    return category.strip().casefold()
+
+
+class FinanceColumns:
+    # Колоночная копия финансовых записей: дни от эпохи, суммы в копейках и
+    # коды категорий. Строится один раз при загрузке и дописывается при
+    # добавлении записи, так что отчеты считаются по массивам, а не по
+    # объектам FinanceRecord. Если установлен NumPy, используются его массивы
+    # и векторные операции, иначе - array из стандартной библиотеки.
+    @metrics.instrumented('finance.columns.build')
+    def __init__(self, records=()):
+        self.categories = []
+        self.category_codes = {}
+        self.size = 0
+        days, amounts, codes, ids = [], [], [], []
+        for record in records:
+            days.append(parse_day(record.date))
+            amounts.append(to_minor(record.amount))
+            codes.append(self.encode_category(record.category))
+            ids.append(record.record_id)
+        self.size = len(ids)
+        if np is not None:
+            capacity = max(16, self.size)
+            self.days = np.zeros(capacity, dtype=np.int64)
+            self.amounts = np.zeros(capacity, dtype=np.int64)
+            self.codes = np.zeros(capacity, dtype=np.int32)
+            self.ids = np.zeros(capacity, dtype=np.int64)
+            self.days[:self.size] = days
+            self.amounts[:self.size] = amounts
+            self.codes[:self.size] = codes
+            self.ids[:self.size] = ids
+        else:
+            self.days = array('q', days)
+            self.amounts = array('q', amounts)
+            self.codes = array('l', codes)
+            self.ids = array('q', ids)
+
+    def day_amounts(self):
+        return zip(self.days[:self.size].tolist(), self.amounts[:self.size].tolist())
+
+    def encode_category(self, category):
+        # категории без учета регистра и пробелов по краям, как в CategoryIndex;
+        # в categories - первое встреченное написание
+        key = normalize(category)
+        code = self.category_codes.get(key)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self.category_codes[key] = code
+        return code
+
+    def append(self, record):
+        day = parse_day(record.date)
+        code = self.encode_category(record.category)
+        if np is not None:
+            if self.size == len(self.days):
+                self._grow()
+            self.days[self.size] = day
+            self.amounts[self.size] = to_minor(record.amount)
+            self.codes[self.size] = code
+            self.ids[self.size] = record.record_id
+        else:
+            self.days.append(day)
+            self.amounts.append(to_minor(record.amount))
+            self.codes.append(code)
+            self.ids.append(record.record_id)
+        self.size += 1
+
+    def _grow(self):
+        capacity = len(self.days) * 2
+        for name in ('days', 'amounts', 'codes', 'ids'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def select(self, start_day=None, end_day=None, category=None):
+        # столбцы amount (в рублях), day и id для записей из периода и
+        # категории - переменные для формул calculate.expression
+        code = None
+        if category is not None:
+            code = self.category_codes.get(normalize(category))
+            if code is None:
+                return {'amount': [], 'day': [], 'id': []}
+        if np is not None:
+            mask = np.ones(self.size, dtype=bool)
+            if start_day is not None:
+                mask &= self.days[:self.size] >= start_day
+            if end_day is not None:
+                mask &= self.days[:self.size] <= end_day
+            if code is not None:
+                mask &= self.codes[:self.size] == code
+            return {'amount': self.amounts[:self.size][mask] / 100,
+                    'day': self.days[:self.size][mask],
+                    'id': self.ids[:self.size][mask]}
+        amounts, days, ids = [], [], []
+        for day, amount, record_code, record_id in zip(self.days, self.amounts, self.codes, self.ids):
+            if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+                continue
+            if code is not None and record_code != code:
+                continue
+            amounts.append(amount / 100)
+            days.append(day)
+            ids.append(record_id)
+        return {'amount': amounts, 'day': days, 'id': ids}
+
+    def totals(self, start_day=None, end_day=None, category=None):
+        # возвращает (доходы, расходы) в копейках
+        code = None
+        if category is not None:
+            code = self.category_codes.get(normalize(category))
+            if code is None:
+                return 0, 0
+        if np is not None:
+            amounts = self.amounts[:self.size]
+            mask = np.ones(self.size, dtype=bool)
+            if start_day is not None:
+                mask &= self.days[:self.size] >= start_day
+            if end_day is not None:
+                mask &= self.days[:self.size] <= end_day
+            if code is not None:
+                mask &= self.codes[:self.size] == code
+            selected = amounts[mask]
+            return int(selected[selected > 0].sum()), int(selected[selected < 0].sum())
+        income = expense = 0
+        for day, amount, record_code in zip(self.days, self.amounts, self.codes):
+            if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+                continue
+            if code is not None and record_code != code:
+                continue
+            if amount > 0:
+                income += amount
+            else:
+                expense += amount
+        return income, expense
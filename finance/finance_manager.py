@@ -1,90 +1,248 @@
-import json
-import csv
 import os
+import sys
 from datetime import datetime
+from storage.backends import open_store
+from storage.csvio import import_rows, write_rows
+from storage.records import RecordStore, RecordManager
+from storage.query import page, pages, browse
+from storage.history import revert, records_at
+from storage import metrics
+from finance.columns import FinanceColumns, parse_day, to_day, to_minor
+from finance.timeline import DailyTotals
+from finance.categories import CategoryIndex
+from calculate.expression import compile_expression
 
 class FinanceRecord:
+    __slots__ = ('record_id', 'amount', 'category', 'date', 'description')
+
     def __init__(self, record_id, amount, category, date, description):
         self.record_id = record_id
         self.amount = amount
-        self.category = category
-        self.date = date
+        self.category = sys.intern(category)
+        self.date = sys.intern(date)
         self.description = description
 
     def __repr__(self):
         return f"FinanceRecord(id={self.record_id}, amount={self.amount}, category='{self.category}', date='{self.date}', description='{self.description}')"
 
-class FinanceManager:
-    def __init__(self, filename='finance\\finance.json'):
+    def to_dict(self):
+        return {
+            'record_id': self.record_id,
+            'amount': self.amount,
+            'category': self.category,
+            'date': self.date,
+            'description': self.description
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+FINANCE_SCHEMA = {
+    'table': 'records',
+    'columns': {'amount': 'REAL', 'category': 'TEXT', 'date': 'TEXT', 'description': 'TEXT'}
+}
+
+# сортировки для list_records
+FINANCE_ORDERS = {
+    'date': lambda record: parse_day(record.date),
+    'amount': lambda record: record.amount,
+}
+
+class FinanceManager(RecordManager):
+    RECORDS = 'records'
+
+    def __init__(self, filename=os.path.join('finance', 'finance.json'), lazy=False):
         self.filename = os.path.join(os.getcwd(), filename)
+        self.storage = open_store(self.filename, 'record_id', self._snapshot, FINANCE_SCHEMA, self._apply_changes)
         self.records = self.load_records()
+        self._columns = None
+        self._timeline = None
+        self._categories = None
+        if not lazy:
+            self.records.load()
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = FinanceColumns(self.records)
+        return self._columns
+
+    @property
+    def timeline(self):
+        if self._timeline is None:
+            self._timeline = DailyTotals(self.columns.day_amounts())
+        return self._timeline
+
+    @property
+    def categories(self):
+        if self._categories is None:
+            self._categories = CategoryIndex(self.records)
+        return self._categories
+
+    def _index_record(self, record):
+        # индексы, которые еще не построены, обновлять не нужно:
+        # при построении они сами прочитают все записи
+        if self._columns is not None:
+            self._columns.append(record)
+        if self._timeline is not None:
+            self._timeline.add(parse_day(record.date), to_minor(record.amount))
+        if self._categories is not None:
+            self._categories.add(record)
+
+    def _reset(self):
+        self.records = self.load_records()
+        self._columns = self._timeline = self._categories = None
+
+    def _changed(self, op, record_id):
+        if op == 'add':
+            self._index_record(self.records.get(record_id))
+        else:
+            # столбцы, дневные итоги и категории умеют только дописываться
+            self._columns = self._timeline = self._categories = None
 
     def load_records(self):
-        if os.path.exists(self.filename):
-            with open(self.filename, 'r') as f:
-                return [FinanceRecord(**data) for data in json.load(f)]
-        return []
+        return RecordStore('record_id', FinanceRecord.from_dict, self._read_storage, self.storage)
 
+    @metrics.instrumented('finance.load')
+    def _read_storage(self):
+        return self.storage.load(lazy=True), self.storage.next_id
+
+    @metrics.instrumented('finance.save')
     def save_records(self):
-        with open(self.filename, 'w') as f:
-            json.dump([{
-                'record_id': record.record_id,
-                'amount': record.amount,
-                'category': record.category,
-                'date': record.date,
-                'description': record.description
-            } for record in self.records], f)
+        self.storage.save()
 
+    @metrics.instrumented('finance.add')
     def add_record(self, amount, category, date, description):
-        record_id = len(self.records) + 1
-        new_record = FinanceRecord(record_id, amount, category, date, description)
-        self.records.append(new_record)
-        self.save_records()
+        parse_day(date)
+        with self.storage.writing():
+            record_id = self.records.allocate_id()
+            new_record = FinanceRecord(record_id, amount, category, date, description)
+            self.records.add(new_record)
+            self._index_record(new_record)
+            self.storage.append('add', record_id, new_record.to_dict())
+        return record_id
 
-    def view_records(self, category=None, date=None):
-        filtered_records = self.records
+    @metrics.instrumented('finance.find')
+    def find_records(self, category=None, date=None):
+        # по категории записи берутся из индекса, а не перебором всех записей
         if category:
-            filtered_records = [record for record in filtered_records if record.category.lower() == category.lower()]
+            records = (self.records.get(record_id) for record_id in self.categories.record_ids(category))
+        else:
+            records = self.records
         if date:
-            filtered_records = [record for record in filtered_records if record.date == date]
-        
-        for record in filtered_records:
-            print(record)
+            return [record for record in records if record.date == date]
+        return list(records)
+
+    def _query(self, category, date, order):
+        # ID из индекса категорий возрастают: записи добавляются с растущими ID
+        options = {'order': FINANCE_ORDERS[order] if order else None}
+        if category:
+            options['ids'] = self.categories.record_ids(category)
+        if date:
+            options['where'] = lambda record: record.date == date
+        return options
+
+    @metrics.instrumented('finance.list')
+    def list_records(self, limit=20, cursor=None, category=None, date=None, order=None, reverse=False):
+        # (записи, курсор следующей страницы или None)
+        return page(self.records, limit, cursor, reverse=reverse, **self._query(category, date, order))
+
+    @metrics.instrumented('finance.view')
+    def view_records(self, category=None, date=None, page_size=20, order=None, reverse=False):
+        browse(pages(self.records, page_size, reverse=reverse, **self._query(category, date, order)), print)
+
+    def undo(self):
+        # отменяет последнее изменение записей; число отмененных операций
+        return revert(self)
+
+    def redo(self):
+        return revert(self, redo=True)
+
+    def as_of(self, moment):
+        # записи на момент moment (ДД-ММ-ГГГГ [ЧЧ:ММ] или секунды)
+        return records_at(self.storage, 'record_id', FinanceRecord.from_dict, moment)
+
+    @metrics.instrumented('finance.category_report')
+    def category_report(self, start_date=None, end_date=None):
+        # [(категория, количество, сумма, минимум, максимум), ...] за месяцы
+        # периода, по убыванию оборота
+        start = (start_date.year, start_date.month) if start_date else None
+        end = (end_date.year, end_date.month) if end_date else None
+        rows = [(name, count, total / 100, low / 100, high / 100)
+                for name, (count, total, low, high) in self.categories.breakdown(start, end)]
+        rows.sort(key=lambda row: -abs(row[2]))
+        return rows
+
+    @metrics.instrumented('finance.category_monthly')
+    def category_monthly_report(self, category):
+        return [(f"{month:02d}-{year}", count, total / 100, low / 100, high / 100)
+                for (year, month), (count, total, low, high) in self.categories.months(category)]
+
+    @metrics.instrumented('finance.report')
+    def report_totals(self, start_date=None, end_date=None, category=None):
+        start_day = to_day(start_date) if start_date else None
+        end_day = to_day(end_date) if end_date else None
+        if category is None:
+            income, expense = self.timeline.totals(start_day, end_day)
+        else:
+            income, expense = self.columns.totals(start_day, end_day, category)
+        return income / 100, expense / 100
+
+    @metrics.instrumented('finance.monthly_report')
+    def monthly_report(self, start_date=None, end_date=None):
+        start = (start_date.year, start_date.month) if start_date else None
+        end = (end_date.year, end_date.month) if end_date else None
+        return [(f"{month:02d}-{year}", income / 100, expense / 100)
+                for (year, month), income, expense in self.timeline.monthly_series(start, end)]
+
+    @metrics.instrumented('finance.evaluate')
+    def evaluate(self, expression, start_date=None, end_date=None, category=None):
+        # формула по столбцам записей: amount - сумма, day - дни от
+        # 01-01-1970, id - ID записи; например sum(amount * (amount < 0))
+        compiled = compile_expression(expression)
+        start_day = to_day(start_date) if start_date else None
+        end_day = to_day(end_date) if end_date else None
+        return compiled.evaluate(self.columns.select(start_day, end_day, category))
 
     def generate_report(self, start_date=None, end_date=None):
-        report_records = []
-        
-        for record in self.records:
-            record_date = datetime.strptime(record.date, "%d-%m-%Y")
-            if (start_date and record_date < start_date) or (end_date and record_date > end_date):
-                continue
-            report_records.append(record)
-
-        total_income = sum(r.amount for r in report_records if r.amount > 0)
-        total_expense = sum(r.amount for r in report_records if r.amount < 0)
+        total_income, total_expense = self.report_totals(start_date, end_date)
         
         print(f"Общий доход: {total_income:.2f}")
         print(f"Общие расходы: {total_expense:.2f}")
+        print(f"Баланс за период: {total_income + total_expense:.2f}")
     
-    def export_to_csv(self, csv_filename='finance\\finance.csv'):
-        with open(csv_filename, "w", newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['ID', 'Amount', 'Category', 'Date', 'Description'])
-            for record in self.records:
-                writer.writerow([record.record_id, record.amount, record.category, record.date, record.description])
-
-    def import_from_csv(self, csv_filename='finance\\finance.csv'):
-        with open(csv_filename, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                amount = float(row['Amount'])
-                category = row['Category']
-                date = row['Date']
-                description = row['Description']
-                self.add_record(amount, category, date, description)
+    @metrics.instrumented('finance.export_csv')
+    def export_to_csv(self, csv_filename=os.path.join('finance', 'finance.csv'), progress=None, encoding=None):
+        return write_rows(csv_filename, ['ID', 'Amount', 'Category', 'Date', 'Description'],
+                          ([record.record_id, record.amount, record.category, record.date, record.description]
+                           for record in self.records), progress=progress, encoding=encoding)
 
+    @metrics.instrumented('finance.import_csv')
+    def import_from_csv(self, csv_filename=os.path.join('finance', 'finance.csv'), workers=None, progress=None, encoding=None):
+        return import_rows(csv_filename, self._record_from_row, self._add_many,
+                           workers=workers, progress=progress, encoding=encoding)
+
+    @staticmethod
+    def _record_from_row(row):
+        amount = float(row['Amount'])
+        category = row['Category']
+        date = row['Date']
+        parse_day(date)
+        description = row['Description']
+        return amount, category, date, description
+
+    def _add_many(self, rows):
+        with self.storage.writing():
+            first_id = self.records.allocate_id(len(rows))
+            new_records = [FinanceRecord(first_id + i, *row) for i, row in enumerate(rows)]
+            self._add_records(new_records)
+            for record in new_records:
+                self._index_record(record)
+
+    @metrics.instrumented('finance.balance')
     def calculate_balance(self):
-        return sum(record.amount for record in self.records)
+        return self.timeline.balance() / 100
 
     def main(self):
         while True:
@@ -95,22 +253,34 @@ class FinanceManager:
             print("4. Экспортировать записи в CSV")
             print("5. Импортировать записи из CSV")
             print("6. Посчитать общий баланс")
-            print("7. Выход")
+            print("7. Помесячный отчет")
+            print("8. Вычислить формулу по записям")
+            print("9. Отчет по категориям")
+            print("10. Записи на дату")
+            print("11. Отменить последнее изменение")
+            print("12. Повторить отмененное изменение")
+            print("13. Выход")
 
             choice = input("Введите номер опции: ")
 
             if choice == '1':
-                amount = float(input("Введите сумму операции (положительное для дохода и отрицательное для расхода): "))
-                category = input("Введите категорию операции: ")
-                date = input("Введите дату операции (ДД-ММ-ГГГГ): ")
-                description = input("Введите описание операции: ")
-                self.add_record(amount, category, date, description)
-                print("Финансовая запись добавлена.")
+                try:
+                    amount = float(input("Введите сумму операции (положительное для дохода и отрицательное для расхода): "))
+                    category = input("Введите категорию операции: ")
+                    date = input("Введите дату операции (ДД-ММ-ГГГГ): ")
+                    description = input("Введите описание операции: ")
+                    self.add_record(amount, category, date, description)
+                except ValueError as e:
+                    print(f"Ошибка ввода: {e}")
+                else:
+                    print("Финансовая запись добавлена.")
             
             elif choice == '2':
                 category_filter = input("Введите категорию для фильтрации (или оставьте пустым): ")
                 date_filter = input("Введите дату для фильтрации (ДД-ММ-ГГГГ или оставьте пустым): ")
-                self.view_records(category_filter or None, date_filter or None)
+                newest = input("Сначала новые? (да/нет): ").strip().lower() == 'да'
+                self.view_records(category_filter or None, date_filter or None,
+                                  order='date' if newest else None, reverse=newest)
             
             elif choice == '3':
                 start_date_str = input("Введите начальную дату (ДД-ММ-ГГГГ или оставьте пустым): ")
@@ -126,19 +296,75 @@ class FinanceManager:
                 print("Финансовые записи экспортированы в finance.csv.")
             
             elif choice == '5':
-                self.import_from_csv()
-                print("Финансовые записи импортированы из finance.csv.")
+                try:
+                    count, rate = self.import_from_csv()
+                except ValueError as e:
+                    print(f"Импорт отменен. {e}")
+                else:
+                    print(f"Финансовые записи импортированы из finance.csv: {count} шт. ({rate:.0f} строк/с).")
             
             elif choice == '6':
                 balance = self.calculate_balance()
                 print(f"Общий баланс: {balance:.2f}")
             
             elif choice == '7':
+                for month, income, expense in self.monthly_report():
+                    print(f"{month}: доход {income:.2f}, расходы {expense:.2f}")
+            
+            elif choice == '8':
+                print("Переменные: amount - сумма, day - день (от 01-01-1970), id - ID записи.")
+                print("Функции: sum, avg, min, max, count, round, abs, sqrt.")
+                expression = input("Введите формулу, например sum(amount * (amount < 0)): ")
+                category = input("Введите категорию (или оставьте пустым): ")
+                try:
+                    result = self.evaluate(expression, category=category or None)
+                except ValueError as e:
+                    print(f"Ошибка: {e}")
+                else:
+                    if isinstance(result, list) and len(result) > 20:
+                        print(f"Результат ({len(result)} значений, первые 20): {result[:20]}")
+                    else:
+                        print(f"Результат: {result}")
+
+            elif choice == '9':
+                category = input("Введите категорию для помесячного отчета (или оставьте пустым): ")
+                if category:
+                    rows = self.category_monthly_report(category)
+                else:
+                    rows = self.category_report()
+                if not rows:
+                    print("Записей нет.")
+                for name, count, total, low, high in rows:
+                    print(f"{name}: {count} зап., сумма {total:.2f}, мин. {low:.2f}, макс. {high:.2f}")
+
+            elif choice == '10':
+                moment = input("Введите дату (ДД-ММ-ГГГГ [ЧЧ:ММ]): ")
+                try:
+                    records = self.as_of(moment)
+                except ValueError as e:
+                    print(e)
+                else:
+                    browse(pages(records), print)
+
+            elif choice == '11':
+                try:
+                    count = self.undo()
+                except ValueError as e:
+                    print(e)
+                else:
+                    print(f"Отменено операций: {count}." if count else "Нечего отменять.")
+
+            elif choice == '12':
+                count = self.redo()
+                print(f"Повторено операций: {count}." if count else "Нечего повторять.")
+
+            elif choice == '13':
                 print("Выход из программы.")
+                self.flush()
                 break
             
             else:
-                print("Некорректный ввод. Пожалуйста, выберите номер опции от 1 до 7.")
+                print("Некорректный ввод. Пожалуйста, выберите номер опции от 1 до 13.")
 
 if __name__ == '__main__':
     manager = FinanceManager()
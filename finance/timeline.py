@@ -0,0 +1,119 @@
+import datetime
+
+from finance.columns import EPOCH_ORDINAL
+from storage import metrics
+
+
+class _Fenwick:
+    def __init__(self, size):
+        self.tree = [0] * (size + 1)
+
+    def add(self, position, value):
+        position += 1
+        while position < len(self.tree):
+            self.tree[position] += value
+            position += position & -position
+
+    def prefix(self, position):
+        # сумма элементов [0, position]
+        total = 0
+        position = min(position + 1, len(self.tree) - 1)
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+
+class DailyTotals:
+    # Доходы и расходы по дням (в копейках) в деревьях Фенвика, плюс
+    # агрегаты по месяцам и годам. Сумма за любой диапазон дат считается за
+    # O(log n), добавление записи тоже обходится в O(log n). Если новая дата
+    # выходит за покрытый диапазон, деревья перестраиваются с запасом.
+    @metrics.instrumented('finance.timeline.build')
+    def __init__(self, entries=()):
+        self.daily = {}
+        self.monthly = {}
+        self.yearly = {}
+        self.income = 0
+        self.expense = 0
+        self.first_day = self.last_day = None
+        for day, amount in entries:
+            slot = 0 if amount > 0 else 1
+            self.daily.setdefault(day, [0, 0])[slot] += amount
+        for day, (income, expense) in self.daily.items():
+            self._add_rollups(day, 0, income)
+            self._add_rollups(day, 1, expense)
+            self.income += income
+            self.expense += expense
+        self._rebuild()
+
+    def _add_rollups(self, day, slot, amount):
+        date = datetime.date.fromordinal(day + EPOCH_ORDINAL)
+        self.monthly.setdefault((date.year, date.month), [0, 0])[slot] += amount
+        self.yearly.setdefault(date.year, [0, 0])[slot] += amount
+
+    def _add_aggregates(self, day, amount):
+        slot = 0 if amount > 0 else 1
+        self.daily.setdefault(day, [0, 0])[slot] += amount
+        self._add_rollups(day, slot, amount)
+        if amount > 0:
+            self.income += amount
+        else:
+            self.expense += amount
+
+    def _rebuild(self):
+        if self.daily:
+            self.first_day = min(self.daily)
+            self.last_day = max(self.daily)
+        else:
+            self.first_day = self.last_day = 0
+        span = self.last_day - self.first_day + 1
+        # запас в обе стороны, чтобы соседние даты не вызывали перестройку
+        margin = max(366, span // 2)
+        self.base = self.first_day - margin
+        size = span + 2 * margin
+        self.income_tree = _Fenwick(size)
+        self.expense_tree = _Fenwick(size)
+        for day, (income, expense) in self.daily.items():
+            self.income_tree.add(day - self.base, income)
+            self.expense_tree.add(day - self.base, expense)
+
+    def add(self, day, amount):
+        self._add_aggregates(day, amount)
+        position = day - self.base
+        if position < 0 or position >= len(self.income_tree.tree) - 1:
+            self._rebuild()
+            return
+        if amount > 0:
+            self.income_tree.add(position, amount)
+        else:
+            self.expense_tree.add(position, amount)
+
+    def _prefix(self, day):
+        position = day - self.base
+        if position < 0:
+            return 0, 0
+        return self.income_tree.prefix(position), self.expense_tree.prefix(position)
+
+    def totals(self, start_day=None, end_day=None):
+        if start_day is None and end_day is None:
+            return self.income, self.expense
+        end_income, end_expense = self._prefix(end_day) if end_day is not None else (self.income, self.expense)
+        start_income, start_expense = self._prefix(start_day - 1) if start_day is not None else (0, 0)
+        return end_income - start_income, end_expense - start_expense
+
+    def balance(self):
+        return self.income + self.expense
+
+    def monthly_series(self, start=None, end=None):
+        # [((год, месяц), доход, расход), ...] без пропусков между месяцами
+        if not self.monthly:
+            return []
+        year, month = start or min(self.monthly)
+        end = end or max(self.monthly)
+        series = []
+        while (year, month) <= end:
+            income, expense = self.monthly.get((year, month), (0, 0))
+            series.append(((year, month), income, expense))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return series
@@ -1,93 +1,224 @@
-import datetime
-import json
-import csv
 import os
+from storage.backends import open_store
+from storage.csvio import import_rows, write_rows
+from storage.locking import ConflictError, check_conflicts
+from storage.records import RecordStore, RecordManager
+from storage.query import page, pages, browse
+from storage.history import revert, records_at
+from storage.timestamps import to_seconds, format_seconds, now_seconds
+from storage import metrics
+from notes.search import NoteSearchIndex
 
 class Notes:
+    __slots__ = ('title', 'content', 'note_id', '_date')
+
     def __init__(self, title, content, note_id, date=None):
         self.title = title
         self.content = content
         self.note_id = note_id
-        self.date = date or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.date = date
+
+    @property
+    def date(self):
+        return format_seconds(self._date)
+
+    @date.setter
+    def date(self, value):
+        self._date = to_seconds(value) if value else now_seconds()
     
     def __repr__(self):
         return f"Note(id={self.note_id}, title={self.title}, content={self.content}, timestamp={self.date})"
 
-class NoteManager:
-    def __init__(self, filename='notes\\notes.json'):
+    def to_dict(self):
+        return {'note_id': self.note_id, 'title': self.title, 'content': self.content, 'date': self.date}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['title'], data['content'], data['note_id'], data.get('date'))
+
+NOTE_SCHEMA = {
+    'table': 'notes',
+    'columns': {'title': 'TEXT', 'content': 'TEXT', 'date': 'TEXT'}
+}
+
+# сортировки для list_notes
+NOTE_ORDERS = {
+    'date': lambda note: note.date,
+    'title': lambda note: note.title,
+}
+
+class NoteManager(RecordManager):
+    RECORDS = 'notes'
+
+    def __init__(self, filename=os.path.join('notes', 'notes.json'), lazy=False):
         self.filename = filename
+        self.storage = open_store(filename, 'note_id', self._snapshot, NOTE_SCHEMA, self._apply_changes)
+        self.notes = self.load_notes()
+        self._search_index = None
+        self._write_behind = None
+        if not lazy:
+            self.notes.load()
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            self._search_index = NoteSearchIndex(os.path.splitext(self.filename)[0] + '.index.json', self.notes)
+            if self._write_behind is not None:
+                self._search_index.journal.start_write_behind(*self._write_behind)
+        return self._search_index
+
+    def _reset(self):
         self.notes = self.load_notes()
+        if self._search_index is not None:
+            self._search_index.journal.close()
+        self._search_index = None
 
+    def _changed(self, op, note_id):
+        if self._search_index is None:
+            return
+        note = self.notes.get(note_id)
+        if note is None:
+            self._search_index.remove(note_id)
+        else:
+            self._search_index.update(note)
+
+    @metrics.instrumented('notes.add')
     def add_note(self, title, content):
-        note_id = len(self.notes) + 1 
-        new_note = Notes(title, content, note_id)
-        self.notes.append(new_note)
-        self.save_notes()
+        with self.storage.writing():
+            note_id = self.notes.allocate_id()
+            new_note = Notes(title, content, note_id)
+            self.notes.add(new_note)
+            self.storage.append('add', note_id, new_note.to_dict())
+        if self._search_index is not None:
+            self._search_index.add(new_note)
+        return note_id
     
     def create_new_note(self):
         title = input("Введите название заметки: ")
         content = input("Введите описание заметки: ")
         self.add_note(title, content)
     
+    @metrics.instrumented('notes.save')
     def save_notes(self):
-        with open(self.filename, 'w') as f:
-            json.dump([{'title': n.title, 'content': n.content, 'date': n.date} for n in self.notes], f)
+        self.storage.save()
+
+    def start_write_behind(self, interval=0.5, max_pending=1000):
+        self._write_behind = (interval, max_pending)
+        self.storage.start_write_behind(interval, max_pending)
+        if self._search_index is not None:
+            self._search_index.journal.start_write_behind(interval, max_pending)
+
+    def flush(self):
+        self.storage.flush()
+        if self._search_index is not None:
+            self._search_index.journal.flush()
 
     def load_notes(self):
-        try:
-            with open(self.filename, 'r') as f:
-                return [Notes(**n) for n in json.load(f)]
-        except FileNotFoundError:
-            return []
+        return RecordStore('note_id', Notes.from_dict, self._read_storage, self.storage)
+
+    @metrics.instrumented('notes.load')
+    def _read_storage(self):
+        return self.storage.load(lazy=True), self.storage.next_id
     
-    def view_note(self):
-        for note in self.notes:
-            print(f"{note.note_id}: {note.title} (Дата: {note.date})")
+    @metrics.instrumented('notes.list')
+    def list_notes(self, limit=20, cursor=None, order=None, reverse=False):
+        # (заметки, курсор следующей страницы или None)
+        return page(self.notes, limit, cursor, order=NOTE_ORDERS[order] if order else None, reverse=reverse)
+
+    @metrics.instrumented('notes.view')
+    def view_note(self, page_size=20, order=None, reverse=False):
+        browse(pages(self.notes, page_size, order=NOTE_ORDERS[order] if order else None, reverse=reverse),
+               lambda note: print(f"{note.note_id}: {note.title} (Дата: {note.date})"))
     
     def view_note_details(self, note_id):
-        for note in self.notes:
-            if note.note_id == note_id:
-                print(f"Заголовок: {note.title}\nСодержимое: {note.content}\nДата: {note.date}")
-                return
-        print("Заметка не найдена.")
+        note = self.notes.get(note_id)
+        if note is None:
+            print("Заметка не найдена.")
+            return
+        print(f"Заголовок: {note.title}\nСодержимое: {note.content}\nДата: {note.date}")
         
+    @metrics.instrumented('notes.edit')
     def edit_note(self, note_id, new_title=None, new_content=None):
-        for note in self.notes:
-            if note.note_id == note_id:
-                if new_title is not None:
-                    note.title = new_title
-                if new_content is not None:
-                    note.content = new_content
-                note.date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self.save_notes()
+        note = self.notes.get(note_id)
+        if note is None:
+            print("Такой заметки нет")
+            return
+        seen = note.to_dict()
+        with self.storage.writing():
+            note = self.notes.get(note_id)
+            if note is None:
+                print("Такой заметки нет")
                 return
-        print("Такой заметки нет")
+            before = note.to_dict()
+            wanted = {'title': new_title, 'content': new_content}
+            check_conflicts(seen, before, {k: v for k, v in wanted.items() if v is not None})
+            if new_title is not None:
+                note.title = new_title
+            if new_content is not None:
+                note.content = new_content
+            note.date = now_seconds()
+            self._log_edit(note, before)
+        if self._search_index is not None:
+            self._search_index.update(note)
 
+    def _log_edit(self, note, before):
+        changes = {k: v for k, v in note.to_dict().items() if before[k] != v}
+        if changes:
+            self.storage.append('edit', note.note_id, changes, {k: before[k] for k in changes})
+
+    @metrics.instrumented('notes.delete')
     def delete(self, note_id):
-        note_found = False
-        for note in self.notes:
-            if note.note_id == note_id:
-                self.notes.remove(note) 
-                note_found = True  
-                break 
-        if note_found:
-            self.save_notes()
+        with self.storage.writing():
+            removed = self.notes.remove(note_id)
+            if removed is not None:
+                self.storage.append('delete', note_id, before=removed.to_dict())
+        if removed is not None:
+            if self._search_index is not None:
+                self._search_index.remove(note_id)
             print(f"Заметка с ID {note_id} была успешно удалена.")
         else:
             print(f"Заметка с ID {note_id} не найдена.")
     
-    def export_csv(self, csv_filename='notes\\notes.csv'):
-        with open(csv_filename,"w", newline='') as f:
-            write = csv.writer(f)
-            write.writerow(['ID', 'Title', 'Content', 'Date'])
-            for note in self.notes:
-                write.writerow([note.note_id, note.title, note.content, note.date])
-
-    def import_csv(self,csv_filename='notes\\notes.csv'):
-        with open(csv_filename, 'r') as f:
-            read = csv.DictReader(f)
-            for row in read:
-                self.add_note(row['Title'], row['Content'])
+    def undo(self):
+        # отменяет последнее изменение заметок; число отмененных операций
+        return revert(self)
+
+    def redo(self):
+        return revert(self, redo=True)
+
+    def as_of(self, moment):
+        # заметки на момент moment (ДД-ММ-ГГГГ [ЧЧ:ММ] или секунды)
+        return records_at(self.storage, 'note_id', Notes.from_dict, moment)
+
+    @metrics.instrumented('notes.search')
+    def search_notes(self, query, limit=10):
+        return [(self.notes.get(note_id), score) for note_id, score in self.search_index.search(query, limit)]
+
+    @metrics.instrumented('notes.export_csv')
+    def export_csv(self, csv_filename=os.path.join('notes', 'notes.csv'), progress=None, encoding=None):
+        return write_rows(csv_filename, ['ID', 'Title', 'Content', 'Date'],
+                          ([note.note_id, note.title, note.content, note.date] for note in self.notes),
+                          progress=progress, encoding=encoding)
+
+    @metrics.instrumented('notes.import_csv')
+    def import_csv(self, csv_filename=os.path.join('notes', 'notes.csv'), workers=None, progress=None,
+                   encoding=None):
+        return import_rows(csv_filename, self._note_from_row, self._add_many,
+                           workers=workers, progress=progress, encoding=encoding)
+
+    @staticmethod
+    def _note_from_row(row):
+        if not row['Title']:
+            raise ValueError("пустой заголовок заметки")
+        return row['Title'], row['Content'] or ''
+
+    def _add_many(self, rows):
+        with self.storage.writing():
+            first_id = self.notes.allocate_id(len(rows))
+            new_notes = [Notes(title, content, first_id + i) for i, (title, content) in enumerate(rows)]
+            self._add_records(new_notes)
+        if self._search_index is not None:
+            self._search_index.add_many(new_notes)
 
     def main(self):
         while True:
@@ -99,14 +230,18 @@ class NoteManager:
             print("5. Удалить заметку")
             print("6. Экспортировать заметки в CSV")
             print("7. Импортировать заметки из CSV")
-            print("8. Выход")
+            print("8. Найти заметки")
+            print("9. Отменить последнее изменение")
+            print("10. Повторить отмененное изменение")
+            print("11. Выход")
 
             choice = input("Введите номер опции: ")
 
             if choice == '1':
                 self.create_new_note()
             elif choice == '2':
-                self.view_note()
+                newest = input("Сначала новые? (да/нет): ").strip().lower() == 'да'
+                self.view_note(order='date' if newest else None, reverse=newest)
             elif choice == '3':
                 note_id = int(input("Введите ID заметки для просмотра: "))
                 self.view_note_details(note_id)
@@ -114,7 +249,10 @@ class NoteManager:
                 note_id = int(input("Введите ID заметки для редактирования: "))
                 new_title = input("Введите новый заголовок (или оставьте пустым): ")
                 new_content = input("Введите новое содержимое (или оставьте пустым): ")
-                self.edit_note(note_id, new_title or None, new_content or None)
+                try:
+                    self.edit_note(note_id, new_title or None, new_content or None)
+                except ConflictError as e:
+                    print(e)
             elif choice == '5':
                 note_id = int(input("Введите ID заметки для удаления: "))
                 self.delete(note_id)
@@ -122,9 +260,34 @@ class NoteManager:
                 self.export_csv()
                 print("Заметки экспортированы в notes.csv.")
             elif choice == '7':
-                self.import_csv()
-                print("Заметки импортированы из notes.csv.")
+                try:
+                    count, rate = self.import_csv()
+                except ValueError as e:
+                    print(f"Импорт отменен. {e}")
+                else:
+                    print(f"Заметки импортированы из notes.csv: {count} шт. ({rate:.0f} строк/с).")
             elif choice == '8':
+                query = input("Введите поисковый запрос: ")
+                results = self.search_notes(query)
+                if results:
+                    for note, score in results:
+                        print(f"{note.note_id}: {note.title} (Дата: {note.date}, релевантность: {score:.2f})")
+                else:
+                    print("Заметки не найдены.")
+            elif choice == '9':
+                try:
+                    count = self.undo()
+                except ValueError as e:
+                    print(e)
+                else:
+                    print(f"Отменено операций: {count}." if count else "Нечего отменять.")
+
+            elif choice == '10':
+                count = self.redo()
+                print(f"Повторено операций: {count}." if count else "Нечего повторять.")
+
+            elif choice == '11':
+                self.flush()
                 break
             else:
                 print("Некорректный ввод.")
@@ -0,0 +1,237 @@
+import hashlib
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from storage import metrics
+from storage.journal import Journal
+
+TITLE_BOOST = 2.0
+K1 = 1.2
+B = 0.75
+
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+
+# Окончания для стеммера Snowball (Портера) для русского языка. В группах
+# из двух кортежей окончания первого должны стоять после "а" или "я".
+RU_VOWELS = frozenset('аеиоуыэюя')
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+REFLEXIVE = ((), ('ся', 'сь'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+                  'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+         'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой',
+             'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию',
+             'ью', 'ю', 'ия', 'ья', 'я'))
+DERIVATIONAL = ((), ('ост', 'ость'))
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+EN_SUFFIXES = ['ing', 'ies', 'ed', 'es', 'ly', 's']
+# меняется вместе с разбором текста на термины: документы индекса,
+# построенные прежней версией, пересчитываются (см. text_digest)
+INDEX_VERSION = 2
+
+
+def text_digest(note):
+    # хеш текста заметки: по нему видно, что документ индекса устарел
+    text = f"{INDEX_VERSION}\0{note.title}\0{note.content}".encode()
+    return hashlib.blake2b(text, digest_size=8).hexdigest()
+
+
+def _endings(groups):
+    # (окончание, нужна ли перед ним "а"/"я") от длинных к коротким
+    after_a, plain = groups
+    return sorted([(ending, True) for ending in after_a] + [(ending, False) for ending in plain],
+                  key=lambda item: len(item[0]), reverse=True)
+
+
+_RU_ENDINGS = {name: _endings(groups) for name, groups in (
+    ('gerund', PERFECTIVE_GERUND), ('reflexive', REFLEXIVE), ('adjective', ADJECTIVE),
+    ('participle', PARTICIPLE), ('verb', VERB), ('noun', NOUN), ('derivational', DERIVATIONAL),
+    ('superlative', SUPERLATIVE))}
+
+
+def _strip(word, start, kind):
+    # слово без самого длинного окончания вида kind, лежащего в word[start:],
+    # или None; как и в Snowball, если самое длинное окончание не подходит
+    # по условию "после а/я", более короткие не проверяются
+    for ending, after_a in _RU_ENDINGS[kind]:
+        if word.endswith(ending):
+            cut = len(word) - len(ending)
+            if cut < start or (after_a and (cut - 1 < start or word[cut - 1] not in 'ая')):
+                return None
+            return word[:cut]
+    return None
+
+
+def _region(word, start):
+    # начало области после первой согласной, следующей за гласной
+    for i in range(start + 1, len(word)):
+        if word[i] not in RU_VOWELS and word[i - 1] in RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _stem_ru(word):
+    rv = next((i + 1 for i, letter in enumerate(word) if letter in RU_VOWELS), len(word))
+    r2 = _region(word, _region(word, 0))
+    result = _strip(word, rv, 'gerund')
+    if result is None:
+        result = _strip(word, rv, 'reflexive') or word
+        stripped = _strip(result, rv, 'adjective')
+        if stripped is not None:
+            result = _strip(stripped, rv, 'participle') or stripped
+        else:
+            result = _strip(result, rv, 'verb') or _strip(result, rv, 'noun') or result
+    if result.endswith('и') and len(result) > rv:
+        result = result[:-1]
+    result = _strip(result, r2, 'derivational') or result
+    stripped = _strip(result, rv, 'superlative')
+    if stripped is not None:
+        result = stripped
+    if result.endswith('нн') and len(result) - 1 > rv:
+        result = result[:-1]
+    elif stripped is None and result.endswith('ь') and len(result) > rv:
+        result = result[:-1]
+    return result
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    # русские слова - стеммер Snowball, английские - простой отсекатель
+    # окончаний, оставляющий не меньше трех букв основы
+    if not word.isascii():
+        return _stem_ru(word)
+    for suffix in EN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))]
+
+
+class NoteSearchIndex:
+    # Инвертированный индекс заметок для ранжированного поиска по BM25 с
+    # повышенным весом заголовка. Частоты терминов каждой заметки хранятся
+    # на диске в журнале рядом с заметками, поэтому изменение одной заметки
+    # дописывает одну строку, а при запуске индекс собирается без повторной
+    # токенизации текстов.
+    @metrics.instrumented('notes.index.build')
+    def __init__(self, filename, notes):
+        self.journal = Journal(filename, 'note_id', self._snapshot, on_change=self._apply_changes)
+        self._load()
+        self._sync(notes)
+
+    def _load(self):
+        self.documents = {}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+        for document in self.journal.load():
+            self._index(document)
+
+    def _apply_changes(self, changes):
+        # записи индекса, сделанные другими процессами
+        if changes is None:
+            self._load()
+            return
+        for op, note_id, document in changes:
+            self._unindex(note_id)
+            if op == 'add':
+                self._index(document)
+
+    def _snapshot(self):
+        return {'next_id': 1, 'records': list(self.documents.values())}
+
+    def _sync(self, notes):
+        # индекс мог отстать от заметок: его файл удалили или заметки
+        # изменил менеджер, который еще не строил индекс
+        stale = set(self.documents)
+        missing = []
+        for note in notes:
+            stale.discard(note.note_id)
+            document = self.documents.get(note.note_id)
+            if document is None or document.get('digest') != text_digest(note):
+                missing.append(note)
+        self.add_many(missing)
+        for note_id in stale:
+            self.remove(note_id)
+
+    def _index(self, document):
+        note_id = document['note_id']
+        self.documents[note_id] = document
+        self.total_length += document['length']
+        for term, (title_tf, content_tf) in document['terms'].items():
+            # кортежи, а не списки: сборщик мусора перестает их отслеживать
+            self.postings[term][note_id] = (title_tf, content_tf)
+
+    def _unindex(self, note_id):
+        document = self.documents.pop(note_id, None)
+        if document is None:
+            return False
+        self.total_length -= document['length']
+        for term in document['terms']:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(note_id, None)
+                if not postings:
+                    del self.postings[term]
+        return True
+
+    def _document(self, note):
+        title_terms = Counter(tokenize(note.title))
+        content_terms = Counter(tokenize(note.content))
+        terms = {term: [count, 0] for term, count in title_terms.items()}
+        for term, count in content_terms.items():
+            terms.setdefault(term, [0, 0])[1] = count
+        return {
+            'note_id': note.note_id,
+            'digest': text_digest(note),
+            'terms': terms,
+            'length': sum(title_terms.values()) + sum(content_terms.values())
+        }
+
+    def add(self, note):
+        self.add_many([note])
+
+    def add_many(self, notes):
+        documents = []
+        for note in notes:
+            self._unindex(note.note_id)
+            document = self._document(note)
+            self._index(document)
+            documents.append(document)
+        if documents:
+            self.journal.append_many([('add', document['note_id'], document) for document in documents])
+
+    def update(self, note):
+        self.add(note)
+
+    def remove(self, note_id):
+        if self._unindex(note_id):
+            self.journal.append('delete', note_id)
+
+    def search(self, query, limit=10):
+        terms = set(tokenize(query))
+        if not terms or not self.documents:
+            return []
+        count = len(self.documents)
+        average_length = self.total_length / count or 1
+        scores = defaultdict(float)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for note_id, (title_tf, content_tf) in postings.items():
+                tf = TITLE_BOOST * title_tf + content_tf
+                length = self.documents[note_id]['length']
+                scores[note_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+        if limit is None:
+            return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
@@ -1,8 +1,54 @@
+import os
+
 from task.task_manager import TaskManager
 from notes.note import NoteManager
 from contacts.contact import ContactManager
 from finance.finance_manager import FinanceManager
 from calculate.file_operations import calculator
+from search.global_search import GlobalSearch
+
+_managers = {}
+
+# PA_WRITE_BEHIND=<секунды> включает отложенную запись: изменения пишутся на
+# диск фоновым потоком, когда пользователь перестал их вносить
+WRITE_BEHIND = float(os.environ.get('PA_WRITE_BEHIND') or 0)
+
+def get_manager(manager_class):
+    # Менеджеры создаются один раз и переиспользуются между заходами в меню;
+    # данные читаются с диска заново, только если файлы изменил кто-то другой.
+    manager = _managers.get(manager_class)
+    if manager is None or manager.is_stale():
+        if manager is not None:
+            manager.flush()
+        manager = manager_class(lazy=True)
+        if WRITE_BEHIND:
+            manager.start_write_behind(WRITE_BEHIND)
+        _managers[manager_class] = manager
+    return manager
+
+MODULES = {'tasks': TaskManager, 'notes': NoteManager, 'contacts': ContactManager, 'finance': FinanceManager}
+SECTIONS = {
+    'tasks': ("Задача", lambda task: task.task_title),
+    'notes': ("Заметка", lambda note: note.title),
+    'contacts': ("Контакт", lambda contact: contact.name),
+    'finance': ("Финансы", lambda record: f"{record.amount} {record.category} {record.date} {record.description}"),
+}
+_search = None
+
+def global_search(query, limit=20):
+    # менеджер мог быть пересоздан get_manager, поэтому привязка обновляется
+    # перед каждым поиском; для прежних менеджеров это ничего не стоит
+    global _search
+    if _search is None:
+        _search = GlobalSearch()
+    for domain, manager_class in MODULES.items():
+        _search.attach(domain, get_manager(manager_class))
+    return [(domain, _search.record(domain, record_id)) for domain, record_id, _ in _search.search(query, limit)]
+
+def flush_all():
+    for manager in _managers.values():
+        manager.flush()
+
 def main_menu():
     while True:
         print("\nДобро пожаловать в Персональный помощник!")
@@ -12,35 +58,49 @@ def main_menu():
         print("3. Управление контактами")
         print("4. Управление финансовыми записями")
         print("5. Калькулятор")
-        print("6. Выход")
+        print("6. Поиск по всем разделам")
+        print("7. Выход")
 
         choice = input("Введите номер действия: ")
 
         if choice == '1':
-            notes_manager = NoteManager()
+            notes_manager = get_manager(NoteManager)
             notes_manager.main()
 
         elif choice == '2':
-            task_manager = TaskManager()
+            task_manager = get_manager(TaskManager)
             task_manager.main()
 
         elif choice == '3':
-            contact_manager = ContactManager()
+            contact_manager = get_manager(ContactManager)
             contact_manager.main()
 
         elif choice == '4':
-            finance_manager = FinanceManager()
+            finance_manager = get_manager(FinanceManager)
             finance_manager.main()
 
         elif choice == '5':
             calculator()  
 
         elif choice == '6':
+            query = input("Введите запрос: ")
+            results = global_search(query)
+            if not results:
+                print("Ничего не найдено.")
+            for domain, record in results:
+                section, describe = SECTIONS[domain]
+                print(f"[{section}] {describe(record)}")
+
+        elif choice == '7':
+            flush_all()
             print("Выход из программы.")
             break
         
         else:
-            print("Некорректный ввод. Пожалуйста, выберите номер от 1 до 6.")
+            print("Некорректный ввод. Пожалуйста, выберите номер от 1 до 7.")
 
 if __name__ == '__main__':
-    main_menu()
+    try:
+        main_menu()
+    finally:
+        flush_all()
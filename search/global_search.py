@@ -0,0 +1,191 @@
+import heapq
+import math
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from notes.search import tokenize, K1, B
+from contacts.search_index import normalize_phone
+from storage import metrics
+
+# раздел -> (атрибут менеджера с записями, ключ записи, {поле: вес})
+DOMAINS = {
+    'tasks': ('tasks', 'task_id', {'title': 2.0, 'description': 1.0}),
+    'notes': ('notes', 'note_id', {'title': 2.0, 'content': 1.0}),
+    'contacts': ('contacts', 'contact_id', {'name': 2.0, 'phone': 1.5, 'email': 1.5}),
+    'finance': ('records', 'record_id', {'category': 2.0, 'description': 1.0}),
+}
+
+
+def _terms(field, value):
+    if value is None:
+        return []
+    terms = tokenize(str(value))
+    if field == 'phone':
+        # номер целиком и его последние 10 цифр, чтобы находились
+        # и "+7 912 123-45-67", и "9121234567"
+        digits = normalize_phone(value)
+        if digits:
+            terms += [digits, digits[-10:]]
+    return terms
+
+
+class _Shard:
+    # Часть общего индекса с записями одного раздела: частоты терминов с
+    # учетом весов полей и сами проиндексированные поля (нужны, чтобы
+    # применить операцию edit, в которой есть только измененные поля).
+    def __init__(self, key, weights):
+        self.key = key
+        self.weights = weights
+        self.fields = {}
+        self.lengths = {}
+        self.postings = {}
+        self.total_length = 0
+        self.stale = True
+
+    def rebuild(self, records):
+        self.fields.clear()
+        self.lengths.clear()
+        self.postings.clear()
+        self.total_length = 0
+        for data in records:
+            self.add(data[self.key], data)
+        self.stale = False
+
+    def add(self, record_id, data):
+        self.remove(record_id)
+        fields = {field: data.get(field) for field in self.weights}
+        terms = Counter()
+        for field, weight in self.weights.items():
+            for term in _terms(field, fields[field]):
+                terms[term] += weight
+        self.fields[record_id] = fields
+        length = sum(terms.values())
+        self.lengths[record_id] = length
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[record_id] = tf
+
+    def remove(self, record_id):
+        fields = self.fields.pop(record_id, None)
+        if fields is None:
+            return
+        self.total_length -= self.lengths.pop(record_id)
+        for field in self.weights:
+            for term in _terms(field, fields[field]):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(record_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def apply(self, op, record_id, data):
+        if op == 'add':
+            self.add(record_id, data)
+        elif op == 'edit':
+            fields = self.fields.get(record_id)
+            if fields is not None and any(field in data for field in self.weights):
+                self.add(record_id, dict(fields, **data))
+        elif op == 'delete':
+            self.remove(record_id)
+
+    def score(self, idfs, average_length, limit):
+        scores = {}
+        for term, idf in idfs.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            for record_id, tf in postings.items():
+                length = self.lengths[record_id]
+                scores[record_id] = scores.get(record_id, 0.0) + \
+                    idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class GlobalSearch:
+    # Общий индекс BM25 по задачам, заметкам, контактам и финансам. Каждый
+    # раздел - отдельная часть индекса; статистика (число документов, df,
+    # средняя длина) общая, поэтому оценки разных разделов сравнимы и
+    # результаты сливаются в один рейтинг. Части ищутся параллельно в пуле
+    # потоков. Индекс подписывается на операции хранилищ менеджеров
+    # (storage.listeners), так что изменения попадают в него сразу, а
+    # раздел строится заново, только если данные перечитаны целиком.
+    def __init__(self, managers=None):
+        self.shards = {domain: _Shard(key, weights) for domain, (_, key, weights) in DOMAINS.items()}
+        self.managers = {}
+        self._listeners = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(len(DOMAINS), thread_name_prefix='search')
+        for domain, manager in (managers or {}).items():
+            self.attach(domain, manager)
+
+    def attach(self, domain, manager):
+        # повторный вызов с тем же менеджером ничего не делает, с новым -
+        # отписывается от старого и перестраивает раздел
+        with self._lock:
+            if self.managers.get(domain) is manager:
+                return
+            self.detach(domain)
+            listener = lambda entries: self._apply(domain, entries)
+            manager.storage.listeners.append(listener)
+            self.managers[domain] = manager
+            self._listeners[domain] = listener
+            self.shards[domain].stale = True
+
+    def detach(self, domain):
+        with self._lock:
+            manager = self.managers.pop(domain, None)
+            listener = self._listeners.pop(domain, None)
+            if manager is not None and listener in manager.storage.listeners:
+                manager.storage.listeners.remove(listener)
+            self.shards[domain].stale = True
+
+    def _apply(self, domain, entries):
+        with self._lock:
+            shard = self.shards[domain]
+            if entries is None:
+                shard.stale = True
+            elif not shard.stale:
+                for op, record_id, data in entries:
+                    shard.apply(op, record_id, data)
+
+    def _shard(self, domain):
+        shard = self.shards[domain]
+        if shard.stale:
+            attribute = DOMAINS[domain][0]
+            with metrics.timer('search.build'):
+                shard.rebuild(getattr(self.managers[domain], attribute).to_dicts())
+        return shard
+
+    @metrics.instrumented('search.global')
+    def search(self, query, limit=20, domains=None):
+        # [(раздел, ID записи, оценка), ...] по убыванию оценки
+        terms = set(tokenize(query))
+        digits = normalize_phone(query)
+        if digits:
+            terms.update((digits, digits[-10:]))
+        with self._lock:
+            domains = [domain for domain in (domains or DOMAINS) if domain in self.managers]
+            shards = [self._shard(domain) for domain in domains]
+            count = sum(len(shard.lengths) for shard in shards)
+            if not terms or not count:
+                return []
+            average_length = sum(shard.total_length for shard in shards) / count or 1
+            idfs = {}
+            for term in terms:
+                frequency = sum(len(shard.postings.get(term, ())) for shard in shards)
+                if frequency:
+                    idfs[term] = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            futures = [(domain, self._executor.submit(shard.score, idfs, average_length, limit))
+                       for domain, shard in zip(domains, shards)]
+            results = [(domain, record_id, score)
+                       for domain, future in futures for record_id, score in future.result()]
+        return heapq.nsmallest(limit, results, key=lambda item: (-item[2], item[0], item[1]))
+
+    def record(self, domain, record_id):
+        return getattr(self.managers[domain], DOMAINS[domain][0]).get(record_id)
+
+    def close(self):
+        for domain in list(self.managers):
+            self.detach(domain)
+        self._executor.shutdown()
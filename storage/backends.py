@@ -0,0 +1,36 @@
+import os
+
+from storage.history import History
+from storage.journal import Journal
+from storage.sqlite_store import SqliteStore
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+def is_sqlite(filename):
+    return os.path.splitext(filename)[1].lower() in SQLITE_EXTENSIONS
+
+
+def open_store(filename, key, snapshot, schema, on_change=None, history=True):
+    # Хранилище выбирается по расширению файла: *.db/*.sqlite - SQLite,
+    # все остальное - JSON-снимок с журналом операций. history - вести
+    # историю изменений (см. storage.history).
+    if is_sqlite(filename):
+        store = SqliteStore(filename, key, snapshot, schema, on_change)
+    else:
+        store = Journal(filename, key, snapshot, on_change=on_change)
+    if history:
+        store.history = History(filename, key, _loader(filename, key, schema))
+    return store
+
+
+def _loader(filename, key, schema):
+    # записи в том виде, в каком они сейчас на диске, - отдельным
+    # экземпляром хранилища, чтобы не трогать состояние основного
+    def load():
+        store = open_store(filename, key, None, schema, history=False)
+        try:
+            return store.load()
+        finally:
+            store.close()
+    return load
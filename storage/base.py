@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+
+from storage import history
+from storage.locking import FileLock
+from storage.writebehind import WriteBehind
+
+
+class BaseStore:
+    # Общая часть Journal и SqliteStore: очередь операций (сразу на диск,
+    # пачкой в конце deferred() или фоновым потоком WriteBehind), история
+    # изменений и слушатели. Подклассы пишут пачку в _write и подтягивают
+    # чужие операции в _sync; оба вызываются под блокировкой <filename>.lock.
+    #
+    # ID новых записей выдаются внутри writing(), но с deferred() или
+    # WriteBehind сами записи попадают на диск позже, уже без блокировки.
+    # Чтобы другой процесс не выдал тот же ID, при выходе из writing()
+    # на диск пишется резерв - наибольший выданный ID (_write_reservation),
+    # если добавления с ним еще не записаны.
+    def __init__(self, filename, key, snapshot, on_change=None):
+        self.filename = filename
+        self.key = key
+        self.snapshot = snapshot
+        self.on_change = on_change
+        self.next_id = 1
+        self._reserved = 0
+        self._written = 0
+        self._file_lock = FileLock(filename + '.lock')
+        self._signature = None
+        self._deferred = None
+        self._write_behind = None
+        # функции, которым сообщается о каждой пачке операций - своих и
+        # дочитанных у других процессов (None - данные перечитаны целиком)
+        self.listeners = []
+        # растет с каждой пачкой операций: по нему кэши над записями
+        # (например, storage.query) понимают, что данные изменились
+        self.version = 0
+        # storage.history.History или None; подключается в open_store
+        self.history = None
+
+    @contextmanager
+    def writing(self):
+        # блок изменений: другие писатели ждут его окончания, а то, что они
+        # успели записать до него, подтягивается в самом начале
+        with self._file_lock:
+            self._sync()
+            try:
+                yield
+            finally:
+                if self._file_lock.depth == 1 and self._reserved > self._written:
+                    self._write_reservation(self._reserved)
+                    self._written = self._reserved
+
+    def reserve(self, record_id):
+        # ID выдан этим процессом (RecordStore.allocate_id); вызывается внутри writing()
+        self._reserved = max(self._reserved, record_id)
+
+    def _track_written(self, entries):
+        # добавления, уже записанные на диск, резервировать не нужно
+        for op, record_id, _ in entries:
+            if op == 'add' and record_id > self._written:
+                self._written = record_id
+
+    def append(self, op, record_id, data=None, before=None):
+        self.append_many([(op, record_id, data)], None if before is None else [before])
+
+    @contextmanager
+    def deferred(self):
+        # операции внутри блока копятся в памяти и пишутся одной пачкой при
+        # выходе из него
+        if self._deferred is not None:
+            yield
+            return
+        self._deferred = []
+        try:
+            yield
+        finally:
+            entries, self._deferred = self._deferred, None
+            if entries:
+                self._queue(entries)
+
+    def append_many(self, entries, before=None, mark=None):
+        # before - прежние значения записей для истории изменений (вся запись
+        # для delete, измененные поля для edit), mark - пометка отмены/повтора
+        queued = entries
+        if self.history is not None and entries:
+            # изменение для истории идет в той же очереди, что и операции, и
+            # пишется вместе с ними
+            queued = list(entries) + [('history', None, history.change(entries, before, mark))]
+        self._queue(queued)
+        self._notify(entries)
+
+    def _split_history(self, entries):
+        changes = [data for op, _, data in entries if op == 'history']
+        if changes:
+            entries = [entry for entry in entries if entry[0] != 'history']
+        return entries, changes
+
+    def _notify(self, entries):
+        self.version += 1
+        for listener in self.listeners:
+            listener(entries)
+
+    def _queue(self, entries):
+        if self._deferred is not None:
+            self._deferred.extend(entries)
+            return
+        if self._write_behind is not None:
+            self._write_behind.add(entries)
+            return
+        self._write(entries)
+
+    def start_write_behind(self, interval=0.5, max_pending=1000):
+        # операции пишутся на диск фоновым потоком пачками, см. WriteBehind
+        if self._write_behind is None:
+            self._write_behind = WriteBehind(self._write, interval, max_pending)
+
+    def flush(self):
+        if self._write_behind is not None:
+            self._write_behind.flush()
@@ -0,0 +1,312 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+# Двоичный снимок хранилища:
+#   заголовок HEADER;
+#   схема - JSON {"key", "fields": [[имя, тип], ...], "meta"} длиной schema_size;
+#   записи - [u32 длина][битовая маска null][битовая маска отсутствующих
+#   полей][поля фиксированной ширины][поля переменной длины];
+#   таблица строк - u32 количество, затем [u32 длина][utf-8] на строку;
+#   индекс - u64 смещение каждой записи.
+# Типы полей: i - int64, f - float64, b - bool, t - номер строки в таблице
+# (для часто повторяющихся значений вроде категорий и приоритетов),
+# s - строка, j - произвольное значение в JSON. Ключевое поле всегда
+# первое и имеет тип i, поэтому ID записи читается без разбора остальных.
+MAGIC = b'PASNAP\x00\x01'
+HEADER = struct.Struct('<8sIqQQQ')
+LENGTH = struct.Struct('<I')
+FIXED = {'i': 'q', 'f': 'd', 'b': '?', 't': 'I'}
+BINARY_EXTENSIONS = ('.bin',)
+
+
+def is_binary(filename):
+    # по сигнатуре в начале файла, а не по расширению
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def _field_type(values, count):
+    types = {type(value) for value in values}
+    if types == {bool}:
+        return 'b'
+    if types == {int} and all(-(1 << 63) <= value < (1 << 63) for value in values):
+        return 'i'
+    if types == {float}:
+        return 'f'
+    if types == {str}:
+        # строка из таблицы, если значения повторяются хотя бы в среднем дважды
+        return 't' if len(set(values)) * 2 <= count else 's'
+    return 'j'
+
+
+def _schema(records, key):
+    names = {key: None}
+    for data in records:
+        for name in data:
+            names.setdefault(name, None)
+    fields = []
+    for name in names:
+        values = [data[name] for data in records if data.get(name) is not None]
+        kind = 'i' if name == key else _field_type(values, len(records)) if values else 'j'
+        fields.append((name, kind))
+    return fields
+
+
+def dump(snapshot, f, key):
+    # snapshot - {"next_id": ..., "records": [...], ...} или список записей
+    if isinstance(snapshot, dict):
+        records = snapshot['records']
+        meta = {name: value for name, value in snapshot.items() if name not in ('records', 'next_id')}
+        next_id = snapshot.get('next_id', 1)
+    else:
+        records, meta, next_id = snapshot, {}, 1
+    fields = _schema(records, key)
+    fixed = [(i, name, kind) for i, (name, kind) in enumerate(fields) if kind in FIXED]
+    variable = [(i, name, kind) for i, (name, kind) in enumerate(fields) if kind not in FIXED]
+    fixed_struct = struct.Struct('<' + ''.join(FIXED[kind] for _, _, kind in fixed))
+    mask_size = (len(fields) + 7) // 8
+
+    strings = {}
+    for _, name, kind in fixed:
+        if kind == 't':
+            for data in records:
+                value = data.get(name)
+                if value is not None and value not in strings:
+                    strings[value] = len(strings)
+
+    schema = json.dumps({'key': key, 'fields': fields, 'meta': meta}, ensure_ascii=False).encode()
+    start = f.tell()
+    f.write(b'\0' * HEADER.size)
+    f.write(LENGTH.pack(len(schema)))
+    f.write(schema)
+    offsets = []
+    position = start + HEADER.size + LENGTH.size + len(schema)
+    for data in records:
+        nulls = bytearray(mask_size)
+        absent = bytearray(mask_size)
+        values = []
+        for i, name, kind in fixed:
+            value = data.get(name)
+            if value is None:
+                (nulls if name in data else absent)[i >> 3] |= 1 << (i & 7)
+                value = 0
+            elif kind == 't':
+                value = strings[value]
+            values.append(value)
+        parts = []
+        for i, name, kind in variable:
+            value = data.get(name)
+            if value is None:
+                (nulls if name in data else absent)[i >> 3] |= 1 << (i & 7)
+                continue
+            encoded = (value if kind == 's' else json.dumps(value, ensure_ascii=False)).encode()
+            parts.append(LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+        body = b''.join([nulls, absent, fixed_struct.pack(*values)] + parts)
+        offsets.append(position)
+        f.write(LENGTH.pack(len(body)))
+        f.write(body)
+        position += LENGTH.size + len(body)
+
+    strings_offset = position
+    f.write(LENGTH.pack(len(strings)))
+    for value in strings:
+        encoded = value.encode()
+        f.write(LENGTH.pack(len(encoded)))
+        f.write(encoded)
+        position += LENGTH.size + len(encoded)
+    position += LENGTH.size
+    index_offset = position
+    f.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+    end = f.tell()
+    f.seek(start)
+    f.write(HEADER.pack(MAGIC, len(schema), next_id, len(records), strings_offset, index_offset))
+    f.seek(end)
+
+
+class LazyRecord:
+    # Запись снимка, которая еще не разобрана: ID известен сразу, остальные
+    # поля читаются из отображенного в память файла при первом обращении.
+    __slots__ = ('snapshot', 'index', 'key')
+
+    def __init__(self, snapshot, index, key):
+        self.snapshot = snapshot
+        self.index = index
+        self.key = key
+
+    def __getitem__(self, name):
+        if name == self.snapshot.key:
+            return self.key
+        return self.to_dict()[name]
+
+    def to_dict(self):
+        return self.snapshot.lazy_record(self.index, self.key)
+
+
+class BinarySnapshot:
+    # Чтение двоичного снимка через mmap: записи разбираются по одной и
+    # только когда понадобились, доступ к записи по номеру - O(1) по индексу.
+    def __init__(self, f):
+        self._lock = threading.Lock()
+        # ключ -> номер записи, после того как файл заменили (см. replacing)
+        self._by_key = None
+        self._open(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _open(self, data):
+        # data - отображенный в память файл или его содержимое в bytes
+        self.mmap = data
+        magic, schema_size, self.next_id, self.count, strings_offset, index_offset = \
+            HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("Некорректный снимок: неизвестный формат")
+        schema = json.loads(self.mmap[HEADER.size + LENGTH.size:HEADER.size + LENGTH.size + schema_size])
+        self.key = schema['key']
+        self.meta = schema['meta']
+        self.fields = [tuple(field) for field in schema['fields']]
+        self.fixed = [(i, name, kind) for i, (name, kind) in enumerate(self.fields) if kind in FIXED]
+        self.variable = [(i, name, kind) for i, (name, kind) in enumerate(self.fields) if kind not in FIXED]
+        self.fixed_struct = struct.Struct('<' + ''.join(FIXED[kind] for _, _, kind in self.fixed))
+        self.mask_size = (len(self.fields) + 7) // 8
+        self.offsets = memoryview(self.mmap)[index_offset:index_offset + 8 * self.count].cast('Q')
+        self.strings = []
+        position = strings_offset
+        count, = LENGTH.unpack_from(self.mmap, position)
+        position += LENGTH.size
+        for _ in range(count):
+            size, = LENGTH.unpack_from(self.mmap, position)
+            position += LENGTH.size
+            self.strings.append(self.mmap[position:position + size].decode())
+            position += size
+        # ключ - первое поле фиксированной ширины
+        self._key_offset = LENGTH.size + 2 * self.mask_size
+
+    def __len__(self):
+        return self.count
+
+    def key_at(self, index):
+        return struct.unpack_from('<q', self.mmap, self.offsets[index] + self._key_offset)[0]
+
+    def lazy(self, index):
+        return LazyRecord(self, index, self.key_at(index))
+
+    def lazy_record(self, index, key):
+        with self._lock:
+            if self._by_key is not None:
+                index = self._by_key[key]
+            return self.record(index)
+
+    @contextmanager
+    def replacing(self, filename, binary=True):
+        # Файл, отображенный в память, нельзя заменить (Windows), поэтому
+        # на время замены отображение закрывается, а затем открывается новый
+        # файл. Неразобранные записи (LazyRecord) после этого ищутся в нем по
+        # ключу: сжатие журнала пишет в новый снимок все записи, которые еще
+        # не менялись с загрузки. binary=False - новый снимок не двоичный, и
+        # прежнее содержимое файла остается в памяти.
+        with self._lock:
+            data = None if binary else self.mmap[:]
+            self.close()
+            try:
+                yield
+            finally:
+                if data is not None:
+                    self._open(data)
+                else:
+                    with open(filename, 'rb') as f:
+                        self._open(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                    self._by_key = {self.key_at(index): index for index in range(self.count)}
+
+    def record(self, index):
+        data = self.mmap
+        position = self.offsets[index] + LENGTH.size
+        nulls = data[position:position + self.mask_size]
+        absent = data[position + self.mask_size:position + 2 * self.mask_size]
+        position += 2 * self.mask_size
+        values = self.fixed_struct.unpack_from(data, position)
+        position += self.fixed_struct.size
+        record = {}
+        for (i, name, kind), value in zip(self.fixed, values):
+            bit = 1 << (i & 7)
+            if absent[i >> 3] & bit:
+                continue
+            if nulls[i >> 3] & bit:
+                record[name] = None
+            else:
+                record[name] = self.strings[value] if kind == 't' else value
+        for i, name, kind in self.variable:
+            bit = 1 << (i & 7)
+            if absent[i >> 3] & bit:
+                continue
+            if nulls[i >> 3] & bit:
+                record[name] = None
+                continue
+            size, = LENGTH.unpack_from(data, position)
+            position += LENGTH.size
+            value = data[position:position + size].decode()
+            position += size
+            record[name] = value if kind == 's' else json.loads(value)
+        # порядок полей как в схеме, а не "сначала фиксированные"
+        return {name: record[name] for name, _ in self.fields if name in record}
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.record(index)
+
+    def close(self):
+        self.offsets.release()
+        if isinstance(self.mmap, mmap.mmap):
+            self.mmap.close()
+
+
+def to_binary(json_filename, binary_filename, key):
+    from storage.journal import SnapshotReader
+    with open(json_filename, 'r') as f:
+        reader = SnapshotReader(f)
+        records = list(reader)
+    snapshot = dict(reader.meta, records=records)
+    with open(binary_filename, 'wb') as f:
+        dump(snapshot, f, key)
+    return len(records)
+
+
+def to_json(binary_filename, json_filename):
+    with open(binary_filename, 'rb') as f:
+        snapshot = BinarySnapshot(f)
+        try:
+            data = dict(snapshot.meta, next_id=snapshot.next_id, records=list(snapshot))
+        finally:
+            snapshot.close()
+    with open(json_filename, 'w') as f:
+        json.dump(data, f)
+    return len(data['records'])
+
+
+def main(argv=None):
+    # конвертирует только файл снимка; чтобы учесть и журнал операций,
+    # используйте python -m storage.migrate
+    parser = argparse.ArgumentParser(description="Перевод снимка хранилища между JSON и двоичным форматом")
+    parser.add_argument('source')
+    parser.add_argument('target')
+    parser.add_argument('--key', help="ключевое поле записей, например task_id (нужно для перевода в двоичный формат)")
+    args = parser.parse_args(argv)
+    if os.path.exists(args.target):
+        parser.error(f"файл {args.target} уже существует")
+    if is_binary(args.source):
+        count = to_json(args.source, args.target)
+    else:
+        if not args.key:
+            parser.error("для перевода в двоичный формат нужен --key")
+        count = to_binary(args.source, args.target, args.key)
+    print(f"Преобразовано записей: {count} ({args.source} -> {args.target}).")
+
+
+if __name__ == '__main__':
+    main()
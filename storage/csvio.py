@@ -0,0 +1,219 @@
+import csv
+import gzip
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from storage import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BUFFER_SIZE = 1 << 20
+
+
+def _compression(csv_filename):
+    name = csv_filename.lower()
+    if name.endswith('.gz'):
+        return 'gzip'
+    if name.endswith(('.zst', '.zstd')):
+        if zstandard is None:
+            raise ValueError("для файлов .zst нужен пакет zstandard (pip install zstandard)")
+        return 'zstd'
+    return None
+
+
+class _CsvFile:
+    # Текстовый поток CSV поверх файла, сжатого gzip или zstd (по
+    # расширению) или обычного. raw - сам файл на диске: по его позиции
+    # считается прогресс. encoding=None - кодировка по умолчанию для
+    # системы, как у open().
+    def __init__(self, csv_filename, mode, encoding=None):
+        compression = _compression(csv_filename)
+        self.raw = open(csv_filename, mode + 'b', buffering=BUFFER_SIZE)
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode=mode, compresslevel=6)
+        elif compression == 'zstd':
+            if mode == 'r':
+                self.stream = zstandard.ZstdDecompressor().stream_reader(self.raw)
+            else:
+                self.stream = zstandard.ZstdCompressor().stream_writer(self.raw)
+        else:
+            self.stream = self.raw
+        self.text = io.TextIOWrapper(self.stream, encoding=encoding, newline='',
+                                     write_through=compression is None)
+
+    def __enter__(self):
+        return self.text
+
+    def __exit__(self, *exc_info):
+        self.text.close()
+        if not self.raw.closed:
+            self.raw.close()
+
+
+def read_batches(csv_filename, batch_size=10000, progress=None, encoding=None):
+    # строки CSV пачками списков; первая пачка - заголовок
+    total = os.path.getsize(csv_filename)
+    csv_file = _CsvFile(csv_filename, 'r', encoding)
+    with csv_file as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield header
+        while True:
+            batch = list(islice(reader, batch_size))
+            if not batch:
+                break
+            yield batch
+            if progress is not None:
+                progress(len(batch), csv_file.raw.tell(), total)
+
+
+def _read_chunks(csv_filename, batch_size, progress=None, encoding=None):
+    # Заголовок, затем куски текста по batch_size записей вместе с их
+    # количеством. Запись кончается переводом строки вне кавычек: в CSV
+    # кавычки внутри поля удваиваются, поэтому достаточно следить за
+    # четностью их числа.
+    total = os.path.getsize(csv_filename)
+    csv_file = _CsvFile(csv_filename, 'r', encoding)
+    with csv_file as f:
+        header = next(csv.reader(f), None)
+        if header is None:
+            return
+        yield header
+        lines = []
+        count = 0
+        quoted = False
+        for line in f:
+            lines.append(line)
+            if line.count('"') % 2:
+                quoted = not quoted
+            if not quoted:
+                count += 1
+                if count >= batch_size:
+                    yield count, ''.join(lines)
+                    if progress is not None:
+                        progress(count, csv_file.raw.tell(), total)
+                    lines = []
+                    count = 0
+        if lines:
+            count += quoted
+            yield count, ''.join(lines)
+            if progress is not None:
+                progress(count, total, total)
+
+
+def write_rows(csv_filename, header, rows, batch_size=10000, progress=None, encoding=None):
+    # Потоковая запись: строки берутся из итератора пачками и пишутся
+    # writerows, сжатие выбирается по расширению файла.
+    count = 0
+    with metrics.timer('csv.export'), _CsvFile(csv_filename, 'w', encoding) as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            writer.writerows(batch)
+            count += len(batch)
+            if progress is not None:
+                progress(len(batch), None, None)
+    metrics.count('csv.export', records=count)
+    return count
+
+
+def _convert_batch(convert, header, rows, first_line, csv_filename):
+    converted = []
+    width = len(header)
+    for line, row in enumerate(rows, start=first_line):
+        if not row:
+            continue
+        if len(row) < width:
+            row = row + [None] * (width - len(row))
+        try:
+            converted.append(convert(dict(zip(header, row))))
+        except (KeyError, ValueError, TypeError) as e:
+            raise ValueError(f"Ошибка в строке {line} файла {csv_filename}: {e}") from e
+    return converted
+
+
+def _convert_text(convert, header, text, first_line, csv_filename):
+    return _convert_batch(convert, header, csv.reader(io.StringIO(text, newline='')),
+                          first_line, csv_filename)
+
+
+def import_rows(csv_filename, convert, commit, batch_size=10000, workers=None, progress=None, encoding=None):
+    # Все строки сначала проверяются и преобразуются, и только потом
+    # передаются в commit одним вызовом: если хоть одна строка некорректна,
+    # в хранилище не попадает ничего. При workers > 1 файл режется на куски
+    # по границам записей, а разбор и проверка кусков идут в пуле процессов
+    # (convert должна быть функцией уровня модуля или staticmethod, чтобы ее
+    # можно было передать в процесс).
+    started = time.perf_counter()
+    converted = []
+    line = 2
+    with metrics.timer('csv.import.parse'):
+        if not workers or workers <= 1:
+            batches = read_batches(csv_filename, batch_size, progress, encoding)
+            header = next(batches, None)
+            for batch in batches:
+                converted.extend(_convert_batch(convert, header, batch, line, csv_filename))
+                line += len(batch)
+        else:
+            chunks = _read_chunks(csv_filename, batch_size, progress, encoding)
+            header = next(chunks, None)
+            with ProcessPoolExecutor(workers) as executor:
+                pending = []
+                for count, text in chunks:
+                    pending.append(executor.submit(_convert_text, convert, header, text, line, csv_filename))
+                    line += count
+                    # не читаем файл дальше, чем успевают разбирать процессы
+                    while len(pending) >= 2 * workers:
+                        converted.extend(pending.pop(0).result())
+                for future in pending:
+                    converted.extend(future.result())
+    with metrics.timer('csv.import.commit'):
+        commit(converted)
+    if metrics.enabled():
+        metrics.count('csv.import.parse', records=len(converted), bytes_read=os.path.getsize(csv_filename))
+    elapsed = time.perf_counter() - started
+    rate = len(converted) / elapsed if elapsed > 0 else 0.0
+    return len(converted), rate
+
+
+class ProgressPrinter:
+    # печатает ход импорта или экспорта в одну обновляемую строку stderr
+    def __init__(self, label, file=None):
+        self.label = label
+        self.file = file or sys.stderr
+        self.count = 0
+
+    def __call__(self, rows, position, total):
+        self.count += rows
+        if total:
+            print(f"\r{self.label}: {self.count} строк, {position * 100 // total}%", end='', file=self.file)
+        else:
+            print(f"\r{self.label}: {self.count} строк", end='', file=self.file)
+
+    def done(self):
+        if self.count:
+            print(file=self.file)
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = (value or '').strip().lower()
+    if value in ('true', '1', 'да'):
+        return True
+    if value in ('false', '0', 'нет', ''):
+        return False
+    raise ValueError(f"некорректное логическое значение: {value!r}")
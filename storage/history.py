@@ -0,0 +1,325 @@
+import json
+import os
+import tempfile
+
+from storage import metrics
+from storage.records import RecordStore
+from storage.timestamps import now_seconds, format_seconds, parse_seconds
+
+# сколько изменений между контрольными точками
+CHECKPOINT_EVERY = 10000
+# сколько последних контрольных точек хранить вместе с их сегментами (не
+# меньше двух); более старые удаляются, и состояние раньше самой старой из
+# оставшихся уже не восстановить. 0 - хранить всю историю
+KEEP_CHECKPOINTS = 10
+
+
+def change(entries, before=None, mark=None):
+    # Изменение для истории из пачки операций хранилища: [операция, ID,
+    # прежние значения, новые значения]. Прежние значения - вся запись для
+    # delete и только измененные поля для edit; без них изменение
+    # сохраняется в истории, но отменить его нельзя.
+    before = before or [None] * len(entries)
+    result = {'ops': [[op, record_id, old, data] for (op, record_id, data), old in zip(entries, before)]}
+    if mark:
+        result.update(mark)
+    return result
+
+
+def _inverse(ops):
+    # операции, отменяющие изменение, и прежние значения для них
+    entries, before = [], []
+    for op, record_id, old, new in reversed(ops):
+        if op != 'add' and old is None:
+            raise ValueError("Это изменение нельзя отменить: прежние значения не сохранены")
+        if op == 'add':
+            entries.append(('delete', record_id, None))
+        elif op == 'delete':
+            entries.append(('add', record_id, old))
+        else:
+            entries.append(('edit', record_id, old))
+        before.append(new)
+    return entries, before
+
+
+def _apply(records, ops):
+    for op, record_id, _, data in ops:
+        if op == 'add':
+            records[record_id] = dict(data)
+        elif op == 'edit':
+            if record_id in records:
+                records[record_id] = dict(records[record_id], **data)
+        elif op == 'delete':
+            records.pop(record_id, None)
+
+
+def _read(filename, offset=0):
+    # (изменение, смещение после него); недописанная строка - конец файла
+    try:
+        f = open(filename, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            try:
+                value = json.loads(line)
+            except ValueError:
+                return
+            offset += len(line)
+            yield value, offset
+
+
+class History:
+    # История изменений хранилища в каталоге <файл хранилища>.history: сегменты
+    # NNNNNNNNNN.jsonl с изменениями в виде разностей (только затронутые
+    # записи и поля) и контрольные точки NNNNNNNNNN.checkpoint.json -
+    # состояние всех записей перед изменением NNNNNNNNNN. Новая
+    # контрольная точка строится из предыдущей и ее сегмента раз в
+    # CHECKPOINT_EVERY изменений, а не копированием хранилища при каждой
+    # записи. Отмена и повтор - тоже изменения с пометкой undo/redo, так
+    # что история остается линейной и по ней можно восстановить состояние
+    # на любой момент, кроме удаленного по KEEP_CHECKPOINTS. Методы,
+    # которые пишут, вызываются под блокировкой хранилища; load возвращает
+    # записи хранилища, как они лежат на диске.
+    def __init__(self, filename, key, load):
+        # по полному имени файла: у t.json и t.db разные истории
+        self.filename = filename
+        self.directory = filename + '.history'
+        self.key = key
+        self.load = load
+        self._file = None
+        self._reset()
+
+    def _reset(self):
+        self.close()
+        self.segment = None
+        self.offset = 0
+        self.count = 0
+        self.last = 0
+        self.changes = {}
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def _filename(self, number, suffix):
+        return os.path.join(self.directory, f'{number:010d}.{suffix}')
+
+    def _segments(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-6]) for name in names if name.endswith('.jsonl') and name[:-6].isdigit())
+
+    def _track(self, value):
+        # стеки отмены и повтора - по изменениям двух последних сегментов
+        self.last = value['n']
+        self.changes[value['n']] = value
+        if 'undo' in value:
+            # отмененное изменение могло остаться за пределами двух сегментов
+            if self.undo_stack and self.undo_stack[-1] == value['undo']:
+                self.redo_stack.append(self.undo_stack.pop())
+        elif 'redo' in value:
+            if self.redo_stack and self.redo_stack[-1] == value['redo']:
+                self.undo_stack.append(self.redo_stack.pop())
+        else:
+            self.undo_stack.append(value['n'])
+            self.redo_stack.clear()
+
+    def _refresh(self):
+        # Дочитывает изменения, записанные другими процессами. Обычно это
+        # один stat текущего сегмента; каталог перечитывается, только если
+        # сегмента нет или он заполнен и кто-то мог начать следующий.
+        if self.segment is not None:
+            try:
+                size = os.stat(self._filename(self.segment, 'jsonl')).st_size
+            except FileNotFoundError:
+                size = None
+            if size is not None:
+                if size != self.offset:
+                    self._read_segment()
+                if self.count < CHECKPOINT_EVERY:
+                    return
+        segments = self._segments()
+        if not segments:
+            self._reset()
+            return
+        if segments[-1] != self.segment:
+            self._reset()
+            if len(segments) > 1:
+                for value, _ in _read(self._filename(segments[-2], 'jsonl')):
+                    self._track(value)
+            self.segment = segments[-1]
+        self._read_segment()
+
+    def _read_segment(self):
+        for value, self.offset in _read(self._filename(self.segment, 'jsonl'), self.offset):
+            self._track(value)
+            self.count += 1
+
+    def _replace(self, filename, write):
+        fd, tmp_filename = tempfile.mkstemp(prefix='history.', suffix='.tmp', dir=self.directory)
+        try:
+            # mkstemp создает файл с правами 0600, а права должны быть как у хранилища
+            os.chmod(tmp_filename, os.stat(self.filename).st_mode if os.path.exists(self.filename) else 0o644)
+            with os.fdopen(fd, 'w') as f:
+                write(f)
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+    def _write_checkpoint(self, number, moment, records):
+        self._replace(self._filename(number, 'checkpoint.json'),
+                      lambda f: json.dump({'n': number, 't': moment, 'records': records}, f))
+        # пустой сегмент создается после точки: по нему видно, что она готова
+        self.close()
+        open(self._filename(number, 'jsonl'), 'a').close()
+        with open(os.path.join(self.directory, 'checkpoints.jsonl'), 'a') as f:
+            f.write(json.dumps({'n': number, 't': moment}) + '\n')
+        self.segment, self.offset, self.count = number, 0, 0
+
+    @metrics.instrumented('history.checkpoint')
+    def _checkpoint(self):
+        records = {data[self.key]: data for data in self._state(self.segment)}
+        for value, _ in _read(self._filename(self.segment, 'jsonl')):
+            _apply(records, value['ops'])
+        first = self.segment
+        self._write_checkpoint(self.last + 1, self.changes[self.last]['t'], list(records.values()))
+        # в памяти, как и после перечитывания, - только два последних сегмента
+        self.changes = {number: value for number, value in self.changes.items() if number >= first}
+        self.undo_stack = [number for number in self.undo_stack if number >= first]
+        self.redo_stack = [number for number in self.redo_stack if number >= first]
+        self._prune()
+
+    def _prune(self):
+        segments = self._segments()
+        if not KEEP_CHECKPOINTS or len(segments) <= max(KEEP_CHECKPOINTS, 2):
+            return
+        first = segments[-max(KEEP_CHECKPOINTS, 2)]
+        # сначала список точек, чтобы as_of не выбрал уже удаленную
+        index = os.path.join(self.directory, 'checkpoints.jsonl')
+        kept = [value for value, _ in _read(index) if value['n'] >= first]
+        self._replace(index, lambda f: f.writelines(json.dumps(value) + '\n' for value in kept))
+        for number in segments:
+            if number >= first:
+                break
+            for suffix in ('checkpoint.json', 'jsonl'):
+                try:
+                    os.remove(self._filename(number, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _state(self, number):
+        with open(self._filename(number, 'checkpoint.json'), 'r') as f:
+            return json.load(f)['records']
+
+    def write(self, changes):
+        self._refresh()
+        if self.segment is None:
+            # первая запись: точка отсчета - данные на диске до нее
+            os.makedirs(self.directory, exist_ok=True)
+            self._write_checkpoint(1, now_seconds(), [dict(data) for data in self.load()])
+        lines = []
+        moment = now_seconds()
+        for value in changes:
+            value = dict(value, n=self.last + 1, t=moment)
+            self._track(value)
+            lines.append(json.dumps(value, ensure_ascii=False) + '\n')
+        data = ''.join(lines).encode()
+        if self._file is None:
+            # сегмент остается открытым до следующей контрольной точки
+            self._file = open(self._filename(self.segment, 'jsonl'), 'ab')
+        self._file.write(data)
+        self._file.flush()
+        # перед записью сегмент дочитан до конца, а пишем под блокировкой
+        self.offset += len(data)
+        self.count += len(lines)
+        metrics.count('history.write', records=len(lines))
+        if self.count >= CHECKPOINT_EVERY:
+            self._checkpoint()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def undo(self):
+        # (операции, прежние значения, пометка) для отмены последнего
+        # изменения или None, если отменять нечего
+        self._refresh()
+        if not self.undo_stack:
+            return None
+        number = self.undo_stack[-1]
+        entries, before = _inverse(self.changes[number]['ops'])
+        return entries, before, {'undo': number}
+
+    def redo(self):
+        self._refresh()
+        if not self.redo_stack:
+            return None
+        number = self.redo_stack[-1]
+        ops = self.changes[number]['ops']
+        return [(op, record_id, data) for op, record_id, _, data in ops], \
+            [old for _, _, old, _ in ops], {'redo': number}
+
+    @metrics.instrumented('history.as_of')
+    def as_of(self, moment):
+        # записи в том виде, в каком они были в момент moment (секунды,
+        # как в storage.timestamps): ближайшая предшествующая контрольная
+        # точка плюс изменения после нее
+        checkpoints = [value for value, _ in _read(os.path.join(self.directory, 'checkpoints.jsonl'))]
+        if not checkpoints:
+            raise ValueError("История изменений еще не ведется")
+        start = None
+        for checkpoint in checkpoints:
+            if checkpoint['t'] > moment:
+                break
+            start = checkpoint['n']
+        if start is None:
+            raise ValueError(f"История изменений начинается с {format_seconds(checkpoints[0]['t'])}")
+        records = {data[self.key]: data for data in self._state(start)}
+        for number in self._segments():
+            if number < start:
+                continue
+            for value, _ in _read(self._filename(number, 'jsonl')):
+                if value['t'] > moment:
+                    return list(records.values())
+                _apply(records, value['ops'])
+        return list(records.values())
+
+
+def revert(manager, redo=False):
+    # Отменяет (redo=True - повторяет) последнее изменение в хранилище
+    # менеджера и применяет его к данным в памяти так же, как операции
+    # других процессов. Стоит столько, сколько операций в изменении, а не
+    # сколько записей в хранилище. Возвращает число операций, 0 - если
+    # отменять нечего.
+    storage = manager.storage
+    if storage.history is None:
+        raise ValueError("История изменений не ведется")
+    # отложенные операции должны попасть в историю до того, как ее читать
+    storage.flush()
+    with storage.writing():
+        step = storage.history.redo() if redo else storage.history.undo()
+        if step is None:
+            return 0
+        entries, before, mark = step
+        storage.append_many(entries, before, mark)
+        manager._apply_changes(entries)
+    storage.flush()
+    return len(entries)
+
+
+def records_at(storage, key, factory, moment):
+    # RecordStore с записями на момент moment - секунды или строка
+    # ДД-ММ-ГГГГ [ЧЧ:ММ] (дата без времени - конец дня)
+    if storage.history is None:
+        raise ValueError("История изменений не ведется")
+    if isinstance(moment, str):
+        moment = parse_seconds(moment)
+    records = storage.history.as_of(moment)
+    return RecordStore(key, factory, lambda: (records, 1))
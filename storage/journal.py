@@ -0,0 +1,403 @@
+import json
+import os
+import re
+import tempfile
+import threading
+
+from storage import binary, metrics
+from storage.base import BaseStore
+from storage.locking import FileLock
+
+WHITESPACE = re.compile(r'[ \t\r\n]*')
+LOAD_RETRIES = 3
+
+
+class SnapshotReader:
+    # Потоковое чтение снимка: записи разбираются по одной из блоков файла,
+    # поэтому весь текст JSON никогда не держится в памяти целиком.
+    # Понимает оба формата - список записей и {"next_id": ..., "records": [...]};
+    # остальные ключи объекта попадают в meta.
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.meta = {}
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Некорректный снимок: ожидался символ {char!r}")
+        self.pos += 1
+
+    def _value(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buffer) and not self.eof and self._fill():
+                # число могло оборваться на границе блока
+                continue
+            self.pos = end
+            return value
+
+    def _array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            self._peek()
+            yield self._value()
+            char = self._peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError("Некорректный снимок: ожидался символ ','")
+
+    def __iter__(self):
+        char = self._peek()
+        if char == '[':
+            yield from self._array()
+        elif char == '{':
+            self.pos += 1
+            while self._peek() != '}':
+                key = self._value()
+                self._expect(':')
+                if key == 'records':
+                    yield from self._array()
+                else:
+                    self._peek()
+                    self.meta[key] = self._value()
+                if self._peek() == ',':
+                    self.pos += 1
+            self.pos += 1
+        elif char:
+            raise ValueError("Некорректный снимок")
+
+
+class Journal(BaseStore):
+    # Хранилище "снимок + журнал операций": снимок - JSON-файл вида
+    # {"next_id": ..., "records": [...]} (старый формат - просто список
+    # записей - тоже читается), рядом с ним лежит <filename>.log, куда
+    # дописывается по одной строке на каждую операцию add/edit/delete.
+    # При загрузке журнал проигрывается поверх снимка, а когда в журнале
+    # набирается compact_every операций (и не меньше, чем записей в снимке,
+    # чтобы перезапись снимка оставалась амортизированно O(1) на операцию),
+    # снимок переписывается в фоновом потоке и журнал начинается заново.
+    #
+    # С одними файлами могут работать несколько процессов. Писатели
+    # сериализуются блокировкой <filename>.lock и перед записью дочитывают
+    # операции, добавленные другими (они передаются в on_change; None
+    # означает, что данные нужно перечитать целиком). Читатели блокировку не
+    # берут: если файлы изменились во время чтения, чтение повторяется.
+    # Снимок пишется во временный файл и подменяется атомарно, а сжатие в
+    # каждый момент выполняет только один процесс.
+    #
+    # Если имя файла оканчивается на .bin, снимок пишется в двоичном формате
+    # storage.binary; читается снимок в любом формате - по сигнатуре файла.
+    def __init__(self, filename, key, snapshot, compact_every=1000, on_change=None, binary_format=None):
+        super().__init__(filename, key, snapshot, on_change)
+        self.log_filename = filename + '.log'
+        self.old_log_filename = self.log_filename + '.old'
+        self.compact_every = compact_every
+        if binary_format is None:
+            binary_format = filename.lower().endswith(binary.BINARY_EXTENSIONS)
+        self.binary_format = binary_format
+        self.pending = 0
+        self.snapshot_size = 0
+        self._lock = threading.Lock()
+        self._compact_lock = FileLock(filename + '.compact.lock', reentrant=False)
+        self._compactor = None
+        # снимок, из которого лениво читаются записи последней загрузки
+        self._binary_snapshot = None
+
+    @metrics.instrumented('journal.load')
+    def load(self, lazy=False):
+        # lazy: записи двоичного снимка возвращаются неразобранными
+        # (binary.LazyRecord), поля читаются при первом обращении
+        for _ in range(LOAD_RETRIES):
+            signature = self._stat()
+            records = self._read(lazy)
+            if self._stat() == signature:
+                break
+        else:
+            # файлы все время меняются: читаем под блокировкой писателей
+            with self._file_lock:
+                signature = self._stat()
+                records = self._read(lazy)
+        self._signature = signature
+        self.snapshot_size = len(records)
+        if metrics.enabled():
+            metrics.count('journal.load', records=len(records),
+                          bytes_read=sum(stat[2] for stat in signature if stat))
+        return list(records.values())
+
+    def _read(self, lazy=False):
+        records = {}
+        self.next_id = 1
+        if binary.is_binary(self.filename):
+            with metrics.timer('journal.load.snapshot'), open(self.filename, 'rb') as f:
+                snapshot = binary.BinarySnapshot(f)
+                if lazy:
+                    for index in range(len(snapshot)):
+                        record = snapshot.lazy(index)
+                        records[record.key] = record
+                    self._binary_snapshot = snapshot
+                else:
+                    for data in snapshot:
+                        records[data[self.key]] = data
+                    snapshot.close()
+            self.next_id = snapshot.next_id
+        elif os.path.exists(self.filename):
+            with metrics.timer('journal.load.snapshot'), open(self.filename, 'r') as f:
+                reader = SnapshotReader(f)
+                for data in reader:
+                    # старые файлы заметок сохранялись без note_id
+                    data.setdefault(self.key, len(records) + 1)
+                    records[data[self.key]] = data
+            self.next_id = reader.meta.get('next_id', 1)
+        self.pending = 0
+        with metrics.timer('journal.load.replay'):
+            for log_filename in (self.old_log_filename, self.log_filename):
+                for op, record_id, data in self._entries(log_filename):
+                    self.apply(records, op, record_id, data)
+                    self.pending += 1
+        self.next_id = max(self.next_id, max(records, default=0) + 1)
+        return records
+
+    def _stat(self):
+        signature = []
+        for filename in (self.filename, self.log_filename, self.old_log_filename):
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                signature.append(None)
+            else:
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return signature
+
+    def changed_on_disk(self):
+        # изменились ли файлы с момента загрузки кем-то, кроме нас самих
+        return self._signature is not None and self._stat() != self._signature
+
+    def _entries(self, log_filename, offset=0):
+        try:
+            f = open(log_filename, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # недописанная последняя строка после аварийного завершения
+                    break
+                if entry['op'] in ('add', 'reserve') and entry['id'] >= self.next_id:
+                    self.next_id = entry['id'] + 1
+                if entry['op'] == 'reserve':
+                    # ID, выданный другим процессом, чьи записи еще не дописаны
+                    continue
+                yield entry['op'], entry['id'], entry.get('data')
+
+    def _sync(self):
+        # Вызывается под блокировкой писателей: подтягивает операции других
+        # процессов, сделанные после нашей последней загрузки или записи.
+        if self._signature is None:
+            return
+        current = self._stat()
+        if current == self._signature:
+            return
+        snapshot, log, old_log = current
+        known_snapshot, known_log, known_old_log = self._signature
+        changes = None
+        if snapshot == known_snapshot and old_log == known_old_log and log is not None:
+            # снимок не переписывался: достаточно дочитать хвост журнала
+            if known_log is None:
+                changes = list(self._entries(self.log_filename))
+            elif log[0] == known_log[0] and log[2] >= known_log[2]:
+                changes = list(self._entries(self.log_filename, known_log[2]))
+        self._signature = current
+        if changes is None:
+            # журнал успели свернуть: разницу не восстановить, только перечитать
+            self._signature = None
+            if self.on_change is not None:
+                self.on_change(None)
+            self._notify(None)
+            return
+        self.pending += len(changes)
+        if changes and self.on_change is not None:
+            self.on_change(changes)
+        if changes:
+            self._notify(changes)
+
+    @staticmethod
+    def apply(records, op, record_id, data):
+        if op == 'add':
+            records[record_id] = data
+        elif op == 'edit':
+            value = records.get(record_id)
+            if value is not None:
+                if type(value) is not dict:
+                    value = records[record_id] = value.to_dict()
+                value.update(data)
+        elif op == 'delete':
+            records.pop(record_id, None)
+
+    def _write(self, entries):
+        entries, changes = self._split_history(entries)
+        with metrics.timer('journal.append.serialize'):
+            lines = ''.join(json.dumps({'op': op, 'id': record_id, 'data': data}) + '\n'
+                            for op, record_id, data in entries)
+        with self._file_lock:
+            if self._file_lock.depth == 1:
+                # внутри writing() синхронизация уже сделана
+                self._sync()
+            if changes:
+                self.history.write(changes)
+            with self._lock:
+                with metrics.timer('journal.append.write'), open(self.log_filename, 'a') as f:
+                    f.write(lines)
+                metrics.count('journal.append.write', records=len(entries), bytes_written=len(lines))
+                self.pending += len(entries)
+                self._track_written(entries)
+                if self._signature is not None:
+                    self._signature = self._stat()
+        if self.pending >= max(self.compact_every, self.snapshot_size):
+            self.compact()
+
+    def _write_reservation(self, record_id):
+        line = json.dumps({'op': 'reserve', 'id': record_id}) + '\n'
+        with self._lock:
+            with open(self.log_filename, 'a') as f:
+                f.write(line)
+            self.pending += 1
+            if self._signature is not None:
+                self._signature = self._stat()
+
+    def compact(self, background=True):
+        with self._file_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            if not self._compact_lock.acquire(blocking=False):
+                # снимок сейчас переписывает другой процесс
+                return
+            try:
+                self._sync()
+                # снимок данных берется здесь, в вызывающем потоке, поэтому
+                # фоновая запись не видит последующих изменений списка
+                with metrics.timer('journal.compact.collect'):
+                    records = self.snapshot()
+                with self._lock:
+                    self.snapshot_size = len(records['records'] if isinstance(records, dict) else records)
+                    self._rotate_log()
+                    self.pending = 0
+                    self._signature = self._stat()
+                self._compactor = threading.Thread(target=self._write_snapshot, args=(records,))
+                try:
+                    self._compactor.start()
+                except RuntimeError:
+                    # при завершении интерпретатора новые потоки не запускаются
+                    self._compactor = None
+                    self._write_snapshot(records)
+            except BaseException:
+                self._compact_lock.release()
+                raise
+        if not background:
+            self.wait()
+
+    def _rotate_log(self):
+        if not os.path.exists(self.log_filename):
+            return
+        if os.path.exists(self.old_log_filename):
+            # остался от прерванного сжатия: его операции старше текущего журнала
+            with open(self.log_filename, 'rb') as source, open(self.old_log_filename, 'ab') as target:
+                target.write(source.read())
+            os.remove(self.log_filename)
+        else:
+            os.replace(self.log_filename, self.old_log_filename)
+
+    @metrics.instrumented('journal.snapshot.write')
+    def _write_snapshot(self, records):
+        try:
+            directory, name = os.path.split(self.filename)
+            fd, tmp_filename = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or '.')
+            try:
+                # mkstemp создает файл с правами 0600, а снимок должен сохранить прежние
+                os.chmod(tmp_filename, os.stat(self.filename).st_mode if os.path.exists(self.filename) else 0o644)
+                with os.fdopen(fd, 'wb' if self.binary_format else 'w') as f:
+                    if self.binary_format:
+                        binary.dump(records, f, self.key)
+                    else:
+                        json.dump(records, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if metrics.enabled():
+                    metrics.count('journal.snapshot.write', records=self.snapshot_size,
+                                  bytes_written=os.path.getsize(tmp_filename))
+                with self._file_lock:
+                    mapped = self._binary_snapshot
+                    if mapped is None:
+                        os.replace(tmp_filename, self.filename)
+                    else:
+                        with mapped.replacing(self.filename, self.binary_format):
+                            os.replace(tmp_filename, self.filename)
+                    if os.path.exists(self.old_log_filename):
+                        os.remove(self.old_log_filename)
+                    with self._lock:
+                        if self._signature is not None:
+                            # чужие операции в журнале мы еще не прочитали
+                            snapshot, _, old_log = self._stat()
+                            self._signature = [snapshot, self._signature[1], old_log]
+            except BaseException:
+                if os.path.exists(tmp_filename):
+                    os.remove(tmp_filename)
+                raise
+        finally:
+            self._compact_lock.release()
+
+    def save(self):
+        self.flush()
+        self.wait()
+        self.compact(background=False)
+
+    def wait(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def close(self):
+        if self._write_behind is not None:
+            self._write_behind.close()
+            self._write_behind = None
+        self.wait()
+        self._file_lock.close()
+        self._compact_lock.close()
+        if self._binary_snapshot is not None:
+            self._binary_snapshot.close()
+            self._binary_snapshot = None
+        if self.history is not None:
+            self.history.close()
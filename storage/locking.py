@@ -0,0 +1,100 @@
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+class ConflictError(ValueError):
+    pass
+
+
+class FileLock:
+    # Межпроцессная рекомендательная блокировка на отдельном файле:
+    # flock на Unix, msvcrt.locking на Windows. Потоки одного процесса
+    # сериализуются обычной блокировкой; при reentrant=True поток, уже
+    # владеющий блокировкой, может войти в нее повторно. Нереентерабельную
+    # блокировку можно освободить из другого потока - так фоновое сжатие
+    # журнала отпускает блокировку, взятую основным потоком.
+    def __init__(self, filename, reentrant=True):
+        self.filename = filename
+        self._thread_lock = threading.RLock() if reentrant else threading.Lock()
+        self.depth = 0
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if self.depth == 0:
+            try:
+                locked = self._lock_file(blocking)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            if not locked:
+                self._thread_lock.release()
+                return False
+        self.depth += 1
+        return True
+
+    def _lock_file(self, blocking):
+        if self._file is None:
+            self._file = open(self.filename, 'a+')
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(self._file.fileno(), flags)
+            except BlockingIOError:
+                return False
+        elif msvcrt is not None:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        return False
+                    # LK_LOCK сдается через 10 секунд, поэтому ждем сами
+                    time.sleep(0.05)
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def close(self):
+        if self._file is not None and self.depth == 0:
+            self._file.close()
+            self._file = None
+
+
+def check_conflicts(seen, current, wanted):
+    # Оптимистическая проверка правки: seen - запись такой, какой ее видел
+    # пользователь, current - она же после подтягивания чужих изменений,
+    # wanted - новые значения полей. Правки разных полей сливаются, а поле,
+    # которое другой процесс успел поменять на иное значение, - конфликт.
+    conflicts = [name for name, value in wanted.items()
+                 if seen.get(name) != current.get(name) and current.get(name) != value]
+    if conflicts:
+        raise ConflictError(f"Запись изменена другим процессом (поля: {', '.join(conflicts)}), "
+                            f"обновите данные и повторите правку")
@@ -0,0 +1,268 @@
+import atexit
+import cProfile
+import contextlib
+import fnmatch
+import functools
+import io
+import json
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+# Встроенные метрики: счетчики и гистограммы времени по операциям
+# (загрузка, сохранение, поиск...), объем прочитанных и записанных данных,
+# число затронутых записей, а для выбранных операций - профиль cProfile и
+# пик памяти tracemalloc. По умолчанию все выключено, и инструментированный
+# вызов стоит одну проверку флага.
+#
+# Включается вызовом enable() или переменными окружения:
+#   PA_METRICS=1           - собирать и вывести сводку в stderr при выходе
+#   PA_METRICS=stats.json  - собирать и сохранить сводку в файл при выходе
+#   PA_PROFILE=tasks.*     - профилировать операции по маскам через запятую
+#   PA_TRACEMALLOC=notes.search - измерять пик памяти операций по маскам
+# На Unix сводку можно получить в любой момент сигналом SIGUSR1.
+
+_enabled = False
+_lock = threading.Lock()
+_stats = {}
+_profile_patterns = ()
+_trace_patterns = ()
+_matches = {}
+_profilers = {}
+_profiling = False
+_null = contextlib.nullcontext()
+
+
+class _Stat:
+    __slots__ = ('calls', 'total', 'max', 'histogram', 'counters', 'peak_memory')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        # корзина i - вызовы длительностью меньше 2**i микросекунд
+        self.histogram = {}
+        self.counters = {}
+        self.peak_memory = 0
+
+    def observe(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        bucket = int(elapsed * 1e6).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+            'histogram_us': {f'<{1 << bucket}': count for bucket, count in sorted(self.histogram.items())},
+            'counters': dict(self.counters),
+            'peak_memory_kb': round(self.peak_memory / 1024, 1) if self.peak_memory else None,
+        }
+
+
+def _stat(name):
+    stat = _stats.get(name)
+    if stat is None:
+        stat = _stats[name] = _Stat()
+    return stat
+
+
+def enabled():
+    return _enabled
+
+
+def enable(profile=(), trace_memory=(), dump_on_exit=None):
+    # profile и trace_memory - маски имен операций в стиле fnmatch;
+    # dump_on_exit - имя JSON-файла или '-' для вывода в stderr
+    global _enabled, _profile_patterns, _trace_patterns
+    _profile_patterns = tuple(profile)
+    _trace_patterns = tuple(trace_memory)
+    _matches.clear()
+    _enabled = True
+    if dump_on_exit:
+        atexit.register(_dump_on_exit, dump_on_exit)
+    if hasattr(signal, 'SIGUSR1'):
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: _dump_in_background())
+        except ValueError:
+            # обработчик сигнала можно поставить только из главного потока
+            pass
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _profilers.clear()
+
+
+def _dump_in_background():
+    # Обработчик сигнала выполняется в главном потоке между любыми двумя
+    # инструкциями, в том числе пока тот держит _lock в record() или _call();
+    # dump() там же ждал бы _lock вечно. Поэтому сводка выводится из
+    # отдельного потока, который дождется, пока главный отпустит блокировку.
+    thread = threading.Thread(target=dump, daemon=True)
+    thread.start()
+    return thread
+
+
+def _dump_on_exit(target):
+    if target == '-':
+        dump()
+    else:
+        save(target)
+
+
+def _match(name):
+    result = _matches.get(name)
+    if result is None:
+        result = _matches[name] = (
+            any(fnmatch.fnmatchcase(name, pattern) for pattern in _profile_patterns),
+            any(fnmatch.fnmatchcase(name, pattern) for pattern in _trace_patterns))
+    return result
+
+
+def record(name, elapsed, **counters):
+    with _lock:
+        stat = _stat(name)
+        stat.observe(elapsed)
+        for counter, value in counters.items():
+            stat.counters[counter] = stat.counters.get(counter, 0) + value
+
+
+def count(name, **counters):
+    # счетчики без замера времени: байты, записи и т.п.
+    if not _enabled:
+        return
+    with _lock:
+        stat = _stat(name)
+        for counter, value in counters.items():
+            stat.counters[counter] = stat.counters.get(counter, 0) + value
+
+
+@contextlib.contextmanager
+def _timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timer(name):
+    # замер участка кода внутри операции, например сериализации или записи
+    return _timer(name) if _enabled else _null
+
+
+def _call(name, func, args, kwargs):
+    global _profiling
+    profile, trace = _match(name)
+    profiler = None
+    if profile and not _profiling:
+        # вложенные профилировщики cProfile не поддерживает
+        with _lock:
+            profiler = _profilers.get(name)
+            if profiler is None:
+                profiler = _profilers[name] = cProfile.Profile()
+        _profiling = True
+    started_tracing = False
+    if trace:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        if profiler is not None:
+            return profiler.runcall(func, *args, **kwargs)
+        return func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            _profiling = False
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            if started_tracing:
+                tracemalloc.stop()
+        with _lock:
+            stat = _stat(name)
+            stat.observe(elapsed)
+            if peak > stat.peak_memory:
+                stat.peak_memory = peak
+
+
+def instrumented(name):
+    # декоратор операции: время и число вызовов, при необходимости профиль
+    # и пик памяти; при выключенных метриках вызывает функцию напрямую
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            return _call(name, func, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    with _lock:
+        return {name: stat.to_dict() for name, stat in sorted(_stats.items())}
+
+
+def profile_report(name, limit=20):
+    profiler = _profilers.get(name)
+    if profiler is None:
+        return ''
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def dump(file=None):
+    file = file or sys.stderr
+    stats = snapshot()
+    print(f"{'операция':<28} {'вызовов':>8} {'всего, мс':>11} {'сред., мс':>10} {'макс., мс':>10}  счетчики",
+          file=file)
+    for name, stat in stats.items():
+        counters = ', '.join(f'{key}={value}' for key, value in sorted(stat['counters'].items()))
+        if stat['peak_memory_kb'] is not None:
+            counters = f"{counters}, пик памяти={stat['peak_memory_kb']} КБ".lstrip(', ')
+        print(f"{name:<28} {stat['calls']:>8} {stat['total_ms']:>11.3f} {stat['mean_ms']:>10.3f} "
+              f"{stat['max_ms']:>10.3f}  {counters}", file=file)
+    for name in sorted(_profilers):
+        print(f"\nПрофиль {name}:\n{profile_report(name)}", file=file)
+
+
+def save(filename):
+    with open(filename, 'w') as f:
+        json.dump(snapshot(), f, indent=2, ensure_ascii=False)
+
+
+def _split(value):
+    return [pattern.strip() for pattern in value.split(',') if pattern.strip()]
+
+
+def _configure_from_environment():
+    target = os.environ.get('PA_METRICS')
+    profile = _split(os.environ.get('PA_PROFILE', ''))
+    trace_memory = _split(os.environ.get('PA_TRACEMALLOC', ''))
+    if target or profile or trace_memory:
+        enable(profile, trace_memory, '-' if target in (None, '', '1') else target)
+
+
+_configure_from_environment()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import shutil
+
+from storage.backends import open_store
+from task.task_manager import TASK_SCHEMA
+from notes.note import NOTE_SCHEMA
+from contacts.contact import CONTACT_SCHEMA
+from finance.finance_manager import FINANCE_SCHEMA
+
+KINDS = {
+    'tasks': ('task_id', TASK_SCHEMA),
+    'notes': ('note_id', NOTE_SCHEMA),
+    'contacts': ('contact_id', CONTACT_SCHEMA),
+    'finance': ('record_id', FINANCE_SCHEMA),
+}
+
+
+def migrate(kind, source, target):
+    # Переносит все записи из одного хранилища в другое (JSON, двоичный
+    # снимок *.bin, SQLite), тип хранилища определяется по расширению файла.
+    if os.path.exists(target):
+        raise FileExistsError(f"Файл {target} уже существует")
+    key, schema = KINDS[kind]
+    source_store = open_store(source, key, None, schema)
+    records = source_store.load()
+    snapshot = {'next_id': source_store.next_id, 'records': records}
+    target_store = open_store(target, key, lambda: snapshot, schema)
+    target_store.save()
+    source_store.close()
+    target_store.close()
+    # данные в обоих хранилищах одинаковые, поэтому история продолжается
+    history = source + '.history'
+    if os.path.isdir(history) and not os.path.exists(target + '.history'):
+        shutil.copytree(history, target + '.history')
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос данных между хранилищами JSON, двоичным снимком и SQLite")
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('source')
+    parser.add_argument('target')
+    args = parser.parse_args()
+    count = migrate(args.kind, args.source, args.target)
+    print(f"Перенесено записей: {count} ({args.source} -> {args.target}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import base64
+import bisect
+import heapq
+import json
+
+
+def encode_cursor(position):
+    text = json.dumps(position, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # курсор - позиция последней показанной записи [значение сортировки, ID]
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError as e:
+        raise ValueError("Некорректный курсор") from e
+    if not isinstance(position, list) or len(position) != 2 or type(position[1]) is not int:
+        raise ValueError("Некорректный курсор")
+    return tuple(position)
+
+
+def _after(ids, start, reverse):
+    # ID из упорядоченной последовательности, идущие после start
+    if reverse:
+        end = len(ids) if start is None else bisect.bisect_left(ids, start)
+        return (ids[i] for i in range(end - 1, -1, -1))
+    begin = 0 if start is None else bisect.bisect_right(ids, start)
+    return (ids[i] for i in range(begin, len(ids)))
+
+
+def _sorted_keys(records, order):
+    # (значение сортировки, ID) всех записей по возрастанию. Список строится
+    # один раз на версию хранилища (BaseStore.version меняется с каждой
+    # пачкой операций, своих и чужих) и переиспользуется следующими
+    # страницами
+    version = records.store.version
+    cached = records.orders.get(order)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    key = records.key
+    keys = sorted((order(record), getattr(record, key)) for record in records)
+    records.orders[order] = (version, keys)
+    return keys
+
+
+def page(records, limit=20, cursor=None, where=None, order=None, reverse=False, ids=None):
+    # Одна страница записей RecordStore: (записи, курсор следующей страницы
+    # или None). where - фильтр записей, order - значение сортировки
+    # (число или строка), ids - возрастающие ID, среди которых искать
+    # (например, из индекса). Без order записи идут по ID, и страница
+    # стоит O(limit) плюс пропущенные фильтром записи. С order записи
+    # хранилища сортируются один раз, пока оно не изменится, а страница
+    # находится по курсору бинарным поиском; по подмножеству ids (или без
+    # хранилища) выбираются limit лучших за один проход кучей.
+    if limit < 1:
+        raise ValueError("Размер страницы должен быть положительным")
+    after = decode_cursor(cursor) if cursor else None
+    if order is None or (ids is None and records.store is not None):
+        if order is None:
+            if after is not None and after[0] is not None:
+                raise ValueError("Курсор получен для другой сортировки")
+            source = records.sorted_ids() if ids is None else ids
+            positions = ((None, record_id) for record_id in _after(source, after and after[1], reverse))
+        else:
+            positions = _after(_sorted_keys(records, order), after, reverse)
+        items = []
+        try:
+            for position in positions:
+                record = records.get(position[1])
+                if record is None or (where is not None and not where(record)):
+                    continue
+                items.append((position, record))
+                if len(items) > limit:
+                    break
+        except TypeError as e:
+            if after is None:
+                raise
+            raise ValueError("Курсор получен для другой сортировки") from e
+    else:
+        key = records.key
+        candidates = records if ids is None else (records.get(record_id) for record_id in ids)
+        items = (((order(record), getattr(record, key)), record) for record in candidates
+                 if record is not None and (where is None or where(record)))
+        if after is not None:
+            items = (item for item in items if (item[0] < after if reverse else item[0] > after))
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        try:
+            items = select(limit + 1, items, key=lambda item: item[0])
+        except TypeError as e:
+            if after is None:
+                raise
+            raise ValueError("Курсор получен для другой сортировки") from e
+    next_cursor = encode_cursor(list(items[limit - 1][0])) if len(items) > limit else None
+    return [record for _, record in items[:limit]], next_cursor
+
+
+def pages(records, limit=20, cursor=None, **options):
+    # генератор страниц; следующая страница запрашивается, только когда нужна
+    while True:
+        items, cursor = page(records, limit, cursor, **options)
+        yield items, cursor
+        if cursor is None:
+            return
+
+
+def browse(pages, show):
+    # постраничный вывод в интерактивных меню
+    shown = 0
+    for items, cursor in pages:
+        for item in items:
+            show(item)
+        shown += len(items)
+        if cursor is None:
+            break
+        answer = input(f"Показано записей: {shown}. Enter - следующая страница, q - вернуться в меню: ")
+        if answer.strip().lower() == 'q':
+            break
+    if not shown:
+        print("Записей нет.")
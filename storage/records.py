@@ -0,0 +1,227 @@
+import bisect
+
+from storage.binary import LazyRecord
+
+
+class RecordStore:
+    # Упорядоченная коллекция записей с индексом по первичному ключу.
+    # Записи обходятся по возрастанию ID, поиск, замена и удаление по ID
+    # выполняются за O(1). next_id только растет, поэтому ID удаленных
+    # записей никогда не выдаются повторно.
+    #
+    # Данные читаются из хранилища функцией loader при первом обращении, а
+    # объекты строятся из словарей (или неразобранных записей двоичного
+    # снимка) функцией factory только тогда, когда запись действительно
+    # понадобилась.
+    #
+    # store - хранилище, в котором другие процессы могли выдать ID позже
+    # загрузки (см. BaseStore.reserve); выдача ID учитывает и его next_id.
+    def __init__(self, key, factory=None, loader=None, store=None):
+        self.key = key
+        self.factory = factory
+        self.loader = loader
+        self.store = store
+        self._records = {}
+        self._next_id = 1
+        self._ids = None
+        # False - запись добавлена не в конец (например, отменено удаление),
+        # и обход идет по списку sorted_ids, а не по порядку в словаре
+        self._ordered = True
+        # отсортированные ключи для storage.query.page: {order: (версия, ключи)}
+        self.orders = {}
+        self.loaded = loader is None
+
+    def load(self):
+        if self.loaded:
+            return
+        records, next_id = self.loader()
+        last = 0
+        for data in records:
+            record_id = data[self.key]
+            self._records[record_id] = data
+            if record_id < last:
+                # в журнале есть возвращенная запись с прежним ID
+                self._ordered = False
+            last = record_id
+        if not self._ordered:
+            self._ids = sorted(self._records)
+        self._next_id = max(next_id, max(self._records, default=0) + 1)
+        self.loaded = True
+
+    def _materialize(self, record_id, value):
+        if type(value) is dict:
+            value = self.factory(value)
+            self._records[record_id] = value
+        elif type(value) is LazyRecord:
+            value = self.factory(value.to_dict())
+            self._records[record_id] = value
+        return value
+
+    @property
+    def next_id(self):
+        self.load()
+        return self._next_id
+
+    def allocate_id(self, count=1):
+        self.load()
+        if self.store is not None:
+            self._next_id = max(self._next_id, self.store.next_id)
+        first_id = self._next_id
+        self._next_id += count
+        if self.store is not None:
+            self.store.reserve(self._next_id - 1)
+        return first_id
+
+    def sorted_ids(self):
+        # возрастающие ID для постраничного обхода; список строится при первом
+        # запросе, а дальше поддерживается при добавлении и удалении записей
+        self.load()
+        if self._ids is None:
+            self._ids = sorted(self._records)
+        return self._ids
+
+    def _track(self, record_id, added):
+        # вызывается до вставки записи в словарь и после удаления из него
+        if added and self._ordered and self._records and record_id < next(reversed(self._records)):
+            self.sorted_ids()
+            self._ordered = False
+        if self._ids is None:
+            return
+        if added:
+            if not self._ids or record_id > self._ids[-1]:
+                self._ids.append(record_id)
+            else:
+                bisect.insort(self._ids, record_id)
+        else:
+            del self._ids[bisect.bisect_left(self._ids, record_id)]
+
+    def __iter__(self):
+        self.load()
+        if self._ordered:
+            for record_id, value in self._records.items():
+                yield self._materialize(record_id, value)
+            return
+        for record_id in self._ids:
+            yield self._materialize(record_id, self._records[record_id])
+
+    def __len__(self):
+        self.load()
+        return len(self._records)
+
+    def __contains__(self, record_id):
+        self.load()
+        return record_id in self._records
+
+    def __repr__(self):
+        return f"RecordStore({list(self)!r})"
+
+    def get(self, record_id):
+        self.load()
+        value = self._records.get(record_id)
+        return None if value is None else self._materialize(record_id, value)
+
+    def add(self, record):
+        self.load()
+        record_id = getattr(record, self.key)
+        if record_id not in self._records:
+            self._track(record_id, True)
+        self._records[record_id] = record
+        if record_id >= self._next_id:
+            self._next_id = record_id + 1
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def remove(self, record_id):
+        self.load()
+        value = self._records.pop(record_id, None)
+        if value is not None:
+            self._track(record_id, False)
+        if type(value) is dict:
+            value = self.factory(value)
+        elif type(value) is LazyRecord:
+            value = self.factory(value.to_dict())
+        return value
+
+    def apply(self, op, record_id, data=None):
+        # операция из журнала, сделанная другим процессом; объект будет
+        # построен из словаря заново при следующем обращении
+        if not self.loaded:
+            return
+        if op == 'add':
+            if record_id not in self._records:
+                self._track(record_id, True)
+            self._records[record_id] = dict(data)
+            if record_id >= self._next_id:
+                self._next_id = record_id + 1
+        elif op == 'edit':
+            value = self._records.get(record_id)
+            if value is not None:
+                value = dict(value) if type(value) is dict else value.to_dict()
+                value.update(data)
+                self._records[record_id] = value
+        elif op == 'delete':
+            if self._records.pop(record_id, None) is not None:
+                self._track(record_id, False)
+
+    def to_dicts(self):
+        # для снимка: еще не созданные объекты не нужно строить ради to_dict
+        self.load()
+        values = self._records.values() if self._ordered else map(self._records.__getitem__, self._ids)
+        return [value if type(value) is dict else value.to_dict() for value in values]
+
+
+class RecordManager:
+    # Общая часть менеджеров: хранилище self.storage и записи в RecordStore,
+    # лежащем в атрибуте с именем RECORDS. Подкласс в _reset создает
+    # коллекцию заново и сбрасывает свои индексы, а в _changed обновляет их
+    # после операции над одной записью.
+    RECORDS = None
+
+    @property
+    def _records(self):
+        return getattr(self, self.RECORDS)
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _changed(self, op, record_id):
+        pass
+
+    def _apply_changes(self, changes):
+        # операции, которые другие процессы записали в то же хранилище
+        if changes is None:
+            self._reset()
+            return
+        records = self._records
+        for op, record_id, data in changes:
+            records.apply(op, record_id, data)
+            self._changed(op, record_id)
+
+    def _add_records(self, new_records):
+        # новые записи - в память и в хранилище; если записать их не
+        # удалось, из памяти они тоже убираются
+        records = self._records
+        records.extend(new_records)
+        try:
+            self.storage.append_many([('add', getattr(record, records.key), record.to_dict())
+                                      for record in new_records])
+        except OSError:
+            for record in new_records:
+                records.remove(getattr(record, records.key))
+            raise
+
+    def _snapshot(self):
+        # next_id хранилища учитывает ID, зарезервированные другими процессами
+        next_id = max(self._records.next_id, self.storage.next_id)
+        return {'next_id': next_id, 'records': self._records.to_dicts()}
+
+    def is_stale(self):
+        return self._records.loaded and self.storage.changed_on_disk()
+
+    def start_write_behind(self, interval=0.5, max_pending=1000):
+        self.storage.start_write_behind(interval, max_pending)
+
+    def flush(self):
+        self.storage.flush()
@@ -0,0 +1,137 @@
+import sqlite3
+
+from storage import metrics
+from storage.base import BaseStore
+
+
+class SqliteStore(BaseStore):
+    # Хранилище записей в SQLite с тем же интерфейсом, что и Journal:
+    # load/append/append_many/save. Каждая запись - отдельная строка
+    # таблицы, пакеты операций пишутся одной транзакцией, база работает в
+    # режиме WAL. schema - словарь с именем таблицы и колонками; записи
+    # читаются в память целиком, как и у Journal, поэтому индексы по
+    # колонкам не нужны. Запись между процессами SQLite согласует сам;
+    # блокировка <filename>.lock нужна только для того, чтобы блок writing()
+    # видел данные, которые другие процессы записали до него.
+    def __init__(self, filename, key, snapshot, schema, on_change=None):
+        super().__init__(filename, key, snapshot, on_change)
+        self.table = schema['table']
+        self.columns = schema['columns']
+        self.connection = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(f'{name} {self._sql_type(kind)}' for name, kind in self.columns.items())
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({key} INTEGER PRIMARY KEY, {columns})')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+        names = ', '.join(self.columns)
+        placeholders = ', '.join('?' * (len(self.columns) + 1))
+        self._insert_sql = f'INSERT OR REPLACE INTO {self.table} ({key}, {names}) VALUES ({placeholders})'
+        self._select_sql = f'SELECT {key}, {names} FROM {self.table}'
+
+    @staticmethod
+    def _sql_type(kind):
+        return 'INTEGER' if kind == 'BOOLEAN' else kind
+
+    def _row_to_dict(self, row):
+        data = {self.key: row[0]}
+        for (name, kind), value in zip(self.columns.items(), row[1:]):
+            data[name] = bool(value) if kind == 'BOOLEAN' and value is not None else value
+        return data
+
+    def _dict_to_row(self, data):
+        return (data[self.key],) + tuple(data.get(name) for name in self.columns)
+
+    @metrics.instrumented('sqlite.load')
+    def load(self, lazy=False):
+        records = [self._row_to_dict(row) for row in self.connection.execute(f'{self._select_sql} ORDER BY {self.key}')]
+        metrics.count('sqlite.load', records=len(records))
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'next_id'").fetchone()
+        self.next_id = max(row[0] if row else 1, records[-1][self.key] + 1 if records else 1)
+        self._signature = self._stat()
+        return records
+
+    def _stat(self):
+        # номер версии данных SQLite меняется, когда базу изменило другое соединение
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def changed_on_disk(self):
+        return self._signature is not None and self._stat() != self._signature
+
+    def _sync(self):
+        # какие именно строки изменились, SQLite не сообщает - только перечитать
+        if self.changed_on_disk():
+            self._signature = None
+            if self.on_change is not None:
+                self.on_change(None)
+            self._notify(None)
+
+    def _write(self, entries):
+        entries, changes = self._split_history(entries)
+        metrics.count('sqlite.append', records=len(entries))
+        with self._file_lock, metrics.timer('sqlite.append'), self.connection:
+            if changes:
+                self.history.write(changes)
+            added = []
+            for op, record_id, data in entries:
+                if op == 'add':
+                    added.append(self._dict_to_row(data))
+                    continue
+                # подряд идущие вставки отправляются одним executemany
+                self._insert(added)
+                added = []
+                if op == 'edit':
+                    names = [name for name in data if name in self.columns]
+                    if names:
+                        assignments = ', '.join(f'{name} = ?' for name in names)
+                        self.connection.execute(
+                            f'UPDATE {self.table} SET {assignments} WHERE {self.key} = ?',
+                            [data[name] for name in names] + [record_id])
+                elif op == 'delete':
+                    self.connection.execute(f'DELETE FROM {self.table} WHERE {self.key} = ?', (record_id,))
+            self._insert(added)
+            self._track_written(entries)
+
+    def _write_reservation(self, record_id):
+        with self.connection:
+            self._bump_next_id(record_id + 1)
+        self._signature = self._stat()
+
+    def _insert(self, rows):
+        if rows:
+            self.connection.executemany(self._insert_sql, rows)
+            self._bump_next_id(max(row[0] for row in rows) + 1)
+
+    def _bump_next_id(self, next_id):
+        self.next_id = max(self.next_id, next_id)
+        self.connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('next_id', ?)", (self.next_id,))
+
+    def compact(self, background=True):
+        self.connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    @metrics.instrumented('sqlite.save')
+    def save(self):
+        self.flush()
+        with self._file_lock:
+            # таблица переписывается из памяти, поэтому сначала подтягиваем чужие изменения
+            self._sync()
+            snapshot = self.snapshot()
+            records = snapshot['records'] if isinstance(snapshot, dict) else snapshot
+            with self.connection:
+                self.connection.execute(f'DELETE FROM {self.table}')
+                self.connection.executemany(self._insert_sql, [self._dict_to_row(data) for data in records])
+                if isinstance(snapshot, dict):
+                    self._bump_next_id(snapshot.get('next_id', 1))
+            self._signature = self._stat()
+
+    def wait(self):
+        pass
+
+    def close(self):
+        if self._write_behind is not None:
+            self._write_behind.close()
+            self._write_behind = None
+        self.connection.close()
+        self._file_lock.close()
+        if self.history is not None:
+            self.history.close()
@@ -0,0 +1,263 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from collections import defaultdict
+from contextlib import ExitStack
+
+from task.task_manager import TaskManager
+from notes.note import NoteManager
+from contacts.contact import ContactManager
+from finance.finance_manager import FinanceManager
+from storage import metrics
+
+# раздел -> (менеджер, файл хранилища внутри каталога данных, атрибут с записями)
+KINDS = {
+    'tasks': (TaskManager, os.path.join('task', 'task.json'), 'tasks'),
+    'notes': (NoteManager, os.path.join('notes', 'notes.json'), 'notes'),
+    'contacts': (ContactManager, os.path.join('contacts', 'contacts.json'), 'contacts'),
+    'finance': (FinanceManager, os.path.join('finance', 'finance.json'), 'records'),
+}
+# Дерево хешей: лист - хеш записи, узел уровня L объединяет записи с
+# одинаковыми ID >> (FANOUT_BITS * L). Четыре уровня по 64 потомка покрывают
+# 16 млн ID; записи с большими ID просто дают больше узлов верхнего уровня.
+FANOUT_BITS = 6
+LEVELS = 4
+
+
+def digest(data):
+    # хеш содержимого записи, не зависящий от порядка полей
+    text = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _node_digest(children):
+    node = hashlib.blake2b(digest_size=16)
+    for key, child in sorted(children.items()):
+        node.update(key.to_bytes(8, 'little', signed=True))
+        node.update(bytes.fromhex(child))
+    return node.hexdigest()
+
+
+class MerkleTree:
+    # Дерево хешей записей одной реплики. Реплики сравнивают корни и
+    # спускаются только в несовпавшие поддеревья, поэтому при малом числе
+    # различий обмен - несколько сотен хешей, а не хеш каждой записи.
+    @metrics.instrumented('sync.tree.build')
+    def __init__(self, hashes):
+        # nodes[level][key] -> {ключ потомка: хеш потомка}
+        self.nodes = [None]
+        children = hashes
+        for _ in range(LEVELS):
+            level = defaultdict(dict)
+            for key, child in children.items():
+                level[key >> FANOUT_BITS][key] = child
+            self.nodes.append(level)
+            children = {key: _node_digest(items) for key, items in level.items()}
+        self.top = children
+        self.root = _node_digest(children)
+
+    def children(self, level, key):
+        return self.nodes[level].get(key, {})
+
+
+def diff(local, remote):
+    # ID записей, хеши которых различаются; remote нужны только root, top и
+    # children - то, что реплика отдала бы по сети. Второе значение - число
+    # полученных от remote хешей.
+    exchanged = 1
+    if local.root == remote.root:
+        return [], exchanged
+    ids = []
+    pending = [(LEVELS, local.top, remote.top)]
+    while pending:
+        level, ours, theirs = pending.pop()
+        exchanged += len(theirs)
+        for key in ours.keys() | theirs.keys():
+            if ours.get(key) == theirs.get(key):
+                continue
+            if level == 0:
+                ids.append(key)
+            else:
+                pending.append((level - 1, local.children(level, key), remote.children(level, key)))
+    return sorted(ids), exchanged
+
+
+class Replica:
+    # Данные одного раздела в одном каталоге и хеши записей на момент
+    # последней синхронизации (файл *.sync.json рядом с хранилищем).
+    def __init__(self, directory, kind):
+        manager_class, filename, self.attribute = KINDS[kind]
+        self.manager = manager_class(os.path.join(directory, filename))
+        self.state_filename = os.path.splitext(self.manager.filename)[0] + '.sync.json'
+
+    @property
+    def records(self):
+        return getattr(self.manager, self.attribute)
+
+    def load(self):
+        # вызывается под блокировкой писателей, после подтягивания чужих операций
+        self.data = {data[self.records.key]: data for data in self.records.to_dicts()}
+        self.hashes = {record_id: digest(data) for record_id, data in self.data.items()}
+        self.tree = MerkleTree(self.hashes)
+        try:
+            with open(self.state_filename, 'r') as f:
+                self.base = {int(record_id): value for record_id, value in json.load(f)['hashes'].items()}
+            self.has_base = True
+        except FileNotFoundError:
+            # первая синхронизация этого каталога: неизвестно, что в нем менялось
+            self.base = {}
+            self.has_base = False
+
+    def changed(self, record_id):
+        return self.hashes.get(record_id) != self.base.get(record_id)
+
+    def apply(self, entries):
+        if entries:
+            # прежние версии записей - чтобы синхронизацию можно было отменить
+            before = [None if op == 'add' else self.data.get(record_id) for op, record_id, _ in entries]
+            self.manager.storage.append_many(entries, before)
+            self.manager._apply_changes(entries)
+        for _, record_id, _ in entries:
+            # хеш того, что в итоге оказалось в хранилище
+            record = self.records.get(record_id)
+            if record is None:
+                self.hashes.pop(record_id, None)
+            else:
+                self.hashes[record_id] = digest(record.to_dict())
+
+    def save_state(self):
+        directory, name = os.path.split(self.state_filename)
+        fd, tmp_filename = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'hashes': self.hashes}, f)
+            os.replace(tmp_filename, self.state_filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+
+def _resolve(left, right, record_id):
+    # Итоговая версия записи (None - запись удалена) и признак конфликта.
+    # Изменение только в одной реплике (по сравнению с ее прошлой
+    # синхронизацией) переносится в другую. Иначе правила не зависят от
+    # порядка реплик: изменение побеждает удаление, из двух разных версий
+    # побеждает версия с большим хешем.
+    if not (left.has_base and right.has_base):
+        return _resolve_first(left, right, record_id)
+    ours, theirs = left.data.get(record_id), right.data.get(record_id)
+    if left.changed(record_id) and not right.changed(record_id):
+        return ours, False
+    if right.changed(record_id) and not left.changed(record_id):
+        return theirs, False
+    if ours is None or theirs is None:
+        return ours if theirs is None else theirs, False
+    if left.hashes[record_id] > right.hashes[record_id]:
+        return ours, True
+    return theirs, True
+
+
+def _resolve_first(left, right, record_id):
+    # Без прошлой синхронизации изменения неизвестны (например, каталог
+    # скопирован). Запись, которой нет в одной реплике, удалена в ней, если
+    # ее ID меньше next_id этой реплики (ID не переиспользуются), иначе
+    # добавлена в другой. Две разные версии - конфликт, остается одна.
+    ours, theirs = left.data.get(record_id), right.data.get(record_id)
+    if theirs is None:
+        return (None if record_id < right.records.next_id else ours), False
+    if ours is None:
+        return (None if record_id < left.records.next_id else theirs), False
+    if left.hashes[record_id] > right.hashes[record_id]:
+        return ours, True
+    return theirs, True
+
+
+@metrics.instrumented('sync.kind')
+def sync_kind(left, right, dry_run=False):
+    result = {'exchanged': 0, 'different': 0, 'to_left': 0, 'to_right': 0, 'renumbered': [], 'conflicts': []}
+    with ExitStack() as stack:
+        for replica in (left, right):
+            stack.enter_context(replica.manager.storage.writing())
+            replica.load()
+        ids, result['exchanged'] = diff(left.tree, right.tree)
+        result['different'] = len(ids)
+        left_entries, right_entries = [], []
+        next_id = max(left.records.next_id, right.records.next_id)
+        for record_id in ids:
+            ours, theirs = left.data.get(record_id), right.data.get(record_id)
+            if ours is not None and theirs is not None and left.has_base and right.has_base \
+                    and record_id not in left.base and record_id not in right.base:
+                # обе реплики после прошлой синхронизации независимо добавили
+                # запись с одним ID: сохраняются обе, запись с большим хешем
+                # получает новый ID
+                keep, moved = (ours, theirs) if left.hashes[record_id] < right.hashes[record_id] else (theirs, ours)
+                moved = dict(moved, **{left.records.key: next_id})
+                result['renumbered'].append((record_id, next_id))
+                for replica, entries in ((left, left_entries), (right, right_entries)):
+                    if replica.data[record_id] is not keep:
+                        entries.append(('edit', record_id, keep))
+                    entries.append(('add', next_id, moved))
+                next_id += 1
+                continue
+            winner, conflict = _resolve(left, right, record_id)
+            if conflict:
+                result['conflicts'].append(record_id)
+            for replica, entries in ((left, left_entries), (right, right_entries)):
+                current = replica.data.get(record_id)
+                if winner is None:
+                    entries.append(('delete', record_id, None))
+                elif current is None:
+                    entries.append(('add', record_id, winner))
+                elif current is not winner:
+                    entries.append(('edit', record_id, winner))
+        result['to_left'], result['to_right'] = len(left_entries), len(right_entries)
+        if dry_run:
+            return result
+        with left.manager.storage.deferred():
+            left.apply(left_entries)
+        with right.manager.storage.deferred():
+            right.apply(right_entries)
+        if left.hashes != right.hashes:
+            raise RuntimeError("После синхронизации реплики различаются")
+        left.save_state()
+        right.save_state()
+    return result
+
+
+def sync(left_directory, right_directory, kinds=None, dry_run=False):
+    # {раздел: результат sync_kind}; каталоги устроены как рабочий каталог
+    # программы (task/, notes/, contacts/, finance/)
+    results = {}
+    for kind in kinds or KINDS:
+        left, right = Replica(left_directory, kind), Replica(right_directory, kind)
+        try:
+            results[kind] = sync_kind(left, right, dry_run)
+        finally:
+            for replica in (left, right):
+                replica.manager.flush()
+                replica.manager.storage.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синхронизация данных помощника между двумя каталогами")
+    parser.add_argument('left')
+    parser.add_argument('right')
+    parser.add_argument('--kind', dest='kinds', action='append', choices=sorted(KINDS),
+                        help="синхронизировать только этот раздел (можно указать несколько раз)")
+    parser.add_argument('--dry-run', action='store_true', help="только показать, что будет перенесено")
+    args = parser.parse_args(argv)
+    for kind, result in sync(args.left, args.right, args.kinds, args.dry_run).items():
+        print(f"{kind}: различающихся записей {result['different']}, передано хешей {result['exchanged']}, "
+              f"изменений в {args.left}: {result['to_left']}, в {args.right}: {result['to_right']}.")
+        for old_id, new_id in result['renumbered']:
+            print(f"  запись {old_id} добавлена в обоих каталогах, вторая получила ID {new_id}")
+        for record_id in result['conflicts']:
+            print(f"  запись {record_id} изменена в обоих каталогах, оставлена одна из версий")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import datetime
+
+EPOCH = datetime.datetime(1970, 1, 1)
+FORMAT = "%Y-%m-%d %H:%M:%S"
+INPUT_FORMATS = ("%d-%m-%Y %H:%M", "%d.%m.%Y %H:%M", "%d-%m-%Y", "%d.%m.%Y")
+
+
+def to_seconds(text):
+    # "ГГГГ-ММ-ДД ЧЧ:ММ:СС" -> секунды от эпохи без учета часового пояса,
+    # чтобы преобразование было точно обратимым; нераспознанная строка
+    # возвращается как есть
+    try:
+        return int((datetime.datetime.fromisoformat(text) - EPOCH).total_seconds())
+    except (TypeError, ValueError):
+        return text
+
+
+def parse_seconds(text):
+    # дата, введенная пользователем: ДД-ММ-ГГГГ или ДД.ММ.ГГГГ, можно со
+    # временем ЧЧ:ММ, или ISO-формат; дата без времени означает конец дня
+    text = text.strip()
+    for fmt in INPUT_FORMATS:
+        try:
+            value = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if '%H' not in fmt:
+            value = value.replace(hour=23, minute=59, second=59)
+        return int((value - EPOCH).total_seconds())
+    seconds = to_seconds(text)
+    if not isinstance(seconds, int):
+        raise ValueError(f"не удалось разобрать дату {text!r}")
+    if len(text) == 10:
+        seconds += 24 * 3600 - 1
+    return seconds
+
+
+def format_seconds(value):
+    if isinstance(value, int):
+        return (EPOCH + datetime.timedelta(seconds=value)).strftime(FORMAT)
+    return value
+
+
+def now_seconds():
+    return int((datetime.datetime.now() - EPOCH).total_seconds())
@@ -0,0 +1,100 @@
+import atexit
+import threading
+import time
+
+_active = set()
+_active_lock = threading.Lock()
+
+
+class WriteBehind:
+    # Отложенная запись: операции копятся в памяти, а фоновый поток
+    # записывает их одной пачкой, когда изменения затихли на interval секунд
+    # или когда их набралось max_pending. flush() записывает все накопленное
+    # немедленно; при обычном завершении программы это делается автоматически.
+    # Если запись не удалась, операции остаются в очереди до следующей
+    # попытки, а ошибка сохраняется в error и выбрасывается из flush().
+    # Другие процессы видят операции только после записи, но ID новых
+    # записей резервируются на диске сразу (см. BaseStore.reserve), поэтому
+    # параллельный писатель не получит уже выданный ID.
+    def __init__(self, write, interval=0.5, max_pending=1000):
+        self.write = write
+        self.interval = interval
+        self.max_pending = max_pending
+        self.error = None
+        self._entries = []
+        self._last_change = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        with _active_lock:
+            _active.add(self)
+
+    @property
+    def pending(self):
+        return len(self._entries)
+
+    def add(self, entries):
+        with self._condition:
+            self._entries.extend(entries)
+            self._last_change = time.monotonic()
+            self._condition.notify()
+
+    def _due(self):
+        if len(self._entries) >= self.max_pending:
+            return 0
+        return self._last_change + self.interval - time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if not self._entries:
+                        self._condition.wait()
+                        continue
+                    remaining = self._due()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # операции вернулись в очередь; повторим после паузы
+                time.sleep(self.interval)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._condition:
+                entries, self._entries = self._entries, []
+            if not entries:
+                return
+            try:
+                self.write(entries)
+            except BaseException as e:
+                with self._condition:
+                    self._entries[:0] = entries
+                self.error = e
+                raise
+            self.error = None
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        with _active_lock:
+            _active.discard(self)
+
+
+def flush_all():
+    with _active_lock:
+        active = list(_active)
+    for write_behind in active:
+        write_behind.flush()
+
+
+atexit.register(flush_all)
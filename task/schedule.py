@@ -0,0 +1,130 @@
+import sys
+from bisect import bisect_left, insort
+from itertools import islice
+
+from storage.timestamps import now_seconds
+
+PRIORITY_RANK = {"Высокий": 0, "Средний": 1, "Низкий": 2}
+NO_DUE = sys.maxsize
+LOAD = 1000
+
+
+class _SortedList:
+    # Отсортированный список из блоков примерно по LOAD элементов: вставка и
+    # удаление стоят O(√n) вместо O(n) у одного большого списка, а обход с
+    # любой позиции идет по блокам подряд.
+    def __init__(self, items=()):
+        items = sorted(items)
+        self._blocks = [items[i:i + LOAD] for i in range(0, len(items), LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(items)
+
+    def __len__(self):
+        return self._len
+
+    def add(self, item):
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([item])
+            self._maxes.append(item)
+            return
+        i = bisect_left(self._maxes, item)
+        if i == len(self._blocks):
+            i -= 1
+            block = self._blocks[i]
+            block.append(item)
+            self._maxes[i] = item
+        else:
+            block = self._blocks[i]
+            insort(block, item)
+        if len(block) > 2 * LOAD:
+            self._blocks[i:i + 1] = [block[:LOAD], block[LOAD:]]
+            self._maxes[i:i + 1] = [block[LOAD - 1], block[-1]]
+
+    def remove(self, item):
+        i = bisect_left(self._maxes, item)
+        if i < len(self._blocks):
+            block = self._blocks[i]
+            j = bisect_left(block, item)
+            if j < len(block) and block[j] == item:
+                del block[j]
+                self._len -= 1
+                if block:
+                    self._maxes[i] = block[-1]
+                else:
+                    del self._blocks[i]
+                    del self._maxes[i]
+                return
+        raise ValueError(f"{item!r} отсутствует в списке")
+
+    def irange(self, start=None):
+        # элементы не меньше start по возрастанию
+        i = j = 0
+        if start is not None:
+            i = bisect_left(self._maxes, start)
+            if i < len(self._blocks):
+                j = bisect_left(self._blocks[i], start)
+        for index in range(i, len(self._blocks)):
+            yield from islice(self._blocks[index], j, None)
+            j = 0
+
+
+class TaskSchedule:
+    # Индекс невыполненных задач: по сроку (срок, приоритет, ID) и по
+    # приоритету (приоритет, срок, ID). Задачи без распознанного срока идут
+    # после всех остальных. Выполненные задачи в индекс не попадают.
+    def __init__(self, tasks=()):
+        self.keys = {}
+        for task in tasks:
+            if not task.done:
+                self.keys[task.task_id] = self._key(task)
+        self.by_due = _SortedList(self.keys.values())
+        self.by_priority = _SortedList((rank, due, task_id) for due, rank, task_id in self.keys.values())
+
+    @staticmethod
+    def _key(task):
+        due = task.due_timestamp
+        rank = PRIORITY_RANK.get(task.priority, len(PRIORITY_RANK))
+        return NO_DUE if due is None else due, rank, task.task_id
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, task):
+        if task.done or task.task_id in self.keys:
+            return
+        due, rank, task_id = self.keys[task.task_id] = self._key(task)
+        self.by_due.add((due, rank, task_id))
+        self.by_priority.add((rank, due, task_id))
+
+    def remove(self, task_id):
+        key = self.keys.pop(task_id, None)
+        if key is not None:
+            due, rank, _ = key
+            self.by_due.remove(key)
+            self.by_priority.remove((rank, due, task_id))
+
+    def update(self, task):
+        self.remove(task.task_id)
+        self.add(task)
+
+    def next_due(self, limit=10, now=None):
+        now = now_seconds() if now is None else now
+        result = []
+        for due, _, task_id in self.by_due.irange((now, -1, -1)):
+            if due == NO_DUE or len(result) >= limit:
+                break
+            result.append(task_id)
+        return result
+
+    def overdue(self, now=None, limit=None):
+        now = now_seconds() if now is None else now
+        result = []
+        for due, _, task_id in self.by_due.irange():
+            if due >= now or (limit is not None and len(result) >= limit):
+                break
+            result.append(task_id)
+        return result
+
+    def top_priority(self, limit=10):
+        return [task_id for _, _, task_id in islice(self.by_priority.irange(), limit)]
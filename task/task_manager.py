@@ -1,48 +1,133 @@
-import datetime
-import json
-import csv
 import os
+import sys
+from storage.backends import open_store
+from storage.csvio import import_rows, write_rows, parse_bool
+from storage.locking import check_conflicts
+from storage.records import RecordStore, RecordManager
+from storage.query import page, pages, browse
+from storage.history import revert, records_at
+from storage.timestamps import to_seconds, format_seconds, parse_seconds
+from storage import metrics
+from task.schedule import TaskSchedule, PRIORITY_RANK, NO_DUE
 
 class Tasks:
+    __slots__ = ('task_id', 'task_title', 'description', '_priority', 'done', '_due_date')
+
     def __init__(self, task_id, task_title, description, priority, done, due_date=None):
         self.task_title = task_title
         self.description = description
         self.task_id = task_id
         self.done = done
         self.priority = priority
-        self.due_date = due_date or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.due_date = due_date
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @priority.setter
+    def priority(self, value):
+        self._priority = sys.intern(value) if isinstance(value, str) else value
+
+    @property
+    def due_date(self):
+        return format_seconds(self._due_date)
+
+    @due_date.setter
+    def due_date(self, value):
+        # задача без срока хранит None; нераспознанная старая строка остается строкой
+        self._due_date = to_seconds(value) if value else None
+
+    @property
+    def due_timestamp(self):
+        return self._due_date if isinstance(self._due_date, int) else None
     
     def __repr__(self):
         return f"task(id={self.task_id}, title={self.task_title}, description={self.description}, priority={self.priority}, done_task={self.done}, timestamp={self.due_date})"
 
-class TaskManager:
-    def __init__(self, filename='task\\task.json'):
+    def to_dict(self):
+        return {
+            'task_id': self.task_id,
+            'title': self.task_title,
+            'description': self.description,
+            'priority': self.priority,
+            'done_task': self.done,
+            'due_date': self.due_date
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['task_id'], data['title'], data['description'], data['priority'], data['done_task'], data.get('due_date'))
+
+TASK_SCHEMA = {
+    'table': 'tasks',
+    'columns': {'title': 'TEXT', 'description': 'TEXT', 'priority': 'TEXT', 'done_task': 'BOOLEAN', 'due_date': 'TEXT'}
+}
+
+# сортировки для list_tasks; задачи без срока идут после всех остальных
+TASK_ORDERS = {
+    'priority': lambda task: PRIORITY_RANK.get(task.priority, len(PRIORITY_RANK)),
+    'due': lambda task: NO_DUE if task.due_timestamp is None else task.due_timestamp,
+    'title': lambda task: task.task_title,
+}
+
+class TaskManager(RecordManager):
+    RECORDS = 'tasks'
+
+    def __init__(self, filename=os.path.join('task', 'task.json'), lazy=False):
         self.filename = filename
+        self.storage = open_store(filename, 'task_id', self._snapshot, TASK_SCHEMA, self._apply_changes)
         self.tasks = self.load_tasks()
+        self._schedule = None
+        if not lazy:
+            self.tasks.load()
+
+    @property
+    def schedule(self):
+        # индекс сроков строится при первом запросе, а до этого не обновляется
+        if self._schedule is None:
+            self._schedule = TaskSchedule(self.tasks)
+        return self._schedule
+
+    def _reschedule(self, task_id):
+        if self._schedule is None:
+            return
+        task = self.tasks.get(task_id)
+        if task is None:
+            self._schedule.remove(task_id)
+        else:
+            self._schedule.update(task)
 
     def load_tasks(self):
-        try:
-            with open(self.filename, 'r') as f:
-                return [Tasks(**n) for n in json.load(f)]
-        except FileNotFoundError:
-            return []
+        return RecordStore('task_id', Tasks.from_dict, self._read_storage, self.storage)
+
+    @metrics.instrumented('tasks.load')
+    def _read_storage(self):
+        return self.storage.load(lazy=True), self.storage.next_id
 
+    def _reset(self):
+        self.tasks = self.load_tasks()
+        self._schedule = None
+
+    def _changed(self, op, task_id):
+        self._reschedule(task_id)
+
+    @metrics.instrumented('tasks.save')
     def save_tasks(self):
-        with open(self.filename, 'w') as f:
-            json.dump([{
-                'task_id': n.task_id,
-                'title': n.task_title,
-                'description': n.description,
-                'priority': n.priority,
-                'done_task': n.done,
-                'due_date': n.due_date
-            } for n in self.tasks], f)
-
-    def add_task(self, task_title, description, priority, done=False):
-        task_id = len(self.tasks) + 1
-        new_task = Tasks(task_id, task_title, description, priority, done)
-        self.tasks.append(new_task)
-        self.save_tasks()
+        self.storage.save()
+
+    @metrics.instrumented('tasks.add')
+    def add_task(self, task_title, description, priority, done=False, due_date=None):
+        if isinstance(due_date, str):
+            due_date = parse_seconds(due_date)
+        with self.storage.writing():
+            task_id = self.tasks.allocate_id()
+            new_task = Tasks(task_id, task_title, description, priority, done, due_date)
+            self.tasks.add(new_task)
+            self.storage.append('add', task_id, new_task.to_dict())
+            if self._schedule is not None:
+                self._schedule.add(new_task)
+        return task_id
 
     def create_task(self):
         task_title = input("Введите название задачи: ")
@@ -54,59 +139,149 @@ class TaskManager:
             priority = input("Введите приоритет задачи («Высокий», «Средний», «Низкий»): ")
         
         done = False
-        due_date = input("Введите дату выполнения задачи (или оставьте пустым): ")
+        while True:
+            due_date = input("Введите срок выполнения ДД-ММ-ГГГГ [ЧЧ:ММ] (или оставьте пустым): ")
+            try:
+                due_date = parse_seconds(due_date) if due_date.strip() else None
+                break
+            except ValueError as e:
+                print(f"Вы неправильно ввели данные: {e}")
         
-        self.add_task(task_title, description, priority, done)
+        self.add_task(task_title, description, priority, done, due_date)
+
+    @metrics.instrumented('tasks.list')
+    def list_tasks(self, limit=20, cursor=None, order=None, done=None):
+        # (задачи, курсор следующей страницы или None)
+        where = None if done is None else lambda task: task.done == done
+        return page(self.tasks, limit, cursor, where, TASK_ORDERS[order] if order else None)
+
+    @metrics.instrumented('tasks.view')
+    def view_tasks(self, page_size=20, order=None):
+        browse(pages(self.tasks, page_size, order=TASK_ORDERS[order] if order else None), self._print_task)
+
+    def _print_task(self, task):
+        print(f"{task.task_id}: {task.task_title}, приоритет: {task.priority}, статус: {task.done}, "
+              f"(дедлайн: {task.due_date or 'нет'})")
+
+    def upcoming_tasks(self, limit=10, now=None):
+        return [self.tasks.get(task_id) for task_id in self.schedule.next_due(limit, now)]
 
-    def view_tasks(self):
-        for task in self.tasks:
-            print(f"{task.task_id}: {task.task_title}, приоритет: {task.priority}, статус: {task.done}, (дедлайн: {task.due_date})")
+    def overdue_tasks(self, limit=None, now=None):
+        return [self.tasks.get(task_id) for task_id in self.schedule.overdue(now, limit)]
+
+    def top_priority_tasks(self, limit=10):
+        return [self.tasks.get(task_id) for task_id in self.schedule.top_priority(limit)]
 
     def view_task_details(self, task_id):
-        for task in self.tasks:
-            if task.task_id == task_id:
-                print(f"Название задачи: {task.task_title}\nСодержимое: {task.description}\nСтатус: {task.done}")
-                return
-        print("Задача не найдена.")
-
-    def edit_task(self, task_id, new_title=None, new_description=None, new_priority=None):
-        for task in self.tasks:
-            if task.task_id == task_id:
-                if new_title is not None:
-                    task.task_title = new_title
-                if new_description is not None:
-                    task.description = new_description
-                if new_priority is not None:
-                    task.priority = new_priority
-                self.save_tasks()
+        task = self.tasks.get(task_id)
+        if task is None:
+            print("Задача не найдена.")
+            return
+        print(f"Название задачи: {task.task_title}\nСодержимое: {task.description}\nСтатус: {task.done}")
+
+    @metrics.instrumented('tasks.edit')
+    def edit_task(self, task_id, new_title=None, new_description=None, new_priority=None, new_due_date=None):
+        if isinstance(new_due_date, str):
+            new_due_date = parse_seconds(new_due_date)
+        task = self.tasks.get(task_id)
+        if task is None:
+            print("Такой задачи нет")
+            return
+        seen = task.to_dict()
+        with self.storage.writing():
+            task = self.tasks.get(task_id)
+            if task is None:
+                print("Такой задачи нет")
                 return
-        print("Такой задачи нет")
+            before = task.to_dict()
+            wanted = {'title': new_title, 'description': new_description, 'priority': new_priority,
+                      'due_date': format_seconds(new_due_date) if new_due_date is not None else None}
+            check_conflicts(seen, before, {k: v for k, v in wanted.items() if v is not None})
+            if new_title is not None:
+                task.task_title = new_title
+            if new_description is not None:
+                task.description = new_description
+            if new_priority is not None:
+                task.priority = new_priority
+            if new_due_date is not None:
+                task.due_date = new_due_date
+            self._log_edit(task, before)
+            self._reschedule(task_id)
+
+    @metrics.instrumented('tasks.set_done')
+    def set_done(self, task_id, done=True):
+        # отметка о выполнении; выполненные задачи уходят из индекса сроков
+        with self.storage.writing():
+            task = self.tasks.get(task_id)
+            if task is None:
+                return False
+            if task.done != done:
+                before = task.to_dict()
+                task.done = done
+                self._log_edit(task, before)
+                self._reschedule(task_id)
+        return True
+
+    def toggle_done(self, task_id):
+        task = self.tasks.get(task_id)
+        return task is not None and self.set_done(task_id, not task.done)
 
+    def _log_edit(self, task, before):
+        changes = {k: v for k, v in task.to_dict().items() if before[k] != v}
+        if changes:
+            self.storage.append('edit', task.task_id, changes, {k: before[k] for k in changes})
+
+    @metrics.instrumented('tasks.delete')
     def delete_task(self, task_id):
-        task_found = False
-        for task in self.tasks:
-            if task.task_id == task_id:
-                self.tasks.remove(task) 
-                task_found = True  
-                break 
-        if task_found:
-            self.save_tasks()
+        with self.storage.writing():
+            removed = self.tasks.remove(task_id)
+            if removed is not None:
+                self.storage.append('delete', task_id, before=removed.to_dict())
+                if self._schedule is not None:
+                    self._schedule.remove(task_id)
+        if removed is not None:
             print(f"Задача с ID {task_id} была успешно удалена.")
         else:
             print(f"Задача с ID {task_id} не найдена.")
     
-    def export_to_csv(self, csv_filename='task\\tasks.csv'):
-        with open(csv_filename,"w", newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['ID', 'Title', 'Description', 'Priority', 'Status', 'Due Date'])
-            for task in self.tasks:
-                writer.writerow([task.task_id, task.task_title, task.description, task.priority, task.done, task.due_date])
-
-    def import_from_csv(self,csv_filename='task\\tasks.csv'):
-        with open(csv_filename, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                self.add_task(row['Title'], row['Description'], row['Priority'], row['Status'])
+    def undo(self):
+        # отменяет последнее изменение задач; число отмененных операций
+        return revert(self)
+
+    def redo(self):
+        return revert(self, redo=True)
+
+    def as_of(self, moment):
+        # задачи на момент moment (ДД-ММ-ГГГГ [ЧЧ:ММ] или секунды)
+        return records_at(self.storage, 'task_id', Tasks.from_dict, moment)
+
+    @metrics.instrumented('tasks.export_csv')
+    def export_to_csv(self, csv_filename=os.path.join('task', 'tasks.csv'), progress=None, encoding=None):
+        return write_rows(csv_filename, ['ID', 'Title', 'Description', 'Priority', 'Status', 'Due Date'],
+                          ([task.task_id, task.task_title, task.description, task.priority, task.done, task.due_date]
+                           for task in self.tasks), progress=progress, encoding=encoding)
+
+    @metrics.instrumented('tasks.import_csv')
+    def import_from_csv(self, csv_filename=os.path.join('task', 'tasks.csv'), workers=None, progress=None, encoding=None):
+        return import_rows(csv_filename, self._task_from_row, self._add_many,
+                           workers=workers, progress=progress, encoding=encoding)
+
+    @staticmethod
+    def _task_from_row(row):
+        if row['Priority'] not in ["Высокий", "Средний", "Низкий"]:
+            raise ValueError(f"неизвестный приоритет {row['Priority']!r}")
+        due_date = row.get('Due Date')
+        return (row['Title'], row['Description'], row['Priority'], parse_bool(row['Status']),
+                parse_seconds(due_date) if due_date else None)
+
+    def _add_many(self, rows):
+        with self.storage.writing():
+            first_id = self.tasks.allocate_id(len(rows))
+            new_tasks = [Tasks(first_id + i, *row) for i, row in enumerate(rows)]
+            self._add_records(new_tasks)
+            if self._schedule is not None:
+                for task in new_tasks:
+                    self._schedule.add(task)
 
     def main(self):
         while True:
@@ -118,14 +293,21 @@ class TaskManager:
             print("5. Удалить задачу")
             print("6. Экспортировать задачи в CSV")
             print("7. Импортировать задачи из CSV")
-            print("8. Выход")
+            print("8. Отметить задачу выполненной / невыполненной")
+            print("9. Ближайшие задачи по сроку")
+            print("10. Просроченные задачи")
+            print("11. Самые приоритетные открытые задачи")
+            print("12. Отменить последнее изменение")
+            print("13. Повторить отмененное изменение")
+            print("14. Выход")
 
             choice = input("Введите номер опции: ")
 
             if choice == '1':
                 self.create_task()
             elif choice == '2':
-                self.view_tasks()
+                order = input("Сортировать по: 1 - ID, 2 - приоритету, 3 - сроку (Enter - по ID): ")
+                self.view_tasks(order={'2': 'priority', '3': 'due'}.get(order.strip()))
             elif choice == '3':
                 task_id = int(input("Введите ID задачи для просмотра: "))
                 self.view_task_details(task_id)
@@ -134,7 +316,12 @@ class TaskManager:
                 new_title = input("Введите новый заголовок (или оставьте пустым): ")
                 new_description = input("Введите новое содержимое (или оставьте пустым): ")
                 new_priority = input("Введите новый приоритет (или оставьте пустым): ")
-                self.edit_task(task_id, new_title or None, new_description or None, new_priority or None)
+                new_due_date = input("Введите новый срок ДД-ММ-ГГГГ [ЧЧ:ММ] (или оставьте пустым): ")
+                try:
+                    self.edit_task(task_id, new_title or None, new_description or None, new_priority or None,
+                                   new_due_date or None)
+                except ValueError as e:
+                    print(e)
             elif choice == '5':
                 task_id = int(input("Введите ID задачи для удаления: "))
                 self.delete_task(task_id)
@@ -142,9 +329,43 @@ class TaskManager:
                 self.export_to_csv()
                 print("Задачи экспортированы в tasks.csv.")
             elif choice == '7':
-                self.import_from_csv()
-                print("Задачи импортированы из tasks.csv.")
+                try:
+                    count, rate = self.import_from_csv()
+                except ValueError as e:
+                    print(f"Импорт отменен. {e}")
+                else:
+                    print(f"Задачи импортированы из tasks.csv: {count} шт. ({rate:.0f} строк/с).")
             elif choice == '8':
+                task_id = int(input("Введите ID задачи: "))
+                if self.toggle_done(task_id):
+                    print(f"Статус задачи {task_id}: {self.tasks.get(task_id).done}")
+                else:
+                    print("Задача не найдена.")
+            elif choice in ('9', '10', '11'):
+                if choice == '9':
+                    tasks = self.upcoming_tasks()
+                elif choice == '10':
+                    tasks = self.overdue_tasks(limit=50)
+                else:
+                    tasks = self.top_priority_tasks()
+                for task in tasks:
+                    self._print_task(task)
+                if not tasks:
+                    print("Задач нет.")
+            elif choice == '12':
+                try:
+                    count = self.undo()
+                except ValueError as e:
+                    print(e)
+                else:
+                    print(f"Отменено операций: {count}." if count else "Нечего отменять.")
+
+            elif choice == '13':
+                count = self.redo()
+                print(f"Повторено операций: {count}." if count else "Нечего повторять.")
+
+            elif choice == '14':
+                self.flush()
                 break
             else:
                 print("Некорректный ввод.")
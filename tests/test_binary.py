@@ -0,0 +1,90 @@
+import io
+import os
+
+from storage import binary
+from task.task_manager import TaskManager
+
+RECORDS = [
+    {'id': 1, 'title': 'первая', 'category': 'дом', 'amount': 1.5, 'done': True, 'tags': ['a', 'b'], 'due': None},
+    {'id': 2, 'title': 'вторая', 'category': 'дом', 'amount': -2.25, 'done': False, 'tags': None},
+    {'id': 5, 'title': '', 'category': 'работа', 'amount': 0.0, 'done': False, 'tags': {'x': 1}, 'due': 1700000000},
+    {'id': 7, 'title': 'четвертая', 'category': 'работа', 'amount': 3.0, 'done': True, 'tags': [], 'due': 12},
+]
+
+
+def _dump(snapshot):
+    f = io.BytesIO()
+    binary.dump(snapshot, f, 'id')
+    return f.getvalue()
+
+
+def test_round_trip_eager_and_lazy(tmp_path):
+    filename = os.path.join(tmp_path, 'data.bin')
+    with open(filename, 'wb') as f:
+        f.write(_dump({'next_id': 9, 'records': RECORDS, 'version': 3}))
+    assert binary.is_binary(filename)
+
+    with open(filename, 'rb') as f:
+        snapshot = binary.BinarySnapshot(f)
+    try:
+        assert (snapshot.next_id, snapshot.meta, len(snapshot)) == (9, {'version': 3}, 4)
+        assert dict(snapshot.fields)['category'] == 't'
+        # отсутствующее поле не появляется, а None сохраняется как None
+        assert list(snapshot) == RECORDS
+        lazy = [snapshot.lazy(index) for index in range(len(snapshot))]
+        assert [record.key for record in lazy] == [1, 2, 5, 7]
+        assert lazy[2]['title'] == '' and lazy[3]['id'] == 7
+        assert [record.to_dict() for record in lazy] == RECORDS
+    finally:
+        snapshot.close()
+
+
+def test_store_reloads_from_binary_snapshot(tmp_path):
+    filename = os.path.join(tmp_path, 'task.bin')
+    tasks = TaskManager(filename)
+    for i in range(5):
+        tasks.add_task(f"t{i}", "", "Средний", due_date='01-02-2025' if i % 2 else None)
+    tasks.delete_task(5)
+    tasks.edit_task(2, new_title="изменена")
+    tasks.save_tasks()
+    tasks.storage.close()
+    assert binary.is_binary(filename)
+
+    loaded = TaskManager(filename)
+    assert [(task.task_id, task.task_title) for task in loaded.tasks] == \
+        [(1, "t0"), (2, "изменена"), (3, "t2"), (4, "t3")]
+    assert loaded.tasks.get(2).due_date is not None
+    assert loaded.tasks.next_id == 6
+    # записи, прочитанные лениво и сразу целиком, совпадают
+    lazy = [record.to_dict() for record in loaded.storage.load(lazy=True)]
+    assert lazy == loaded.storage.load() == [task.to_dict() for task in loaded.tasks]
+    loaded.storage.close()
+
+
+def test_compaction_unmaps_lazy_snapshot_before_replacing_it(tmp_path, monkeypatch):
+    filename = os.path.join(tmp_path, 'task.bin')
+    tasks = TaskManager(filename)
+    for i in range(6):
+        tasks.add_task(f"t{i}", "", "Средний")
+    tasks.save_tasks()
+    tasks.storage.close()
+
+    tasks = TaskManager(filename)
+    mapped = tasks.storage._binary_snapshot
+    replace = os.replace
+
+    def checked_replace(source, target):
+        # как на Windows: отображенный в память файл заменить нельзя
+        if target == filename:
+            assert mapped.mmap.closed
+        replace(source, target)
+
+    monkeypatch.setattr(os, 'replace', checked_replace)
+    tasks.delete_task(1)
+    tasks.edit_task(2, new_title="изменена")
+    tasks.save_tasks()
+    assert not mapped.mmap.closed
+    # записи, которые еще не разбирались, читаются из нового файла по ключу
+    assert [task.task_title for task in tasks.tasks] == ["изменена", "t2", "t3", "t4", "t5"]
+    tasks.storage.close()
+    assert mapped.mmap.closed
@@ -0,0 +1,32 @@
+import io
+import json
+import os
+
+import cli
+from task.task_manager import TaskManager
+
+
+def test_batch_writes_in_chunks_next_to_another_writer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('task')
+    monkeypatch.setattr(cli, 'CHUNK_SIZE', 2)
+    seen = []
+
+    def lines():
+        for i in range(5):
+            if i == 3:
+                # другой писатель посреди пакета: видит записанную пачку и
+                # не получает ID, уже выданные пакету
+                other = TaskManager(os.path.join('task', 'task.json'))
+                seen.extend(task.task_title for task in other.tasks)
+                other.add_task("снаружи", "", "Средний")
+                other.storage.close()
+            yield json.dumps({'module': 'tasks', 'op': 'add', 'title': f"из пакета {i}"})
+
+    out = io.StringIO()
+    assert cli.run_batch(lines(), out) == (5, 0)
+    assert seen == ["из пакета 0", "из пакета 1"]
+
+    titles = {task.task_id: task.task_title for task in TaskManager(os.path.join('task', 'task.json')).tasks}
+    assert len(titles) == 6
+    assert sorted(titles.values()) == sorted(["снаружи"] + [f"из пакета {i}" for i in range(5)])
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+
+import pytest
+
+from task.task_manager import TaskManager
+
+
+def _deferred_writer(filename, reserved, written):
+    manager = TaskManager(filename)
+    with manager.storage.deferred():
+        for i in range(3):
+            manager.add_task(f"отложенная {i}", "", "Средний")
+        reserved.set()
+        # пока записи не на диске, другой процесс добавляет свои
+        written.wait(10)
+    manager.storage.close()
+
+
+def _write_behind_writer(filename, reserved, written):
+    manager = TaskManager(filename)
+    # интервал больше времени теста: до flush() ничего не пишется на диск
+    manager.start_write_behind(interval=60)
+    for i in range(3):
+        manager.add_task(f"отложенная {i}", "", "Средний")
+    assert manager.storage._write_behind.pending
+    reserved.set()
+    written.wait(10)
+    manager.flush()
+    manager.storage.close()
+
+
+def _direct_writer(filename, reserved, written):
+    reserved.wait(10)
+    manager = TaskManager(filename)
+    manager.add_task("прямая", "", "Средний")
+    manager.storage.close()
+    written.set()
+
+
+@pytest.mark.parametrize('writer', [_deferred_writer, _write_behind_writer])
+@pytest.mark.parametrize('name', ['task.json', 'task.db'])
+def test_queued_and_direct_writers_get_distinct_ids(tmp_path, name, writer):
+    filename = os.path.join(tmp_path, name)
+    TaskManager(filename).storage.close()
+    context = multiprocessing.get_context('spawn')
+    reserved, written = context.Event(), context.Event()
+    processes = [context.Process(target=target, args=(filename, reserved, written))
+                 for target in (writer, _direct_writer)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    titles = {task.task_id: task.task_title for task in TaskManager(filename).tasks}
+    assert sorted(titles.values()) == ["отложенная 0", "отложенная 1", "отложенная 2", "прямая"]
+    assert titles[4] == "прямая"
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from contacts.contact import ContactManager
+from storage.locking import ConflictError, check_conflicts
+
+
+def test_check_conflicts_merges_different_fields():
+    seen = {'name': 'a', 'phone': '1'}
+    # другой процесс поменял телефон, мы - имя: правки сливаются
+    check_conflicts(seen, {'name': 'a', 'phone': '2'}, {'name': 'b'})
+    # то же значение, что поставил другой процесс, - не конфликт
+    check_conflicts(seen, {'name': 'b', 'phone': '1'}, {'name': 'b'})
+    with pytest.raises(ConflictError, match='name'):
+        check_conflicts(seen, {'name': 'c', 'phone': '1'}, {'name': 'b'})
+
+
+def test_edits_from_two_processes_are_merged(tmp_path):
+    filename = os.path.join(tmp_path, 'contacts.json')
+    first = ContactManager(filename)
+    first.add_contact("Анна", "111")
+    second = ContactManager(filename)
+    assert second.contacts.get(1).phone == "111"
+
+    first.edit_contact(1, phone="222")
+    # second еще не видел новый телефон, но меняет другое поле
+    second.edit_contact(1, email="anna@example.com")
+    contact = second.contacts.get(1)
+    assert (contact.phone, contact.email) == ("222", "anna@example.com")
+
+    first.edit_contact(1, name="Анна Иванова")
+    with pytest.raises(ConflictError):
+        second.edit_contact(1, name="Анна Петрова")
+    assert ContactManager(filename).contacts.get(1).name == "Анна Иванова"
@@ -0,0 +1,37 @@
+import os
+
+from contacts.contact import ContactManager
+
+
+def _ids(contacts):
+    return [contact.contact_id for contact in contacts]
+
+
+def test_trigram_search_by_name_and_phone(tmp_path):
+    contacts = ContactManager(os.path.join(tmp_path, 'contacts.json'))
+    contacts.add_contact("Пётр Иванов", "+7 (912) 345-67-89")
+    contacts.add_contact("Иван Петров", "8 912 000 11 22")
+    contacts.add_contact("Анна Иванова", None, "anna@example.com")
+
+    # точное совпадение выше похожего имени, начало имени выше начала слова
+    assert _ids(contacts.search_contact("иван петров")) == [2, 1]
+    assert _ids(contacts.search_contact("петр")) == [1, 2]
+    assert _ids(contacts.search_contact("иванов", limit=1)) == [1]
+    # опечатка находится по похожести триграмм
+    assert _ids(contacts.search_contact("Анна Иванва")) == [3]
+    # телефон ищется по цифрам в любом формате
+    assert _ids(contacts.search_contact("912-345")) == [1]
+    assert _ids(contacts.search_contact("912")) == [1, 2]
+
+
+def test_search_index_follows_edits_and_deletes(tmp_path):
+    contacts = ContactManager(os.path.join(tmp_path, 'contacts.json'))
+    contacts.add_contact("Пётр Иванов", "111")
+    contacts.add_contact("Анна Смирнова", "222")
+    assert _ids(contacts.search_contact("смирн")) == [2]
+    contacts.edit_contact(2, name="Анна Кузнецова")
+    assert _ids(contacts.search_contact("смирн")) == []
+    assert _ids(contacts.search_contact("кузн")) == [2]
+    contacts.delete_contact(1)
+    assert _ids(contacts.search_contact("111")) == []
+    contacts.flush()
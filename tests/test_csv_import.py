@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from storage import csvio
+from task.task_manager import TaskManager
+
+
+def _write(filename, rows, encoding='utf-8'):
+    with open(filename, 'w', encoding=encoding, newline='') as f:
+        f.write('ID,Title,Description,Priority,Status,Due Date\r\n')
+        for row in rows:
+            f.write(row + '\r\n')
+
+
+def test_import_with_bad_row_adds_nothing(tmp_path):
+    filename = os.path.join(tmp_path, 'task.json')
+    csv_filename = os.path.join(tmp_path, 'tasks.csv')
+    tasks = TaskManager(filename)
+    tasks.add_task("была", "", "Средний")
+    _write(csv_filename, ['1,a,,Высокий,False,', '2,b,,Средний,True,', '3,c,,Срочный,False,'])
+
+    with pytest.raises(ValueError, match="строке 4"):
+        tasks.import_from_csv(csv_filename)
+    assert [task.task_title for task in tasks.tasks] == ["была"]
+    tasks.flush()
+    assert [task.task_title for task in TaskManager(filename).tasks] == ["была"]
+
+
+def test_import_adds_all_rows(tmp_path):
+    filename = os.path.join(tmp_path, 'task.json')
+    csv_filename = os.path.join(tmp_path, 'tasks.csv')
+    _write(csv_filename, ['1,a,,Высокий,False,', '2,b,,Средний,True,01-02-2025'])
+    tasks = TaskManager(filename)
+    assert tasks.import_from_csv(csv_filename)[0] == 2
+    tasks.flush()
+    loaded = list(TaskManager(filename).tasks)
+    assert [(task.task_title, task.done) for task in loaded] == [("a", False), ("b", True)]
+    assert loaded[1].due_date is not None
+
+
+def test_import_and_export_in_given_encoding(tmp_path):
+    filename = os.path.join(tmp_path, 'task.json')
+    csv_filename = os.path.join(tmp_path, 'tasks.csv')
+    _write(csv_filename, ['1,Отчет,Квартальный,Высокий,False,'], encoding='cp1251')
+    tasks = TaskManager(filename)
+    assert tasks.import_from_csv(csv_filename, encoding='cp1251')[0] == 1
+    assert [task.task_title for task in tasks.tasks] == ["Отчет"]
+
+    tasks.export_to_csv(csv_filename, encoding='cp1251')
+    with open(csv_filename, 'r', encoding='cp1251') as f:
+        assert 'Отчет,Квартальный,Высокий' in f.read()
+
+
+def test_parallel_chunks_keep_quoted_newlines(tmp_path):
+    csv_filename = os.path.join(tmp_path, 'tasks.csv')
+    rows = []
+    for i in range(25):
+        # многострочное описание и удвоенные кавычки внутри поля
+        description = f'"строка {i}\r\nпродолжение ""{i}"" в кавычках"' if i % 3 else f'описание {i}'
+        rows.append(f'{i},t{i},{description},Средний,False,')
+    _write(csv_filename, rows)
+
+    header, *chunks = csvio._read_chunks(csv_filename, batch_size=4)
+    assert header == ['ID', 'Title', 'Description', 'Priority', 'Status', 'Due Date']
+    assert [count for count, _ in chunks] == [4, 4, 4, 4, 4, 4, 1]
+
+    results = []
+    for workers in (None, 2):
+        tasks = TaskManager(os.path.join(tmp_path, f'task{workers}.json'))
+        assert tasks.import_from_csv(csv_filename, workers=workers)[0] == 25
+        results.append([(task.task_title, task.description) for task in tasks.tasks])
+        tasks.flush()
+    assert results[0] == results[1]
+    assert results[1][1] == ("t1", 'строка 1\r\nпродолжение "1" в кавычках')
+
+
+def test_parallel_import_reports_line_of_bad_row(tmp_path):
+    csv_filename = os.path.join(tmp_path, 'tasks.csv')
+    _write(csv_filename, [f'{i},t{i},"a\nb",{"Средний" if i != 7 else "?"},False,' for i in range(10)])
+    tasks = TaskManager(os.path.join(tmp_path, 'task.json'))
+    with pytest.raises(ValueError, match="строке 9"):
+        csvio.import_rows(csv_filename, TaskManager._task_from_row, tasks._add_many, batch_size=3, workers=2)
+    assert len(tasks.tasks) == 0
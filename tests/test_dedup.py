@@ -0,0 +1,40 @@
+import os
+
+from contacts.contact import ContactManager
+
+
+def _groups(contacts, fuzzy=True):
+    return [[contact.contact_id for contact in group] for group in contacts.find_duplicates(fuzzy)]
+
+
+def test_duplicate_groups(tmp_path):
+    contacts = ContactManager(os.path.join(tmp_path, 'contacts.json'))
+    contacts.add_contact("Иван Петров", "+7 (912) 345-67-89")
+    contacts.add_contact("Петров Иван", "8 912 345 67 89")          # тот же телефон, имя переставлено
+    contacts.add_contact("Иван", None, "ivan@example.com")
+    contacts.add_contact("И. Петров", None, "IVAN@example.com")      # та же почта
+    contacts.add_contact("Анна Гвоздева")
+    contacts.add_contact("Анна Квоздева")                            # звучит так же
+    contacts.add_contact("Анна Смирнова", "111-11")
+    contacts.add_contact("Анна Смирнова", "222-22")                  # тезки с разными телефонами
+    contacts.add_contact("Ольга", "+7 912 345-67-89")                # телефон совпал, имя другое
+
+    assert _groups(contacts) == [[1, 2], [3, 4], [5, 6]]
+    assert _groups(contacts, fuzzy=False) == [[1, 2], [3, 4]]
+
+
+def test_dedupe_merges_into_oldest_contact(tmp_path):
+    filename = os.path.join(tmp_path, 'contacts.json')
+    contacts = ContactManager(filename)
+    contacts.add_contact("Иван", "+7 912 345-67-89")
+    contacts.add_contact("Иван Петров", "8 912 345 67 89", "ivan@example.com")
+    contacts.add_contact("Анна")
+    assert contacts.dedupe() == 1
+    contacts.flush()
+
+    merged = {contact.contact_id: contact.to_dict() for contact in ContactManager(filename).contacts}
+    assert merged == {
+        1: {'contact_id': 1, 'name': "Иван Петров", 'phone': "+7 912 345-67-89", 'email': "ivan@example.com"},
+        3: {'contact_id': 3, 'name': "Анна", 'phone': None, 'email': None},
+    }
+    assert _groups(contacts) == []
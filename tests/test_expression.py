@@ -0,0 +1,12 @@
+import pytest
+
+from calculate.expression import evaluate
+
+
+def test_power_rejects_huge_results_before_computing():
+    with pytest.raises(ValueError):
+        evaluate("((10**1000)**1000)**10")
+    with pytest.raises(ValueError):
+        evaluate("(10**1000)**y", {'y': [1, 200]})
+    assert evaluate("x**2", {'x': [1, 2, 3]}) == [1, 4, 9]
+    assert evaluate("2**10") == 1024
@@ -0,0 +1,14 @@
+import os
+
+from finance.finance_manager import FinanceManager
+
+
+def test_calculations_fold_category_case_like_the_category_index(tmp_path):
+    finance = FinanceManager(os.path.join(tmp_path, 'finance.json'))
+    finance.add_record(-40, "Food", "01-01-2025", "")
+    finance.add_record(-30, "food", "02-01-2025", "")
+    finance.add_record(-5, "Кафе", "02-01-2025", "")
+    assert finance.evaluate("sum(amount)", category="food") == -70
+    assert finance.evaluate("sum(amount)", category=" FOOD ") == -70
+    assert len(list(finance.categories.record_ids("food"))) == 2
+    finance.flush()
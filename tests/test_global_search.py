@@ -0,0 +1,23 @@
+import os
+
+from task.task_manager import TaskManager
+from notes.note import NoteManager
+from search.global_search import GlobalSearch
+from personal_assistant import SECTIONS
+
+
+def test_search_finds_and_describes_task(tmp_path):
+    tasks = TaskManager(os.path.join(tmp_path, 'task.json'))
+    notes = NoteManager(os.path.join(tmp_path, 'notes.json'))
+    tasks.add_task("Купить молоко", "в магазине у дома", "Средний")
+    notes.add_note("Рецепт", "молоко, мука, яйца")
+    search = GlobalSearch({'tasks': tasks, 'notes': notes})
+    try:
+        results = search.search("молоко")
+        assert {domain for domain, _, _ in results} == {'tasks', 'notes'}
+        lines = [SECTIONS[domain][1](search.record(domain, record_id)) for domain, record_id, _ in results]
+        assert "Купить молоко" in lines
+    finally:
+        search.close()
+        tasks.flush()
+        notes.flush()
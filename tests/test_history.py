@@ -0,0 +1,115 @@
+import os
+
+import storage.history
+from task.task_manager import TaskManager
+from finance.finance_manager import FinanceManager
+from storage.migrate import migrate
+
+
+def test_undo_redo_across_managers(tmp_path):
+    filename = os.path.join(tmp_path, 'task.json')
+    tasks = TaskManager(filename)
+    tasks.add_task("a", "", "Средний")
+    tasks.edit_task(1, new_title="b")
+    tasks.delete_task(1)
+    tasks.flush()
+
+    tasks = TaskManager(filename)
+    assert tasks.undo() == 1
+    assert tasks.tasks.get(1).task_title == "b"
+    assert tasks.undo() == 1
+    assert tasks.tasks.get(1).task_title == "a"
+    assert tasks.redo() == 1
+    assert tasks.tasks.get(1).task_title == "b"
+    tasks.flush()
+    assert TaskManager(filename).tasks.get(1).task_title == "b"
+
+
+def test_as_of_replays_from_checkpoints(tmp_path, monkeypatch):
+    clock = [1000000]
+    monkeypatch.setattr(storage.history, 'CHECKPOINT_EVERY', 7)
+    monkeypatch.setattr(storage.history, 'now_seconds', lambda: clock[0])
+    tasks = TaskManager(os.path.join(tmp_path, 'task.json'))
+    for i in range(20):
+        clock[0] += 10
+        tasks.add_task(f"t{i}", "", "Средний")
+    tasks.flush()
+    assert len(os.listdir(tasks.storage.history.directory)) > 4
+    assert [task.task_title for task in tasks.as_of(1000105)][-1] == "t9"
+    assert len(tasks.as_of(1000205)) == 20
+
+
+def test_history_is_kept_per_store_file_and_after_migrate(tmp_path):
+    source = os.path.join(tmp_path, 'task.json')
+    target = os.path.join(tmp_path, 'task.db')
+    tasks = TaskManager(source)
+    tasks.add_task("a", "", "Средний")
+    tasks.edit_task(1, new_title="b")
+    tasks.flush()
+    tasks.storage.close()
+    migrate('tasks', source, target)
+
+    tasks = TaskManager(target)
+    assert tasks.storage.history.directory == target + '.history'
+    assert tasks.undo() == 1
+    assert tasks.tasks.get(1).task_title == "a"
+    tasks.storage.close()
+    assert TaskManager(source).tasks.get(1).task_title == "b"
+
+
+def test_undone_delete_returns_to_its_place(tmp_path):
+    filename = os.path.join(tmp_path, 'task.json')
+    tasks = TaskManager(filename)
+    for i in range(1, 6):
+        tasks.add_task(f"t{i}", "", "Средний")
+    tasks.delete_task(2)
+    tasks.undo()
+    assert [task.task_id for task in tasks.tasks] == [1, 2, 3, 4, 5]
+    items, cursor = tasks.list_tasks(limit=2)
+    items += tasks.list_tasks(limit=2, cursor=cursor)[0]
+    assert [task.task_id for task in items] == [1, 2, 3, 4]
+    tasks.flush()
+    assert [task.task_id for task in TaskManager(filename).tasks] == [1, 2, 3, 4, 5]
+
+
+def test_undone_delete_keeps_category_pages_in_order(tmp_path):
+    finance = FinanceManager(os.path.join(tmp_path, 'finance.json'))
+    for day in range(1, 6):
+        finance.add_record(-10, "Еда", f"0{day}-01-2025", "")
+    finance.categories
+    # в финансах записи удаляет только синхронизация
+    entries = [('delete', 2, None)]
+    finance.storage.append_many(entries, [finance.records.get(2).to_dict()])
+    finance._apply_changes(entries)
+    assert list(finance.categories.record_ids("еда")) == [1, 3, 4, 5]
+    finance.undo()
+    assert list(finance.categories.record_ids("еда")) == [1, 2, 3, 4, 5]
+    finance.flush()
+
+
+def test_old_checkpoints_are_pruned(tmp_path, monkeypatch):
+    clock = [1000000]
+    monkeypatch.setattr(storage.history, 'CHECKPOINT_EVERY', 5)
+    monkeypatch.setattr(storage.history, 'KEEP_CHECKPOINTS', 3)
+    monkeypatch.setattr(storage.history, 'now_seconds', lambda: clock[0])
+    tasks = TaskManager(os.path.join(tmp_path, 'task.json'))
+    for i in range(40):
+        clock[0] += 10
+        tasks.add_task(f"t{i}", "", "Средний")
+    tasks.flush()
+
+    directory = tasks.storage.history.directory
+    names = sorted(os.listdir(directory))
+    assert len([name for name in names if name.endswith('.checkpoint.json')]) == 3
+    assert len([name for name in names if name.endswith('.jsonl') and name[:-6].isdigit()]) == 3
+    with open(os.path.join(directory, 'checkpoints.jsonl')) as f:
+        assert len(f.readlines()) == 3
+    assert len(tasks.as_of(clock[0])) == 40
+    try:
+        tasks.as_of(1000015)
+    except ValueError:
+        pass
+    else:
+        assert False, "удаленная часть истории восстановилась"
+    assert tasks.undo() == 1
+    assert 40 not in tasks.tasks
@@ -0,0 +1,68 @@
+import os
+
+from storage.journal import Journal
+
+
+class _Records(dict):
+    # записи в памяти, как их ведет менеджер, и снимок из них для Journal
+    next_id = 1
+
+    def add(self, journal, title):
+        record_id = self.next_id
+        self.next_id += 1
+        self[record_id] = {'id': record_id, 'title': title}
+        journal.append('add', record_id, self[record_id])
+
+    def snapshot(self):
+        return {'next_id': self.next_id, 'records': [dict(data) for data in self.values()]}
+
+
+def _load(filename):
+    journal = Journal(filename, 'id', None)
+    records = {data['id']: data for data in journal.load()}
+    journal.close()
+    return records, journal.next_id
+
+
+def test_log_is_replayed_over_snapshot(tmp_path):
+    filename = os.path.join(tmp_path, 'data.json')
+    records = _Records()
+    journal = Journal(filename, 'id', records.snapshot)
+    journal.load()
+    records.add(journal, 'a')
+    records.add(journal, 'b')
+    journal.append('edit', 1, {'title': 'c'})
+    journal.append('delete', 2)
+    journal.close()
+    # недописанная строка после аварийного завершения пропускается
+    with open(filename + '.log', 'a') as f:
+        f.write('{"op": "add", "id": 3, "da')
+
+    loaded, next_id = _load(filename)
+    assert loaded == {1: {'id': 1, 'title': 'c'}}
+    assert next_id == 3
+
+
+def test_compaction_rewrites_snapshot_and_starts_new_log(tmp_path):
+    filename = os.path.join(tmp_path, 'data.json')
+    records = _Records()
+    journal = Journal(filename, 'id', records.snapshot, compact_every=3)
+    journal.load()
+    for title in 'abcd':
+        records.add(journal, title)
+    journal.wait()
+    # сжатие прошло после третьей операции: в журнале только четвертая
+    assert journal.pending == 1
+    assert not os.path.exists(filename + '.log.old')
+    assert len(_load(filename)[0]) == 4
+
+    del records[4]
+    journal.append('delete', 4)
+    journal.save()
+    journal.close()
+    assert not os.path.exists(filename + '.log') or os.path.getsize(filename + '.log') == 0
+
+    loaded, next_id = _load(filename)
+    assert loaded == records
+    # ID удаленной записи не выдается повторно
+    assert next_id == 5
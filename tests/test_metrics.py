@@ -0,0 +1,12 @@
+from storage import metrics
+
+
+def test_signal_dump_does_not_wait_for_held_lock(capsys):
+    metrics.record('test.op', 0.001)
+    # сигнал пришел, пока главный поток держит блокировку метрик
+    with metrics._lock:
+        thread = metrics._dump_in_background()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert 'test.op' in capsys.readouterr().err
+    metrics.reset()
@@ -0,0 +1,54 @@
+import os
+
+from notes import search
+from notes.note import NoteManager
+
+
+def test_index_catches_up_with_edits_made_without_it(tmp_path):
+    filename = os.path.join(tmp_path, 'notes.json')
+    notes = NoteManager(filename)
+    notes.add_note("fruit", "apple pie")
+    assert [note_id for note_id, _ in notes.search_index.search("apple")] == [1]
+    notes.flush()
+
+    # этот менеджер не строит индекс, его файл остается прежним
+    notes = NoteManager(filename)
+    notes.edit_note(1, new_content="banana bread")
+    notes.flush()
+
+    notes = NoteManager(filename)
+    assert [note_id for note_id, _ in notes.search_index.search("banana")] == [1]
+    assert notes.search_index.search("apple") == []
+    notes.flush()
+
+
+def test_inflected_queries_find_notes(tmp_path):
+    notes = NoteManager(os.path.join(tmp_path, 'notes.json'))
+    notes.add_note("Встречи с клиентами", "Договорились встречаться по пятницам")
+    notes.add_note("Ремонт", "Купить новую краску для большого окна")
+    notes.add_note("Отпуск", "Красивейшие места и старые города")
+
+    def found(query):
+        return [note_id for note_id, _ in notes.search_index.search(query)]
+
+    for query in ("встреча", "клиентам", "клиентов", "пятница", "встречаемся", "встречались"):
+        assert found(query)[:1] == [1], query
+    for query in ("новой краской", "большому окну", "большим окнами", "покупать краски"):
+        assert found(query)[:1] == [2], query
+    for query in ("красивое место", "старого города", "городами"):
+        assert found(query)[:1] == [3], query
+    notes.flush()
+
+
+def test_index_built_by_older_tokenizer_is_rebuilt(tmp_path, monkeypatch):
+    filename = os.path.join(tmp_path, 'notes.json')
+    notes = NoteManager(filename)
+    notes.add_note("Встречи", "встречаться")
+    notes.search_index
+    notes.flush()
+    documents = notes.search_index.documents
+
+    monkeypatch.setattr(search, 'INDEX_VERSION', search.INDEX_VERSION + 1)
+    notes = NoteManager(filename)
+    assert notes.search_index.documents[1]['digest'] != documents[1]['digest']
+    notes.flush()
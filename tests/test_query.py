@@ -0,0 +1,35 @@
+import os
+
+from task.task_manager import TaskManager, TASK_ORDERS
+
+
+def test_tasks_ordered_by_due_date_without_due_last(tmp_path):
+    tasks = TaskManager(os.path.join(tmp_path, 'task.json'))
+    tasks.add_task("a", "", "Средний", due_date='05-01-2025 10:00')
+    tasks.add_task("b", "", "Средний")
+    tasks.add_task("c", "", "Средний", due_date='01-01-2025')
+    items, cursor = tasks.list_tasks(limit=2, order='due')
+    assert [task.task_title for task in items] == ["c", "a"]
+    items, cursor = tasks.list_tasks(limit=2, order='due', cursor=cursor)
+    assert [task.task_title for task in items] == ["b"] and cursor is None
+    tasks.flush()
+
+
+def test_ordered_pages_reuse_sorted_keys_until_store_changes(tmp_path):
+    tasks = TaskManager(os.path.join(tmp_path, 'task.json'))
+    for title in "дебвга":
+        tasks.add_task(title, "", "Средний")
+    items, cursor = tasks.list_tasks(limit=2, order='title')
+    assert [task.task_title for task in items] == ["а", "б"]
+    keys = tasks.tasks.orders[TASK_ORDERS['title']][1]
+    items, cursor = tasks.list_tasks(limit=2, order='title', cursor=cursor)
+    assert [task.task_title for task in items] == ["в", "г"]
+    assert tasks.tasks.orders[TASK_ORDERS['title']][1] is keys
+
+    # переименованная задача переезжает на свое новое место
+    tasks.edit_task(6, new_title="ё")
+    items, cursor = tasks.list_tasks(limit=2, order='title', cursor=cursor)
+    assert [task.task_title for task in items] == ["д", "е"]
+    items, cursor = tasks.list_tasks(limit=2, order='title', cursor=cursor)
+    assert [task.task_title for task in items] == ["ё"] and cursor is None
+    tasks.flush()
@@ -0,0 +1,48 @@
+import os
+
+import task.schedule
+from storage.timestamps import parse_seconds
+from task.schedule import _SortedList
+from task.task_manager import TaskManager
+
+
+def _titles(tasks):
+    return [task.task_title for task in tasks]
+
+
+def test_due_and_priority_ranges(tmp_path):
+    tasks = TaskManager(os.path.join(tmp_path, 'task.json'))
+    tasks.add_task("вчера", "", "Низкий", due_date='09-03-2025 12:00')
+    tasks.add_task("без срока", "", "Высокий")
+    tasks.add_task("завтра", "", "Средний", due_date='11-03-2025 09:00')
+    tasks.add_task("позавчера", "", "Средний", due_date='08-03-2025 09:00')
+    tasks.add_task("через неделю", "", "Высокий", due_date='17-03-2025')
+    tasks.add_task("сделана", "", "Высокий", True, due_date='12-03-2025')
+    now = parse_seconds('10-03-2025 12:00')
+
+    assert _titles(tasks.upcoming_tasks(10, now)) == ["завтра", "через неделю"]
+    assert _titles(tasks.upcoming_tasks(1, now)) == ["завтра"]
+    assert _titles(tasks.overdue_tasks(now=now)) == ["позавчера", "вчера"]
+    assert _titles(tasks.overdue_tasks(1, now)) == ["позавчера"]
+    # приоритет, затем срок; задачи без срока - последними в своем приоритете
+    assert _titles(tasks.top_priority_tasks(3)) == ["через неделю", "без срока", "позавчера"]
+
+    tasks.set_done(3)
+    tasks.edit_task(1, new_due_date='12-03-2025 10:00')
+    assert _titles(tasks.upcoming_tasks(10, now)) == ["вчера", "через неделю"]
+    tasks.delete_task(5)
+    assert _titles(tasks.upcoming_tasks(10, now)) == ["вчера"]
+    tasks.flush()
+
+
+def test_sorted_list_keeps_order_across_blocks(monkeypatch):
+    monkeypatch.setattr(task.schedule, 'LOAD', 2)
+    items = _SortedList([5, 1, 9])
+    for item in [7, 3, 8, 2, 6, 4, 0]:
+        items.add(item)
+    assert list(items.irange()) == list(range(10))
+    assert list(items.irange(6)) == [6, 7, 8, 9]
+    for item in [0, 5, 9, 6]:
+        items.remove(item)
+    assert list(items.irange(4)) == [4, 7, 8]
+    assert len(items) == 6
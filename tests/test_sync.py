@@ -0,0 +1,45 @@
+import os
+import shutil
+
+from task.task_manager import TaskManager
+from storage.sync import sync
+
+
+def _tasks(directory):
+    manager = TaskManager(os.path.join(directory, 'task', 'task.json'))
+    return manager, {task.task_id: task.task_title for task in manager.tasks}
+
+
+def test_first_sync_of_copied_directories(tmp_path):
+    left, right = os.path.join(tmp_path, 'a'), os.path.join(tmp_path, 'b')
+    os.makedirs(os.path.join(left, 'task'))
+    manager, _ = _tasks(left)
+    for i in range(1, 6):
+        manager.add_task(f"задача {i}", "", "Средний")
+    manager.flush()
+    shutil.copytree(left, right)
+
+    manager, _ = _tasks(left)
+    manager.edit_task(2, new_title="изменена")
+    manager.add_task("новая", "", "Средний")
+    manager.flush()
+    manager, _ = _tasks(right)
+    manager.delete_task(4)
+    manager.flush()
+
+    result = sync(left, right, ['tasks'])['tasks']
+    assert result['renumbered'] == []
+    assert result['conflicts'] == [2]
+    _, left_tasks = _tasks(left)
+    _, right_tasks = _tasks(right)
+    assert left_tasks == right_tasks
+    assert sorted(left_tasks) == [1, 2, 3, 5, 6]
+    assert left_tasks[6] == "новая"
+
+    # после первой синхронизации изменения переносятся без конфликтов
+    manager, _ = _tasks(left)
+    manager.edit_task(1, new_title="снова изменена")
+    manager.flush()
+    result = sync(left, right, ['tasks'])['tasks']
+    assert result['conflicts'] == [] and result['to_right'] == 1
+    assert _tasks(right)[1][1] == "снова изменена"